@@ -0,0 +1,171 @@
+import time
+from typing import Dict, Optional
+from app.config import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Take an in-flight slot for ARGV[4] unless the installation already has
+# ARGV[3] reviews running. Slots older than ARGV[2] are dropped first so a
+# review whose worker died cannot hold one forever. Returns 1 if admitted.
+ADMIT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local stale_before = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', stale_before)
+if limit > 0 and redis.call('ZCARD', KEYS[1]) >= limit then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 1
+"""
+
+# Delete the dedupe key KEYS[1] only while it still points at review ARGV[1],
+# so a newer admission for the same head keeps its own
+FORGET_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class AdmissionRejected(Exception):
+    """Raised when a review request is turned away to shed load."""
+    
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Decides at the API whether a review request is queued.
+    
+    Requests are refused while the broker queue is deeper than
+    max_queue_depth or the installation already has
+    max_in_flight reviews between admission and posting; a limit of 0
+    disables that check. A repeat of an admitted request for the same PR
+    head is answered with the original task instead of queueing another.
+    """
+    
+    prefix = "admission"
+    
+    def __init__(
+        self,
+        redis_client,
+        broker_client=None,
+        max_queue_depth: int = 0,
+        max_in_flight: int = 0,
+        in_flight_ttl: int = 3600,
+        dedupe_ttl: int = 3600,
+        retry_after: int = 30
+    ):
+        self.redis = redis_client
+        self.broker = broker_client or redis_client
+        self.max_queue_depth = max_queue_depth
+        self.max_in_flight = max_in_flight
+        self.in_flight_ttl = in_flight_ttl
+        self.dedupe_ttl = dedupe_ttl
+        self.retry_after = retry_after
+        self._admit = redis_client.register_script(ADMIT_SCRIPT)
+        self._forget = redis_client.register_script(FORGET_SCRIPT)
+    
+    def _in_flight_key(self, installation_id: int) -> str:
+        return f"{self.prefix}:inflight:{installation_id}"
+    
+    def _dedupe_key(self, repository: str, pr_number: int, head_sha: str) -> str:
+        return f"{self.prefix}:dedupe:{repository}#{pr_number}@{head_sha}"
+    
+    def queue_depth(self, queue: str) -> int:
+        """Messages waiting in a Celery queue, across its Redis priority lists."""
+        from app.celery_app import celery_app
+        
+        sep = celery_app.conf.broker_transport_options.get("sep", ":")
+        steps = celery_app.conf.broker_transport_options.get("priority_steps", [0])
+        pipe = self.broker.pipeline()
+        for step in steps:
+            pipe.llen(queue if step == 0 else f"{queue}{sep}{step}")
+        return sum(pipe.execute())
+    
+    def duplicate_of(self, pr_data: Dict) -> Optional[str]:
+        """Task id of an admitted request for the same PR head, if any."""
+        if not pr_data.get('head_sha'):
+            return None
+        task_id = self.redis.get(self._dedupe_key(pr_data['repository'], pr_data['pr_number'], pr_data['head_sha']))
+        return task_id.decode() if task_id else None
+    
+    def admit(self, pr_data: Dict, queue: str):
+        """
+        Admit a review or raise AdmissionRejected.
+        
+        pr_data must carry review_id (the task id it will be queued with).
+        On success pr_data is tagged with its admission time.
+        """
+        if self.max_queue_depth:
+            depth = self.queue_depth(queue)
+            if depth >= self.max_queue_depth:
+                raise AdmissionRejected(f"Queue {queue} is full ({depth} waiting)", self.retry_after)
+        
+        now = time.time()
+        admitted = self._admit(
+            keys=[self._in_flight_key(pr_data['installation_id'])],
+            args=[now, now - self.in_flight_ttl, self.max_in_flight, pr_data['review_id'], self.in_flight_ttl]
+        )
+        if not admitted:
+            raise AdmissionRejected(
+                f"Installation {pr_data['installation_id']} has {self.max_in_flight} reviews in flight",
+                self.retry_after
+            )
+        
+        self.remember(pr_data)
+        pr_data['enqueued_at'] = now
+    
+    def remember(self, pr_data: Dict):
+        """Answer repeats of the review's PR head with its review_id from now on."""
+        if pr_data.get('head_sha'):
+            key = self._dedupe_key(pr_data['repository'], pr_data['pr_number'], pr_data['head_sha'])
+            self.redis.set(key, pr_data['review_id'], ex=self.dedupe_ttl)
+    
+    def release(self, pr_data: Dict):
+        """Free the review's in-flight slot once it has finished."""
+        if pr_data.get('review_id'):
+            self.redis.zrem(self._in_flight_key(pr_data['installation_id']), pr_data['review_id'])
+    
+    def forget(self, pr_data: Dict):
+        """
+        Stop answering repeats of the review with its task id.
+        
+        For reviews that were never queued, superseded or failed, so the
+        next request for the same head is queued again.
+        """
+        if pr_data.get('review_id') and pr_data.get('head_sha'):
+            key = self._dedupe_key(pr_data['repository'], pr_data['pr_number'], pr_data['head_sha'])
+            self._forget(keys=[key], args=[pr_data['review_id']])
+    
+    def in_flight(self, installation_id: int) -> int:
+        key = self._in_flight_key(installation_id)
+        self.redis.zremrangebyscore(key, "-inf", time.time() - self.in_flight_ttl)
+        return self.redis.zcard(key)
+
+
+# Singleton instance
+_admission = None
+
+def get_admission_controller() -> AdmissionController:
+    global _admission
+    if _admission is None:
+        import redis
+        _admission = AdmissionController(
+            redis.Redis.from_url(settings.redis_url),
+            broker_client=redis.Redis.from_url(settings.celery_broker_url),
+            max_queue_depth=settings.admission_max_queue_depth,
+            max_in_flight=settings.admission_max_in_flight,
+            in_flight_ttl=settings.admission_in_flight_ttl,
+            dedupe_ttl=settings.admission_dedupe_ttl,
+            retry_after=settings.admission_retry_after
+        )
+    return _admission
@@ -1,4 +1,6 @@
-from celery import Celery
+from typing import Dict
+from celery import Celery, signals
+from kombu import Queue
 from app.config import get_settings
 
 settings = get_settings()
@@ -7,9 +9,59 @@ celery_app = Celery(
     "pr_review_bot",
     broker=settings.celery_broker_url,
     backend=settings.celery_result_backend,
-    include=["app.tasks"]
+    include=["app.tasks"],
+    task_cls="app.profiling:ProfiledTask"
 )
 
+# One queue per workload, in the order a worker consuming several drains them.
+# Priority is the Redis message priority (0 is highest); limits are in seconds.
+QUEUES = {
+    "interactive": {"priority": 0, "time_limit": 300, "soft_time_limit": 270},
+    "reviews": {"priority": 3, "time_limit": 600, "soft_time_limit": 540},
+    "bulk": {"priority": 9, "time_limit": 3600, "soft_time_limit": 3540},
+}
+
+TASK_QUEUES = {
+    "app.tasks.process_review_command": "interactive",
+    "app.tasks.process_pr_review": "reviews",
+    "app.tasks.review_pr_file": "reviews",
+    "app.tasks.finalize_pr_review": "reviews",
+    "app.tasks.store_review_history": "reviews",
+    "app.tasks.index_repository_code": "bulk",
+    "app.tasks.ingest_feedback_batch": "bulk",
+    "app.tasks.backfill_compact_vectors": "bulk",
+    "app.tasks.prune_orphan_code_chunks": "bulk",
+    "app.tasks.process_message_batches": "reviews",
+}
+
+
+def queue_task_options(queue: str) -> Dict:
+    """
+    apply_async options of a task sent to `queue` on behalf of a request.
+    
+    The queue's time limits travel with the message: they override the
+    per-task annotations, so a review task runs under the limits of the
+    queue its deadline is derived from.
+    """
+    limits = QUEUES[queue]
+    return {
+        "queue": queue,
+        "priority": limits["priority"],
+        "time_limit": limits["time_limit"],
+        "soft_time_limit": limits["soft_time_limit"]
+    }
+
+
+def max_countdown() -> int:
+    """
+    Longest countdown to give a task.
+    
+    The Redis broker redelivers messages not acknowledged within the
+    visibility timeout, and a task waiting out its countdown isn't.
+    """
+    return max(settings.celery_visibility_timeout - 60, 0)
+
+
 celery_app.conf.update(
     task_serializer="json",
     accept_content=["json"],
@@ -17,6 +69,62 @@ celery_app.conf.update(
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
+    # Results are small summaries; progress goes through review events
+    result_expires=settings.celery_result_expires,
     task_time_limit=600,  # 10 minutes
     task_soft_time_limit=540,  # 9 minutes
+    
+    # Routing
+    task_queues=[Queue(name, routing_key=name) for name in QUEUES],
+    task_default_queue="reviews",
+    task_routes={
+        task: {"queue": queue, "priority": QUEUES[queue]["priority"]}
+        for task, queue in TASK_QUEUES.items()
+    },
+    task_annotations={
+        task: {
+            "time_limit": QUEUES[queue]["time_limit"],
+            "soft_time_limit": QUEUES[queue]["soft_time_limit"]
+        }
+        for task, queue in TASK_QUEUES.items()
+    },
+    broker_transport_options={
+        "priority_steps": list(range(10)),
+        "sep": ":",
+        "queue_order_strategy": "priority",
+        "visibility_timeout": settings.celery_visibility_timeout,
+    },
+    task_default_priority=QUEUES["reviews"]["priority"],
+    
+    # Long tasks: don't let one worker hoard messages others could start
+    worker_prefetch_multiplier=1,
+    
+    # Periodic tasks (run `celery beat` once per deployment)
+    beat_schedule={
+        "process-message-batches": {
+            "task": "app.tasks.process_message_batches",
+            "schedule": settings.llm_batch_poll_interval,
+        },
+    },
 )
+
+
+# Metrics: stamp messages on publish (API and workers) and observe the
+# queue wait when a worker starts them
+@signals.before_task_publish.connect
+def _stamp_enqueue_time(headers=None, **kwargs):
+    from app.metrics import stamp_enqueue_time
+    if headers is not None:
+        stamp_enqueue_time(headers)
+
+
+@signals.task_prerun.connect
+def _observe_queue_wait(task=None, **kwargs):
+    from app.metrics import observe_queue_wait
+    observe_queue_wait(task)
+
+
+@signals.worker_init.connect
+def _start_metrics_exporter(**kwargs):
+    from app.metrics import start_worker_exporter
+    start_worker_exporter()
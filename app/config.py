@@ -7,8 +7,26 @@ class Settings(BaseSettings):
     github_app_id: str
     github_app_private_key_path: str
     
+    # GitHub client
+    github_token_refresh_margin: int = 300  # seconds before expiry to refresh
+    github_token_cache_redis: bool = False  # share tokens across workers
+    github_http_pool_size: int = 10
+    github_http_cache_enabled: bool = True  # conditional requests for GitHub reads
+    github_http_cache_backend: str = "disk"  # "disk" or "redis"
+    github_http_cache_dir: str = "/tmp/github-http-cache"
+    github_http_cache_max_bytes: int = 256 * 1024 * 1024
+    github_rate_limit_floor: int = 100  # requests always left for other work
+    github_review_request_budget: int = 30  # requests reserved per review
+    github_client_backend: str = "pygithub"  # "pygithub" or "httpx" (async, HTTP/2)
+    github_api_url: str = "https://api.github.com"
+    github_http2: bool = True
+    github_http_max_retries: int = 3
+    github_diff_mode: str = "files"  # "files" (paged files API) or "unified" (one diff request)
+    github_snapshot_api: str = "rest"  # "graphql" also fetches the bot's comments for dedupe
+    
     # LLM
     anthropic_api_key: str
+    anthropic_base_url: str | None = None  # e.g. a local stand-in for benchmarks
     llm_model: str = "claude-sonnet-4-20250514"
     
     # Database
@@ -20,18 +38,75 @@ class Settings(BaseSettings):
     redis_url: str
     celery_broker_url: str
     celery_result_backend: str
+    celery_result_expires: int = 86400  # seconds task results are kept
+    celery_visibility_timeout: int = 3600  # seconds before an unacknowledged message is redelivered
     
     # Application
     environment: str = "development"
     debug: bool = True
     api_secret_key: str
     
+    # Health Checks
+    health_probe_interval: float = 10  # seconds between background probe rounds
+    health_probe_timeout: float = 3
+    health_require_workers: bool = False  # report unhealthy when no Celery worker replies
+    
+    # Admission Control (0 disables a limit)
+    admission_max_queue_depth: int = 500  # waiting messages in the target queue
+    admission_max_in_flight: int = 20  # reviews per installation between admission and posting
+    admission_in_flight_ttl: int = 3600  # slots of reviews that never finish expire
+    admission_dedupe_ttl: int = 3600  # repeat requests for a PR head within this window are merged
+    admission_retry_after: int = 30
+    
+    # Metrics
+    metrics_worker_port: int = 9101  # Celery worker exporter; 0 disables it
+    metrics_max_repositories: int = 50  # per-repo series before "other"
+    
+    # Task Profiling
+    task_profile_rate: float = 0.0  # fraction of tasks profiled; 0 profiles only tasks that ask
+    task_profile_dir: str = "/tmp/task-profiles"
+    task_profile_interval: float = 0.005  # seconds between stack samples
+    
     # Review Configuration
     auto_review_enabled: bool = True
     review_command: str = "/review"
     max_files_to_review: int = 10
-    max_diff_size: int = 5000
+    max_diff_size: int = 5000  # larger patches are reviewed in hunk windows
+    max_windowed_diff_size: int = 200000  # larger patches are not reviewed
+    review_window_tokens: int = 1500  # diff tokens per window
+    review_window_context: int = 3  # lines repeated when a hunk is split
+    review_window_concurrency: int = 8  # windows of one file reviewed at once
+    triage_enabled: bool = True  # skip lockfiles, generated code etc. before the LLM
+    triage_rules_path: str = ".github/review-triage.yml"  # per-repo rules; empty disables
+    triage_max_low_priority_files: int = 2
+    review_deadline_reserve: int = 30  # seconds a review task keeps before its soft time limit
+    review_deadline_retries: int = 1  # re-runs of a review that timed out on every file
+    llm_request_timeout: float = 120  # longest single LLM call
+    context_timeout: float = 10  # longest RAG or user-memory lookup
     enable_memory_persistence: bool = True
+    review_debounce_seconds: int = 60  # wait for more pushes before reviewing
+    progress_event_ttl: int = 3600  # seconds progress events are replayable
+    progress_stream_timeout: int = 900  # longest an events stream stays open
+    batch_reviews_per_minute: float = 30  # review starts per installation that /api/review/batch waits for
+    max_batch_reviews: int = 1000
+    
+    # Message Batches (non-urgent bulk reviews at batch pricing)
+    bulk_reviews_use_message_batches: bool = False  # default for /api/review/batch
+    llm_batch_poll_interval: int = 60  # seconds between beat runs submitting and polling
+    llm_batch_max_requests: int = 10000  # requests per submitted batch
+    llm_batch_ttl: int = 172800  # seconds a batched review's state is kept
+    
+    # Vector Storage
+    # "float32" stores full-precision vectors; "compact" stores half-precision
+    # vectors plus a binary-quantized copy used for a Hamming candidate scan
+    vector_storage_mode: str = "float32"
+    vector_rerank_oversample: int = 10
+    vector_hnsw_ef_search: int = 100  # HNSW candidates per search, at least limit * oversample
+    vector_ivfflat_probes: int = 10  # IVFFlat lists scanned per search
+    
+    # Feedback Ingestion
+    feedback_batch_size: int = 256
+    max_feedback_records_per_request: int = 10000
     
     class Config:
         env_file = ".env"
@@ -1,7 +1,7 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy import create_engine, text, Column, Integer, String, Text, DateTime, JSON, ForeignKey, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from pgvector.sqlalchemy import Vector
+from sqlalchemy.orm import sessionmaker, relationship
+from pgvector.sqlalchemy import Vector, HALFVEC, BIT
 from datetime import datetime
 from app.config import get_settings
 
@@ -11,6 +11,10 @@ engine = create_engine(settings.database_url, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# The schema has halfvec/bit columns and bit_hamming_ops indexes in both
+# vector storage modes; pgvector added them in 0.7
+MIN_PGVECTOR_VERSION = (0, 7)
+
 
 class UserMemory(Base):
     __tablename__ = "user_memory"
@@ -20,13 +24,17 @@ class UserMemory(Base):
     repository_id = Column(String(255), nullable=False, index=True)
     memory_type = Column(String(50), nullable=False)
     content = Column(Text, nullable=False)
-    metadata = Column(JSON)
+    metadata_ = Column("metadata", JSON)
     embedding = Column(Vector(384))
+    embedding_half = Column(HALFVEC(384))
+    embedding_bits = Column(BIT(384))
+    dedupe_key = Column(String(64), unique=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class CodeEmbedding(Base):
+    # Legacy per-repository chunk storage, superseded by CodeChunk/CodeChunkRef
     __tablename__ = "code_embeddings"
     
     id = Column(Integer, primary_key=True, index=True)
@@ -34,8 +42,41 @@ class CodeEmbedding(Base):
     file_path = Column(Text, nullable=False)
     code_chunk = Column(Text, nullable=False)
     embedding = Column(Vector(384))
-    metadata = Column(JSON)
+    embedding_half = Column(HALFVEC(384))
+    embedding_bits = Column(BIT(384))
+    metadata_ = Column("metadata", JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class CodeChunk(Base):
+    """A unique code chunk and its embedding, shared by every repository containing it."""
+    __tablename__ = "code_chunks"
+    
+    content_hash = Column(String(64), primary_key=True)
+    code_chunk = Column(Text, nullable=False)
+    embedding = Column(Vector(384))
+    embedding_half = Column(HALFVEC(384))
+    embedding_bits = Column(BIT(384))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class CodeChunkRef(Base):
+    """Where a CodeChunk occurs: one row per (repository, file, chunk position)."""
+    __tablename__ = "code_chunk_refs"
+    __table_args__ = (UniqueConstraint("repository_id", "file_path", "chunk_index"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    repository_id = Column(String(255), nullable=False, index=True)
+    file_path = Column(Text, nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    content_hash = Column(String(64), ForeignKey("code_chunks.content_hash"), nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    chunk = relationship(CodeChunk)
+    
+    @property
+    def code_chunk(self) -> str:
+        return self.chunk.code_chunk
 
 
 class PRReview(Base):
@@ -59,4 +100,8 @@ def get_db():
 
 
 def init_db():
+    with engine.connect() as conn:
+        version = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+    if version is not None and tuple(int(part) for part in version.split(".")[:2]) < MIN_PGVECTOR_VERSION:
+        raise RuntimeError(f"pgvector {version} is installed, but the schema needs pgvector >= 0.7")
     Base.metadata.create_all(bind=engine)
@@ -0,0 +1,71 @@
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+from app.config import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a review stage has no time left to start."""
+
+
+@dataclass(frozen=True)
+class Deadline:
+    """
+    Time budget of one running task, shared by every stage in it.
+    
+    `reserve` seconds before expires_at are kept back, so the task can
+    return what it has before the worker's soft time limit interrupts it.
+    """
+    expires_at: float = math.inf
+    reserve: float = 0
+    
+    def remaining(self) -> float:
+        return self.expires_at - time.time()
+    
+    def available(self) -> float:
+        """Seconds stages may still use before the posting reserve."""
+        return self.remaining() - self.reserve
+    
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """
+        Timeout for one call: the time available, at most `cap`.
+        
+        None means unbounded (no deadline and no cap).
+        """
+        available = self.available()
+        if available <= 0:
+            raise DeadlineExceeded(f"Task deadline passed {-available:.0f}s ago")
+        if cap is None:
+            return None if math.isinf(available) else available
+        return min(cap, available)
+
+
+def task_deadline(pr_data: Dict) -> Deadline:
+    """
+    Budget of a review task starting now: its queue's soft time limit.
+    
+    Each task (and each retry) starts its own, so time spent waiting in
+    the queue is never counted against the work.
+    """
+    from app.celery_app import QUEUES
+    
+    queue = QUEUES.get(pr_data.get('queue', 'reviews'), QUEUES['reviews'])
+    return Deadline(time.time() + queue['soft_time_limit'], settings.review_deadline_reserve)
+
+
+def limit_statement_time(db, seconds: Optional[float]):
+    """
+    Bound the queries of the session's current transaction.
+    
+    Uses Postgres' statement_timeout, which ends with the transaction;
+    other databases are left alone.
+    """
+    if seconds is None or db.get_bind().dialect.name != "postgresql":
+        return
+    from sqlalchemy import text
+    db.execute(text(f"SET LOCAL statement_timeout = {max(int(seconds * 1000), 1)}"))
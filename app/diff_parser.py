@@ -0,0 +1,273 @@
+import codecs
+import heapq
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+@dataclass
+class DiffHunk:
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    header: str
+    lines: List[str] = field(default_factory=list)
+
+
+@dataclass
+class DiffFile:
+    filename: str
+    previous_filename: Optional[str] = None
+    status: str = "modified"
+    additions: int = 0
+    deletions: int = 0
+    sha: Optional[str] = None
+    binary: bool = False
+    truncated: bool = False  # patch exceeded the retained size and was dropped
+    hunks: List[DiffHunk] = field(default_factory=list)
+    
+    @property
+    def changes(self) -> int:
+        return self.additions + self.deletions
+    
+    @property
+    def patch(self) -> Optional[str]:
+        """Hunks in the same form as the `patch` field of the files API."""
+        if self.truncated or not self.hunks:
+            return None
+        return "\n".join(
+            "\n".join([hunk.header] + hunk.lines) for hunk in self.hunks
+        )
+    
+    def to_dict(self) -> Dict:
+        """Same shape as GitHubService.get_pr_files entries."""
+        return {
+            "filename": self.filename,
+            "status": self.status,
+            "additions": self.additions,
+            "deletions": self.deletions,
+            "changes": self.changes,
+            "patch": self.patch,
+            "sha": self.sha
+        }
+
+
+def _parse_hunk_header(line: str) -> Optional[DiffHunk]:
+    match = HUNK_HEADER.match(line)
+    if not match:
+        return None
+    old_start, old_count, new_start, new_count = match.groups()
+    return DiffHunk(
+        old_start=int(old_start),
+        old_count=int(old_count) if old_count is not None else 1,
+        new_start=int(new_start),
+        new_count=int(new_count) if new_count is not None else 1,
+        header=line
+    )
+
+
+def _strip_prefix(path: str) -> Optional[str]:
+    if path == "/dev/null":
+        return None
+    if path.startswith(("a/", "b/")):
+        return path[2:]
+    return path
+
+
+class LineSplitter:
+    """Splits a stream of byte chunks into lines, decoding UTF-8 incrementally."""
+    
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending = ""
+    
+    def feed(self, chunk: bytes) -> List[str]:
+        # Only split on \n: diff content may contain other line separators
+        lines = (self._pending + self._decoder.decode(chunk)).split("\n")
+        self._pending = lines.pop()
+        return lines
+    
+    def close(self) -> List[str]:
+        rest = self._pending + self._decoder.decode(b"", final=True)
+        self._pending = ""
+        return [rest] if rest else []
+
+
+class UnifiedDiffParser:
+    """
+    Incremental parser for `git diff` output.
+    
+    Lines are fed one at a time and each file is returned as soon as the
+    next one starts, so only one file is held at a time. Patches longer
+    than max_patch_size characters are dropped and the file is marked
+    truncated, but its addition/deletion counts stay exact.
+    """
+    
+    def __init__(self, max_patch_size: Optional[int] = None):
+        self.max_patch_size = max_patch_size
+        self._file: Optional[DiffFile] = None
+        self._hunk: Optional[DiffHunk] = None
+        self._size = 0
+    
+    def _start_file(self, line: str) -> Optional[DiffFile]:
+        finished = self._finish()
+        paths = line[len("diff --git "):]
+        # "a/<path> b/<path>"; exact when the path is unchanged, and renames
+        # are corrected by the "rename from/to" and ---/+++ lines
+        half = (len(paths) - 1) // 2
+        if paths[:half][2:] == paths[half + 1:][2:]:
+            name = paths[2:half]
+        else:
+            name = paths.rsplit(" b/", 1)[-1]
+        self._file = DiffFile(filename=name)
+        return finished
+    
+    def _finish(self) -> Optional[DiffFile]:
+        finished = self._file
+        self._file = None
+        self._hunk = None
+        self._size = 0
+        return finished
+    
+    def feed(self, line: str) -> Optional[DiffFile]:
+        """Consume one line; returns the previous file when a new one starts."""
+        if line.startswith("diff --git "):
+            return self._start_file(line)
+        
+        diff_file = self._file
+        if diff_file is None:
+            return None
+        
+        if self._hunk is not None and line[:1] in (" ", "+", "-", "\\"):
+            if line.startswith("+"):
+                diff_file.additions += 1
+            elif line.startswith("-"):
+                diff_file.deletions += 1
+            self._keep(line)
+            return None
+        
+        if line.startswith("@@"):
+            hunk = _parse_hunk_header(line)
+            if hunk is not None:
+                self._hunk = hunk
+                if self._keep(line):
+                    diff_file.hunks.append(hunk)
+            return None
+        
+        # Extended header lines
+        if line.startswith("new file mode"):
+            diff_file.status = "added"
+        elif line.startswith("deleted file mode"):
+            diff_file.status = "removed"
+        elif line.startswith("rename from "):
+            diff_file.status = "renamed"
+            diff_file.previous_filename = line[len("rename from "):]
+        elif line.startswith("rename to "):
+            diff_file.filename = line[len("rename to "):]
+        elif line.startswith("index "):
+            blobs = line.split()[1]
+            diff_file.sha = blobs.split("..")[-1]
+        elif line.startswith("Binary files ") or line == "GIT binary patch":
+            diff_file.binary = True
+        elif line.startswith("--- "):
+            old_path = _strip_prefix(line[4:])
+            if old_path is None:
+                diff_file.status = "added"
+        elif line.startswith("+++ "):
+            new_path = _strip_prefix(line[4:])
+            if new_path is None:
+                diff_file.status = "removed"
+            else:
+                diff_file.filename = new_path
+        return None
+    
+    def _keep(self, line: str) -> bool:
+        if self._file.truncated:
+            return False
+        
+        self._size += len(line) + 1
+        if self.max_patch_size is not None and self._size > self.max_patch_size:
+            self._file.truncated = True
+            self._file.hunks = []
+            return False
+        
+        if not line.startswith("@@"):
+            self._hunk.lines.append(line)
+        return True
+    
+    def close(self) -> Optional[DiffFile]:
+        """Return the last file once input is exhausted."""
+        return self._finish()
+
+
+class FileSelector:
+    """
+    Keeps the files most worth reviewing out of a stream of parsed files.
+    
+    Files without a retained patch, and those `skip` returns True for
+    (given the file's dict), are skipped. The rest are ranked by size of
+    change, with removed files last, and only the top max_files are held
+    in memory.
+    """
+    
+    def __init__(self, max_files: int, skip: Optional[Callable[[Dict], bool]] = None):
+        self.max_files = max_files
+        self.skip = skip
+        self.total = 0
+        self.skipped = 0
+        self._heap = []  # min-heap on priority, so the worst candidate is evicted first
+    
+    def add(self, diff_file: DiffFile):
+        index = self.total
+        self.total += 1
+        
+        if diff_file.binary or diff_file.patch is None:
+            self.skipped += 1
+            return
+        if self.skip is not None and self.skip(diff_file.to_dict()):
+            self.skipped += 1
+            return
+        
+        priority = (diff_file.status != "removed", diff_file.changes, -index)
+        entry = (priority, index, diff_file)
+        if len(self._heap) < self.max_files:
+            heapq.heappush(self._heap, entry)
+        else:
+            heapq.heappushpop(self._heap, entry)
+    
+    def selected(self) -> List[DiffFile]:
+        """Selected files in their original diff order."""
+        return [f for _, _, f in sorted(self._heap, key=lambda entry: entry[1])]
+
+
+def parse_unified_diff(lines: Iterable[str], max_patch_size: Optional[int] = None) -> Iterator[DiffFile]:
+    """Parse diff lines into files, yielding each file once it is complete."""
+    parser = UnifiedDiffParser(max_patch_size)
+    for line in lines:
+        finished = parser.feed(line)
+        if finished is not None:
+            yield finished
+    
+    finished = parser.close()
+    if finished is not None:
+        yield finished
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Lines from a stream of byte chunks."""
+    splitter = LineSplitter()
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+    yield from splitter.close()
+
+
+def parse_patch(patch: str) -> List[DiffHunk]:
+    """Hunks of a single file's patch, as returned by the files API."""
+    parser = UnifiedDiffParser()
+    parser.feed("diff --git a/file b/file")
+    for line in patch.split("\n"):
+        parser.feed(line)
+    return parser.close().hunks
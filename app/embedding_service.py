@@ -1,25 +1,61 @@
-from sentence_transformers import SentenceTransformer
 from typing import List, Optional
 import numpy as np
-from sqlalchemy.orm import Session
-from app.database import CodeEmbedding, UserMemory
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, Query, contains_eager
+from app.database import CodeChunk, CodeChunkRef, UserMemory
 from app.config import get_settings
+from app.metrics import observe_stage, record_embedding_model_loaded
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+def quantize_binary(embedding: List[float]) -> str:
+    """Binary-quantize an embedding (sign bit per dimension) as a bit string."""
+    return "".join("1" if value > 0 else "0" for value in embedding)
+
+
+def chunk_hash(code_chunk: str) -> str:
+    """Content address of a code chunk."""
+    return hashlib.sha256(code_chunk.encode("utf-8")).hexdigest()
+
+
+def widen_index_scan(db: Session, candidates: int):
+    """
+    Let vector index scans of the current transaction return more rows.
+    
+    The indexes cover every repository and user, and the query's filter is
+    applied to the rows they return: an HNSW scan returns at most
+    hnsw.ef_search of them, an IVFFlat scan only those in the
+    ivfflat.probes lists nearest the query. Other databases are left alone.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    ef_search = min(max(settings.vector_hnsw_ef_search, candidates), 1000)
+    db.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+    db.execute(text(f"SET LOCAL ivfflat.probes = {settings.vector_ivfflat_probes}"))
+
 
 class EmbeddingService:
     def __init__(self):
+        # Imported here so processes that never embed don't load torch
+        from sentence_transformers import SentenceTransformer
+        
         # Using a lightweight model for embeddings (384 dimensions)
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.model = SentenceTransformer(EMBEDDING_MODEL)
         self.dimension = 384
+        record_embedding_model_loaded(EMBEDDING_MODEL)
     
     def create_embedding(self, text: str) -> List[float]:
         """Generate embedding for text."""
         try:
-            embedding = self.model.encode(text)
+            with observe_stage("embed"):
+                embedding = self.model.encode(text)
             return embedding.tolist()
         except Exception as e:
             logger.error(f"Error creating embedding: {e}")
@@ -28,35 +64,137 @@ class EmbeddingService:
     def create_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings for multiple texts."""
         try:
-            embeddings = self.model.encode(texts)
+            with observe_stage("embed"):
+                embeddings = self.model.encode(texts)
             return embeddings.tolist()
         except Exception as e:
             logger.error(f"Error creating batch embeddings: {e}")
             raise
     
-    async def store_code_embedding(
+    def vector_columns(self, embedding: List[float]) -> dict:
+        """
+        Column values for storing an embedding in the configured storage mode.
+        
+        Compact mode leaves the float32 column empty and stores a
+        half-precision copy plus its binary quantization instead.
+        """
+        if settings.vector_storage_mode == "compact":
+            return {
+                "embedding": None,
+                "embedding_half": embedding,
+                "embedding_bits": quantize_binary(embedding)
+            }
+        return {"embedding": embedding}
+    
+    def _nearest_query(self, query: Query, vector_model, key, query_embedding: List[float], limit: int) -> Query:
+        """
+        Order a filtered query by cosine distance to query_embedding.
+        
+        vector_model is the model holding the vector columns and key the
+        primary key of the rows query returns. In compact mode a
+        Hamming-distance scan over the binary column picks
+        limit * oversample candidates, which are then reranked by exact
+        cosine distance on the half-precision vectors.
+        """
+        if settings.vector_storage_mode == "compact":
+            candidates = query.with_entities(key.label("key")).order_by(
+                vector_model.embedding_bits.hamming_distance(quantize_binary(query_embedding))
+            ).limit(limit * settings.vector_rerank_oversample).subquery()
+            
+            return query.filter(
+                key.in_(select(candidates.c.key))
+            ).order_by(
+                vector_model.embedding_half.cosine_distance(query_embedding)
+            ).limit(limit)
+        
+        return query.order_by(
+            vector_model.embedding.cosine_distance(query_embedding)
+        ).limit(limit)
+    
+    def _nearest(self, query: Query, vector_model, key, query_embedding: List[float], limit: int):
+        """
+        The limit rows of a filtered query nearest to query_embedding.
+        
+        If the vector index yields fewer rows passing the filter (a small
+        repository among large ones), the filtered rows are scanned exactly
+        instead.
+        """
+        db = query.session
+        candidates = limit * settings.vector_rerank_oversample if settings.vector_storage_mode == "compact" else limit
+        widen_index_scan(db, candidates)
+        
+        results = self._nearest_query(query, vector_model, key, query_embedding, limit).all()
+        if len(results) < limit and db.get_bind().dialect.name == "postgresql":
+            # Vector indexes only support plain index scans, so this leaves
+            # the filter's own indexes (as bitmap scans) and exact distances
+            db.execute(text("SET LOCAL enable_indexscan = off"))
+            results = self._nearest_query(query, vector_model, key, query_embedding, limit).all()
+            db.execute(text("RESET enable_indexscan"))
+        return results
+    
+    async def store_code_chunks(
         self,
         db: Session,
         repository_id: str,
         file_path: str,
-        code_chunk: str,
-        metadata: Optional[dict] = None
-    ):
-        """Store code chunk with its embedding."""
-        embedding = self.create_embedding(code_chunk)
-        
-        code_emb = CodeEmbedding(
-            repository_id=repository_id,
-            file_path=file_path,
-            code_chunk=code_chunk,
-            embedding=embedding,
-            metadata=metadata or {}
-        )
+        chunks: List[str]
+    ) -> int:
+        """
+        Store the chunks of a file, replacing any previously indexed version.
+        
+        Chunks are content-addressed: only chunks whose hash is not already
+        in code_chunks (from any repository or fork) are embedded. The file's
+        chunk positions are recorded in code_chunk_refs.
+        
+        Returns the number of chunks that had to be embedded.
+        """
+        hashes = {idx: chunk_hash(chunk) for idx, chunk in enumerate(chunks) if chunk.strip()}
+        
+        existing = {
+            row.content_hash for row in db.query(CodeChunk.content_hash).filter(
+                CodeChunk.content_hash.in_(set(hashes.values()))
+            )
+        }
+        
+        missing = {}
+        for idx, content_hash in hashes.items():
+            if content_hash not in existing and content_hash not in missing:
+                missing[content_hash] = chunks[idx]
+        
+        if missing:
+            embeddings = self.create_embeddings_batch(list(missing.values()))
+            db.execute(
+                insert(CodeChunk.__table__).values([
+                    {
+                        "content_hash": content_hash,
+                        "code_chunk": code_chunk,
+                        **self.vector_columns(embedding)
+                    }
+                    for (content_hash, code_chunk), embedding in zip(missing.items(), embeddings)
+                ]).on_conflict_do_nothing(index_elements=["content_hash"])
+            )
+        
+        db.query(CodeChunkRef).filter(
+            CodeChunkRef.repository_id == repository_id,
+            CodeChunkRef.file_path == file_path
+        ).delete(synchronize_session=False)
+        
+        if hashes:
+            db.execute(
+                insert(CodeChunkRef.__table__).values([
+                    {
+                        "repository_id": repository_id,
+                        "file_path": file_path,
+                        "chunk_index": idx,
+                        "content_hash": content_hash
+                    }
+                    for idx, content_hash in hashes.items()
+                ])
+            )
         
-        db.add(code_emb)
         db.commit()
         
-        return code_emb
+        return len(missing)
     
     async def search_similar_code(
         self,
@@ -64,18 +202,16 @@ class EmbeddingService:
         repository_id: str,
         query: str,
         limit: int = 5
-    ) -> List[CodeEmbedding]:
+    ) -> List[CodeChunkRef]:
         """Search for similar code chunks using vector similarity."""
         query_embedding = self.create_embedding(query)
         
         # PostgreSQL pgvector similarity search
-        results = db.query(CodeEmbedding).filter(
-            CodeEmbedding.repository_id == repository_id
-        ).order_by(
-            CodeEmbedding.embedding.cosine_distance(query_embedding)
-        ).limit(limit).all()
+        chunks = db.query(CodeChunkRef).join(CodeChunkRef.chunk).options(
+            contains_eager(CodeChunkRef.chunk)
+        ).filter(CodeChunkRef.repository_id == repository_id)
         
-        return results
+        return self._nearest(chunks, CodeChunk, CodeChunkRef.id, query_embedding, limit)
     
     async def search_user_memory(
         self,
@@ -88,14 +224,12 @@ class EmbeddingService:
         """Search user memory for relevant context."""
         query_embedding = self.create_embedding(query)
         
-        results = db.query(UserMemory).filter(
+        memories = db.query(UserMemory).filter(
             UserMemory.user_id == user_id,
             UserMemory.repository_id == repository_id
-        ).order_by(
-            UserMemory.embedding.cosine_distance(query_embedding)
-        ).limit(limit).all()
+        )
         
-        return results
+        return self._nearest(memories, UserMemory, UserMemory.id, query_embedding, limit)
 
 
 # Singleton instance
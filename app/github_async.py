@@ -0,0 +1,601 @@
+import asyncio
+import base64
+import concurrent.futures
+import os
+import random
+import re
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import httpx
+from github import GithubException, RateLimitExceededException
+
+from app.config import get_settings
+from app.deadline import Deadline
+from app.diff_parser import FileSelector, LineSplitter, UnifiedDiffParser
+from app.github_cache import CachedResponse, HTTPCache, get_http_cache
+from app.github_service import PR_SNAPSHOT_QUERY, format_graphql_snapshot, format_rest_comments
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+PER_PAGE = 100
+LAST_PAGE = re.compile(r'[?&]page=(\d+)[^>]*>;\s*rel="last"')
+
+# Methods safe to send again after a server error or a lost response, as
+# in urllib3's default Retry (which PyGithub uses)
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+class AsyncGitHubClient:
+    """
+    Minimal async GitHub REST client for one installation.
+    
+    Requests share the given httpx client (and its HTTP/2 connection pool),
+    are retried with jittered exponential backoff on transient failures,
+    and report rate-limit headers to the governor. Writes such as POST are
+    only retried when GitHub can't have acted on them. With a `cache`, GETs
+    are revalidated against it like PyGithub's (see ConditionalCacheAdapter).
+    """
+    
+    def __init__(
+        self,
+        http: httpx.AsyncClient,
+        token_provider: Callable[[], str],
+        installation_id: Optional[int] = None,
+        governor=None,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+        cache: Optional[HTTPCache] = None,
+        token_rejected: Optional[Callable[[str], None]] = None
+    ):
+        self.http = http
+        self.token_provider = token_provider
+        self.installation_id = installation_id
+        self.governor = governor
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = cache
+        self.token_rejected = token_rejected
+    
+    async def _headers(self) -> Dict[str, str]:
+        # Refreshing a token is a blocking HTTP call; keep it off the loop
+        token = await asyncio.to_thread(self.token_provider)
+        return {"Authorization": f"token {token}"}
+    
+    def _delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None and "Retry-After" in response.headers:
+            return float(response.headers["Retry-After"])
+        # Full jitter so concurrent requests don't retry in lockstep
+        return random.uniform(0, self.backoff * (2 ** attempt))
+    
+    async def _record(self, response: httpx.Response):
+        if self.governor is None or self.installation_id is None:
+            return
+        body = response.text if response.status_code in (403, 429) else ""
+        try:
+            await asyncio.to_thread(
+                self.governor.record,
+                self.installation_id,
+                response.status_code,
+                response.headers,
+                body
+            )
+        except Exception as e:
+            logger.warning(f"Could not record GitHub rate limit: {e}")
+    
+    async def _cached(self, request: httpx.Request) -> Optional[CachedResponse]:
+        """Cached entry for a GET, with the request made conditional on it."""
+        entry = await asyncio.to_thread(self.cache.store.get, self.cache.cache_key(request))
+        if entry is not None and entry.vary is not None:
+            if self.cache.vary_values(",".join(entry.vary), request) != entry.vary:
+                entry = None
+        if entry is not None:
+            if entry.etag:
+                request.headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                request.headers["If-Modified-Since"] = entry.last_modified
+        return entry
+    
+    async def _store(self, request: httpx.Request, response: httpx.Response):
+        self.cache.record("misses")
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        vary = self.cache.vary_values(response.headers.get("Vary", ""), request)
+        if response.status_code == 200 and (etag or last_modified) and vary is not None:
+            await asyncio.to_thread(self.cache.store.put, self.cache.cache_key(request), CachedResponse(
+                status=response.status_code,
+                headers=dict(response.headers),
+                body=response.content,
+                etag=etag,
+                last_modified=last_modified,
+                vary=vary
+            ))
+            self.cache.record("stored")
+    
+    @staticmethod
+    def _from_cache(entry: CachedResponse, not_modified: httpx.Response) -> httpx.Response:
+        headers = {
+            name: value for name, value in entry.headers.items()
+            if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        }
+        # Rate-limit and date headers must reflect the current request
+        for name, value in not_modified.headers.items():
+            if name.lower().startswith("x-ratelimit") or name.lower() == "date":
+                headers[name] = value
+        return httpx.Response(entry.status, headers=headers, content=entry.body, request=not_modified.request)
+    
+    async def request(self, method: str, url: str, idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+        """
+        Send a request, retrying server errors, secondary limits and transport failures.
+        
+        Requests that aren't idempotent (by default, those not in
+        IDEMPOTENT_METHODS) are retried only on secondary rate limits and
+        connection failures, which happen before GitHub has processed them:
+        a retried POST whose response was lost could post a review twice.
+        
+        A 401 is retried once with a new token after reporting the rejected
+        one to `token_rejected`; GitHub acts on no request it rejects.
+        """
+        headers = {**kwargs.pop("headers", {}), **(await self._headers())}
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        request = self.http.build_request(method, url, headers=headers, **kwargs)
+        
+        try:
+            return await self._send(request, idempotent)
+        except GithubException as e:
+            if e.status != 401 or self.token_rejected is None:
+                raise
+            token = request.headers["Authorization"].split(" ")[-1]
+            logger.warning(f"GitHub rejected the access token for {method} {url}, retrying with a new one")
+            await asyncio.to_thread(self.token_rejected, token)
+            request.headers.update(await self._headers())
+            return await self._send(request, idempotent)
+    
+    async def _send(self, request: httpx.Request, idempotent: bool) -> httpx.Response:
+        method, url = request.method, request.url.path
+        cacheable = self.cache is not None and method == "GET"
+        entry = await self._cached(request) if cacheable else None
+        
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.http.send(request)
+            except httpx.TransportError as e:
+                unsent = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+                if attempt == self.max_retries or not (idempotent or unsent):
+                    raise
+                logger.warning(f"GitHub {method} {url} failed ({e}), retrying")
+                await asyncio.sleep(self._delay(attempt))
+                continue
+            
+            await self._record(response)
+            
+            if response.status_code == 304 and entry is not None:
+                self.cache.record("hits")
+                return self._from_cache(entry, response)
+            if cacheable:
+                await self._store(request, response)
+            if response.status_code < 400:
+                return response
+            
+            rate_limited = response.status_code in (403, 429)
+            if rate_limited and response.headers.get("X-RateLimit-Remaining") == "0":
+                # Primary limit: retrying before the reset only wastes time
+                raise RateLimitExceededException(
+                    response.status_code, response.json(), dict(response.headers)
+                )
+            
+            secondary = rate_limited and (
+                "Retry-After" in response.headers
+                or "secondary rate limit" in response.text.lower()
+            )
+            server_error = response.status_code >= 500 and idempotent
+            if (server_error or secondary) and attempt < self.max_retries:
+                logger.warning(f"GitHub {method} {url} returned {response.status_code}, retrying")
+                await asyncio.sleep(self._delay(attempt, response))
+                continue
+            
+            try:
+                data = response.json()
+            except ValueError:
+                data = response.text
+            raise GithubException(response.status_code, data, dict(response.headers))
+    
+    @asynccontextmanager
+    async def stream(self, url: str, accept: str) -> AsyncIterator[httpx.Response]:
+        """Stream a GET response body; not retried, since it may be partly consumed."""
+        headers = {"Accept": accept, **(await self._headers())}
+        async with self.http.stream("GET", url, headers=headers) as response:
+            await self._record(response)
+            yield response
+    
+    async def get_json(self, url: str, method: str = "GET", **kwargs):
+        return (await self.request(method, url, **kwargs)).json()
+    
+    async def paginate(self, url: str, max_items: Optional[int] = None, params: Optional[Dict] = None) -> List:
+        """
+        Fetch a paginated list.
+        
+        The first page tells us the last page number; the remaining pages
+        (up to max_items) are then fetched concurrently.
+        """
+        params = {**(params or {}), "per_page": PER_PAGE}
+        first = await self.request("GET", url, params={**params, "page": 1})
+        items = first.json()
+        
+        match = LAST_PAGE.search(first.headers.get("Link", ""))
+        last_page = int(match.group(1)) if match else 1
+        if max_items is not None:
+            last_page = min(last_page, -(-max_items // PER_PAGE))
+        
+        pages = await asyncio.gather(*(
+            self.get_json(url, params={**params, "page": page})
+            for page in range(2, last_page + 1)
+        ))
+        for page in pages:
+            items.extend(page)
+        
+        return items[:max_items] if max_items is not None else items
+
+
+class AsyncGitHubService:
+    """Async counterpart of GitHubService for the review path, returning the same shapes."""
+    
+    def __init__(self, client: AsyncGitHubClient, bot_login: Optional[str] = None):
+        self.client = client
+        self.bot_login = bot_login
+    
+    @staticmethod
+    def _format_pr_info(pr: Dict) -> Dict:
+        return {
+            "title": pr["title"],
+            "description": pr.get("body") or "",
+            "author": pr["user"]["login"],
+            "head_sha": pr["head"]["sha"],
+            "base_sha": pr["base"]["sha"],
+            "state": pr["state"],
+            "created_at": pr["created_at"],
+            "updated_at": pr["updated_at"]
+        }
+    
+    @staticmethod
+    def _format_file(file: Dict) -> Dict:
+        return {
+            "filename": file["filename"],
+            "status": file["status"],
+            "additions": file["additions"],
+            "deletions": file["deletions"],
+            "changes": file["changes"],
+            "patch": file.get("patch"),
+            "sha": file["sha"]
+        }
+    
+    async def get_pr_info(self, repo_name: str, pr_number: int) -> Dict:
+        """Get PR metadata."""
+        pr = await self.client.get_json(f"/repos/{repo_name}/pulls/{pr_number}")
+        return self._format_pr_info(pr)
+    
+    async def get_pr_files(
+        self,
+        repo_name: str,
+        pr_number: int,
+        max_files: int = 10,
+        skip: Optional[Callable[[Dict], bool]] = None
+    ) -> List[Dict]:
+        """
+        Get the first max_files changed files in a PR that `skip` doesn't leave out.
+        
+        With `skip`, every page is fetched (concurrently) since it isn't
+        known up front how many files it leaves out.
+        """
+        files = await self.client.paginate(
+            f"/repos/{repo_name}/pulls/{pr_number}/files",
+            max_items=max_files if skip is None else None
+        )
+        files = [self._format_file(f) for f in files]
+        if skip is not None:
+            files = [f for f in files if not skip(f)]
+        return files[:max_files]
+    
+    async def get_pr_diff_files(
+        self,
+        repo_name: str,
+        pr_number: int,
+        max_files: int = 10,
+        skip: Optional[Callable[[Dict], bool]] = None
+    ) -> List[Dict]:
+        """Get changed files by streaming and parsing the PR's unified diff (see GitHubService)."""
+        url = f"/repos/{repo_name}/pulls/{pr_number}"
+        parser = UnifiedDiffParser(max_patch_size=settings.max_windowed_diff_size)
+        splitter = LineSplitter()
+        selector = FileSelector(max_files, skip)
+        
+        async with self.client.stream(url, "application/vnd.github.diff") as response:
+            if response.status_code == 406:
+                logger.warning(f"Diff for PR #{pr_number} too large to render, using files API")
+                return await self.get_pr_files(repo_name, pr_number, max_files, skip)
+            if response.status_code >= 400:
+                await response.aread()
+                raise GithubException(response.status_code, response.text, dict(response.headers))
+            
+            async for chunk in response.aiter_bytes():
+                for line in splitter.feed(chunk):
+                    diff_file = parser.feed(line)
+                    if diff_file is not None:
+                        selector.add(diff_file)
+        
+        for line in splitter.close():
+            diff_file = parser.feed(line)
+            if diff_file is not None:
+                selector.add(diff_file)
+        last = parser.close()
+        if last is not None:
+            selector.add(last)
+        
+        return [f.to_dict() for f in selector.selected()]
+    
+    async def get_bot_review_comments(self, repo_name: str, pr_number: int) -> List[Dict]:
+        """Get the bot's existing inline comments on a PR through REST."""
+        if not self.bot_login:
+            return []
+        comments = await self.client.paginate(f"/repos/{repo_name}/pulls/{pr_number}/comments")
+        return format_rest_comments(comments, self.bot_login)
+    
+    async def get_pr_snapshot(
+        self,
+        repo_name: str,
+        pr_number: int,
+        max_files: int = 10,
+        skip: Optional[Callable[[Dict], bool]] = None
+    ) -> Dict:
+        """Get PR metadata and changed files, fetched concurrently (see GitHubService)."""
+        if settings.github_diff_mode == "unified":
+            files_request = self.get_pr_diff_files(repo_name, pr_number, max_files, skip)
+        else:
+            files_request = self.get_pr_files(repo_name, pr_number, max_files, skip)
+        
+        if settings.github_snapshot_api == "graphql":
+            snapshot, files = await asyncio.gather(
+                self.get_pr_graphql_snapshot(repo_name, pr_number),
+                files_request
+            )
+        else:
+            info, existing_comments, files = await asyncio.gather(
+                self.get_pr_info(repo_name, pr_number),
+                self.get_bot_review_comments(repo_name, pr_number),
+                files_request
+            )
+            snapshot = {"info": info, "existing_comments": existing_comments}
+        
+        snapshot["files"] = files
+        return snapshot
+    
+    async def get_pr_graphql_snapshot(self, repo_name: str, pr_number: int) -> Dict:
+        """Get PR metadata and the bot's existing inline comments with one GraphQL query."""
+        owner, name = repo_name.split("/", 1)
+        response = await self.client.get_json(
+            "/graphql",
+            method="POST",
+            idempotent=True,  # a query, though sent as POST
+            json={
+                "query": PR_SNAPSHOT_QUERY,
+                "variables": {"owner": owner, "name": name, "number": pr_number}
+            }
+        )
+        if response.get("errors"):
+            raise GithubException(200, response, None)
+        return format_graphql_snapshot(response["data"])
+    
+    async def get_pr_diff(self, repo_name: str, pr_number: int) -> str:
+        """Get the full diff for a PR."""
+        files = await self.client.paginate(f"/repos/{repo_name}/pulls/{pr_number}/files")
+        
+        diff_parts = []
+        for file in files:
+            if file.get("patch"):
+                diff_parts.append(f"--- a/{file['filename']}")
+                diff_parts.append(f"+++ b/{file['filename']}")
+                diff_parts.append(file["patch"])
+                diff_parts.append("")
+        
+        return "\n".join(diff_parts)
+    
+    async def get_file_content(self, repo_name: str, file_path: str, ref: str) -> Optional[str]:
+        """
+        Get the content of a file at a specific commit.
+        
+        None if there is no such file at ref, "" if it couldn't be read.
+        """
+        try:
+            content = await self.client.get_json(
+                f"/repos/{repo_name}/contents/{file_path}",
+                params={"ref": ref}
+            )
+            
+            if isinstance(content, list):
+                return ""  # It's a directory
+            
+            return base64.b64decode(content["content"]).decode("utf-8")
+        except GithubException as e:
+            if e.status != 404:
+                logger.warning(f"Could not get file content for {file_path}: {e}")
+                return ""
+            logger.debug(f"No {file_path} at {ref}")
+            return None
+        except Exception as e:
+            logger.warning(f"Could not get file content for {file_path}: {e}")
+            return ""
+    
+    async def post_review_comment(
+        self,
+        repo_name: str,
+        pr_number: int,
+        body: str,
+        commit_id: str,
+        path: str,
+        line: Optional[int] = None
+    ):
+        """Post a review comment on a specific line or file."""
+        if line:
+            await self.client.request(
+                "POST",
+                f"/repos/{repo_name}/pulls/{pr_number}/comments",
+                json={"body": body, "commit_id": commit_id, "path": path, "line": line}
+            )
+        else:
+            await self.client.request(
+                "POST",
+                f"/repos/{repo_name}/issues/{pr_number}/comments",
+                json={"body": body}
+            )
+        
+        logger.info(f"Posted review comment on PR #{pr_number}")
+    
+    async def post_pr_review(
+        self,
+        repo_name: str,
+        pr_number: int,
+        commit_id: str,
+        body: str,
+        event: str = "COMMENT",
+        comments: Optional[List[Dict]] = None
+    ):
+        """
+        Post a complete PR review.
+        
+        event can be: APPROVE, REQUEST_CHANGES, or COMMENT
+        """
+        review_comments = [
+            {"path": c["path"], "line": c["line"], "body": c["body"]}
+            for c in comments or []
+            if c.get("line")
+        ]
+        
+        if review_comments:
+            await self.client.request(
+                "POST",
+                f"/repos/{repo_name}/pulls/{pr_number}/reviews",
+                json={
+                    "commit_id": commit_id,
+                    "body": body,
+                    "event": event,
+                    "comments": review_comments
+                }
+            )
+        else:
+            # Just post a comment if no inline comments
+            await self.client.request(
+                "POST",
+                f"/repos/{repo_name}/issues/{pr_number}/comments",
+                json={"body": body}
+            )
+        
+        logger.info(f"Posted review on PR #{pr_number} with {len(review_comments)} comments")
+
+
+class BlockingGitHubService:
+    """
+    Synchronous GitHubService facade over AsyncGitHubService.
+    
+    Coroutines run on the process-wide GitHub event loop, so every task in
+    a worker shares one HTTP/2 connection pool. With a deadline, each call
+    (including its retries and pages) is cancelled once the time then left
+    is exceeded.
+    """
+    
+    def __init__(self, service: AsyncGitHubService, deadline: Optional[Deadline] = None):
+        self.service = service
+        self.deadline = deadline
+    
+    def __getattr__(self, name: str):
+        attr = getattr(self.service, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+        
+        def call(*args, **kwargs):
+            timeout = self.deadline.timeout() if self.deadline is not None else None
+            return run_github_coroutine(attr(*args, **kwargs), timeout)
+        
+        return call
+
+
+# One event loop and HTTP client per worker process. Celery forks workers,
+# so both are recreated when the process id changes.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_http: Optional[httpx.AsyncClient] = None
+_http_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def _github_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _loop_pid
+    if _loop_pid != os.getpid():
+        with _lock:
+            if _loop_pid != os.getpid():
+                _loop = asyncio.new_event_loop()
+                threading.Thread(target=_loop.run_forever, name="github-loop", daemon=True).start()
+                _loop_pid = os.getpid()
+    return _loop
+
+
+def _shared_http() -> httpx.AsyncClient:
+    global _http, _http_pid
+    if _http_pid != os.getpid():
+        with _lock:
+            if _http_pid != os.getpid():
+                _http = httpx.AsyncClient(
+                    base_url=settings.github_api_url,
+                    http2=settings.github_http2,
+                    limits=httpx.Limits(
+                        max_connections=settings.github_http_pool_size,
+                        max_keepalive_connections=settings.github_http_pool_size
+                    ),
+                    headers={
+                        "Accept": "application/vnd.github+json",
+                        "X-GitHub-Api-Version": "2022-11-28"
+                    },
+                    timeout=httpx.Timeout(30.0)
+                )
+                _http_pid = os.getpid()
+    return _http
+
+
+def run_github_coroutine(coro, timeout: Optional[float] = None):
+    """
+    Run a coroutine on the shared GitHub event loop and wait for its result.
+    
+    Raises TimeoutError, after cancelling the coroutine, if it takes longer
+    than timeout seconds.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _github_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"GitHub call timed out after {timeout:.1f}s")
+
+
+def get_async_github_service(installation_id: int) -> AsyncGitHubService:
+    """
+    Get an async service for an installation.
+    
+    The service uses the process-wide HTTP client, so its coroutines must
+    run on the GitHub event loop (see run_github_coroutine).
+    """
+    from app.github_auth import get_bot_login, get_installation_token, get_token_cache
+    from app.rate_limit import get_rate_limit_governor
+    
+    client = AsyncGitHubClient(
+        _shared_http(),
+        token_provider=lambda: get_installation_token(installation_id),
+        installation_id=installation_id,
+        governor=get_rate_limit_governor(),
+        max_retries=settings.github_http_max_retries,
+        cache=get_http_cache() if settings.github_http_cache_enabled else None,
+        token_rejected=lambda token: get_token_cache().invalidate(installation_id, token)
+    )
+    return AsyncGitHubService(client, bot_login=get_bot_login())
@@ -1,10 +1,17 @@
+import json
+import threading
 import time
 import jwt
 from github import Github, Auth, GithubIntegration
-from typing import Optional
+from github.InstallationAuthorization import InstallationAuthorization
+from typing import Dict, Optional, Tuple
 from pathlib import Path
 from app.config import get_settings
+from app.github_cache import HTTPCache, install_http_cache, add_response_hook
+from app.rate_limit import get_rate_limit_governor
+import logging
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
@@ -13,7 +20,8 @@ class GitHubAppAuth:
         self.app_id = settings.github_app_id
         self.private_key_path = settings.github_app_private_key_path
         self._private_key = None
-        
+        self._integration = None
+    
     def _load_private_key(self) -> str:
         """Load the GitHub App private key."""
         if self._private_key is None:
@@ -36,14 +44,26 @@ class GitHubAppAuth:
         
         return jwt.encode(payload, private_key, algorithm="RS256")
     
+    def _get_integration(self) -> GithubIntegration:
+        if self._integration is None:
+            self._integration = GithubIntegration(
+                integration_id=self.app_id,
+                private_key=self._load_private_key(),
+                base_url=settings.github_api_url
+            )
+        return self._integration
+    
+    def create_installation_token(self, installation_id: int) -> InstallationAuthorization:
+        """Request a new installation access token from GitHub."""
+        return self._get_integration().get_access_token(installation_id)
+    
+    def get_bot_login(self) -> str:
+        """Login the App's comments are posted under."""
+        return f"{self._get_integration().get_app().slug}[bot]"
+    
     def get_installation_client(self, installation_id: int) -> Github:
         """Get an authenticated GitHub client for a specific installation."""
-        integration = GithubIntegration(
-            integration_id=self.app_id,
-            private_key=self._load_private_key()
-        )
-        
-        auth = integration.get_access_token(installation_id)
+        auth = self.create_installation_token(installation_id)
         return Github(auth=Auth.Token(auth.token))
     
     def get_app_client(self) -> Github:
@@ -52,7 +72,255 @@ class GitHubAppAuth:
         return Github(auth=Auth.Token(jwt_token))
 
 
+class InstallationTokenCache:
+    """
+    Caches installation access tokens until shortly before they expire.
+    
+    Tokens are held per process and, when a Redis client is given, shared
+    across worker processes. Refreshes are single-flight: concurrent callers
+    for the same installation wait for one refresh instead of each
+    requesting a token (per process via a lock, across workers via a
+    Redis lock).
+    """
+    
+    def __init__(self, app_auth: GitHubAppAuth, refresh_margin: int = 300, redis_client=None):
+        self.app_auth = app_auth
+        self.refresh_margin = refresh_margin
+        self.redis = redis_client
+        self._tokens: Dict[int, Tuple[str, float]] = {}
+        self._installations: Dict[str, int] = {}
+        self._locks: Dict[int, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+    
+    def _fresh(self, entry: Optional[Tuple[str, float]]) -> bool:
+        return entry is not None and entry[1] - self.refresh_margin > time.time()
+    
+    def _lock_for(self, installation_id: int) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(installation_id, threading.Lock())
+    
+    def _redis_key(self, installation_id: int) -> str:
+        return f"github:installation_token:{installation_id}"
+    
+    def _load_shared(self, installation_id: int) -> Optional[Tuple[str, float]]:
+        raw = self.redis.get(self._redis_key(installation_id))
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        return data["token"], data["expires_at"]
+    
+    def _store_shared(self, installation_id: int, entry: Tuple[str, float]):
+        ttl = int(entry[1] - self.refresh_margin - time.time())
+        if ttl > 0:
+            self.redis.set(
+                self._redis_key(installation_id),
+                json.dumps({"token": entry[0], "expires_at": entry[1]}),
+                ex=ttl
+            )
+    
+    def _request_token(self, installation_id: int) -> Tuple[str, float]:
+        auth = self.app_auth.create_installation_token(installation_id)
+        logger.info(f"Obtained new access token for installation {installation_id}")
+        return auth.token, auth.expires_at.timestamp()
+    
+    def _refresh(self, installation_id: int) -> Tuple[str, float]:
+        if self.redis is None:
+            return self._request_token(installation_id)
+        
+        entry = self._load_shared(installation_id)
+        if self._fresh(entry):
+            return entry
+        
+        with self.redis.lock(f"{self._redis_key(installation_id)}:lock", timeout=30, blocking_timeout=30):
+            # Another worker may have refreshed while we waited for the lock
+            entry = self._load_shared(installation_id)
+            if not self._fresh(entry):
+                entry = self._request_token(installation_id)
+                self._store_shared(installation_id, entry)
+        
+        return entry
+    
+    def get_token(self, installation_id: int) -> str:
+        """Return a valid access token for the installation."""
+        entry = self._tokens.get(installation_id)
+        if self._fresh(entry):
+            return entry[0]
+        
+        with self._lock_for(installation_id):
+            previous = self._tokens.get(installation_id)
+            entry = previous
+            if not self._fresh(entry):
+                entry = self._refresh(installation_id)
+                self._tokens[installation_id] = entry
+                if previous is not None and previous[0] != entry[0]:
+                    self._installations.pop(previous[0], None)
+                self._installations[entry[0]] = installation_id
+        
+        return entry[0]
+    
+    def installation_for_token(self, token: str) -> Optional[int]:
+        """Which installation a token handed out by this cache belongs to."""
+        return self._installations.get(token)
+    
+    def invalidate(self, installation_id: int, token: Optional[str] = None):
+        """
+        Forget a token, e.g. after GitHub rejected it.
+        
+        With `token`, nothing is forgotten once another caller has
+        already replaced that token. The token keeps mapping to its
+        installation until the replacement is stored.
+        """
+        with self._lock_for(installation_id):
+            entry = self._tokens.get(installation_id)
+            if entry is not None and token in (None, entry[0]):
+                self._tokens[installation_id] = (entry[0], 0)
+            if self.redis is not None:
+                shared = self._load_shared(installation_id)
+                if shared is not None and token in (None, shared[0]):
+                    self.redis.delete(self._redis_key(installation_id))
+
+
+class CachedInstallationAuth(Auth.Auth):
+    """PyGithub auth that reads the installation token from the cache on every request."""
+    
+    def __init__(self, token_cache: InstallationTokenCache, installation_id: int):
+        self.token_cache = token_cache
+        self.installation_id = installation_id
+    
+    @property
+    def token_type(self) -> str:
+        return "token"
+    
+    @property
+    def token(self) -> str:
+        return self.token_cache.get_token(self.installation_id)
+
+
+# Process-wide token cache and clients, shared by all tasks in a worker
+_token_cache = None
+_bot_login: Optional[str] = None
+_clients: Dict[int, Github] = {}
+_clients_lock = threading.Lock()
+
+
+def get_token_cache() -> InstallationTokenCache:
+    global _token_cache
+    if _token_cache is None:
+        redis_client = None
+        if settings.github_token_cache_redis:
+            import redis
+            redis_client = redis.Redis.from_url(settings.redis_url)
+        
+        _token_cache = InstallationTokenCache(
+            GitHubAppAuth(),
+            refresh_margin=settings.github_token_refresh_margin,
+            redis_client=redis_client
+        )
+    return _token_cache
+
+
+def record_rate_limit(response, **kwargs):
+    """Response hook feeding rate-limit headers to the per-installation governor."""
+    token = response.request.headers.get("Authorization", "").split(" ")[-1]
+    installation_id = get_token_cache().installation_for_token(token)
+    if installation_id is None:
+        return
+    
+    try:
+        body = response.text if response.status_code in (403, 429) else ""
+        get_rate_limit_governor().record(installation_id, response.status_code, response.headers, body)
+    except Exception as e:
+        logger.warning(f"Could not record rate limit for installation {installation_id}: {e}")
+
+
+def retry_rejected_token(response, **kwargs):
+    """
+    Response hook sending a request once more when GitHub rejects its
+    installation token with a 401, e.g. after the token was revoked.
+    
+    The token is invalidated first, so the retry (and every later request)
+    gets a new one. Registered before record_rate_limit, which then sees
+    the retried response.
+    """
+    if response.status_code != 401:
+        return
+    token = response.request.headers.get("Authorization", "").split(" ")[-1]
+    token_cache = get_token_cache()
+    installation_id = token_cache.installation_for_token(token)
+    if installation_id is None:
+        return
+    
+    logger.warning(f"GitHub rejected the access token for installation {installation_id}, retrying with a new one")
+    token_cache.invalidate(installation_id, token)
+    request = response.request.copy()
+    request.headers["Authorization"] = f"token {token_cache.get_token(installation_id)}"
+    
+    # Release the rejected response's connection before reusing the pool
+    response.content
+    response.close()
+    retried = response.connection.send(request, **kwargs)
+    retried.history.append(response)
+    return retried
+
+
+def cache_principal(request) -> str:
+    """
+    HTTP cache scope of a GitHub request: its installation, so entries
+    survive token refreshes, or a hash of its credentials.
+    """
+    token = request.headers.get("Authorization", "").split(" ")[-1]
+    installation_id = get_token_cache().installation_for_token(token)
+    if installation_id is None:
+        return HTTPCache.auth_principal(request)
+    return f"installation:{installation_id}"
+
+
+def get_installation_token(installation_id: int) -> str:
+    """Helper function to get a cached access token for an installation."""
+    return get_token_cache().get_token(installation_id)
+
+
+def get_bot_login() -> Optional[str]:
+    """
+    Login of the App's bot user, looked up once per process.
+    
+    None while the lookup fails, so reviews go on without knowing which
+    comments are the bot's own.
+    """
+    global _bot_login
+    if _bot_login is None:
+        try:
+            _bot_login = get_token_cache().app_auth.get_bot_login()
+        except Exception as e:
+            logger.warning(f"Could not look up the App's bot login: {e}")
+    return _bot_login
+
+
+def get_installation_auth(installation_id: int) -> CachedInstallationAuth:
+    """PyGithub auth for an installation, backed by the shared token cache."""
+    return CachedInstallationAuth(get_token_cache(), installation_id)
+
+
 def get_github_client(installation_id: int) -> Github:
-    """Helper function to get GitHub client for an installation."""
-    auth = GitHubAppAuth()
-    return auth.get_installation_client(installation_id)
+    """
+    Helper function to get GitHub client for an installation.
+    
+    The client is reused across tasks, keeping its pooled HTTP session,
+    and picks up refreshed tokens from the cache transparently.
+    """
+    client = _clients.get(installation_id)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(installation_id)
+            if client is None:
+                add_response_hook(retry_rejected_token)
+                add_response_hook(record_rate_limit)
+                install_http_cache()
+                client = Github(
+                    auth=get_installation_auth(installation_id),
+                    base_url=settings.github_api_url,
+                    per_page=100,  # fewest pages for PR file listings
+                    pool_size=settings.github_http_pool_size
+                )
+                _clients[installation_id] = client
+    return client
@@ -0,0 +1,355 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import requests
+from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass, Requester
+from requests.structures import CaseInsensitiveDict
+
+from app.config import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+STATS_KEY = "github:http_cache:stats"
+
+# Request headers a cache key already covers, whatever Vary says
+KEYED_HEADERS = {"accept", "authorization"}
+
+
+@dataclass
+class CachedResponse:
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # Request header values named by the response's Vary, outside the key
+    vary: Optional[Dict[str, str]] = None
+
+
+class DiskCacheStore:
+    """Stores cached responses as files, evicting least recently used past max_bytes."""
+    
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = sum(f.stat().st_size for f in self.directory.glob("*.cache"))
+    
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{hashlib.sha256(key.encode()).hexdigest()}.cache"
+    
+    def get(self, key: str) -> Optional[CachedResponse]:
+        path = self._path(key)
+        try:
+            raw = path.read_bytes()
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        
+        header, _, body = raw.partition(b"\n")
+        meta = json.loads(header)
+        return CachedResponse(body=body, **meta)
+    
+    def put(self, key: str, entry: CachedResponse):
+        meta = {
+            "status": entry.status,
+            "headers": entry.headers,
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+            "vary": entry.vary
+        }
+        raw = json.dumps(meta).encode() + b"\n" + entry.body
+        if len(raw) > self.max_bytes:
+            return
+        
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(raw)
+        
+        with self._lock:
+            if path.exists():
+                self._size -= path.stat().st_size
+            os.replace(tmp_path, path)
+            self._size += len(raw)
+            
+            if self._size > self.max_bytes:
+                self._evict()
+    
+    def _evict(self):
+        # Other worker processes share the directory, so recount from disk
+        files = sorted(self.directory.glob("*.cache"), key=lambda f: f.stat().st_mtime)
+        self._size = sum(f.stat().st_size for f in files)
+        target = self.max_bytes * 0.9
+        
+        for f in files:
+            if self._size <= target:
+                break
+            try:
+                size = f.stat().st_size
+                f.unlink()
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+
+class RedisCacheStore:
+    """Stores cached responses in Redis, shared by all workers, evicting LRU past max_bytes."""
+    
+    prefix = "github:http_cache"
+    
+    def __init__(self, redis_client, max_bytes: int):
+        self.redis = redis_client
+        self.max_bytes = max_bytes
+    
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:entry:{hashlib.sha256(key.encode()).hexdigest()}"
+    
+    def get(self, key: str) -> Optional[CachedResponse]:
+        redis_key = self._key(key)
+        data = self.redis.hgetall(redis_key)
+        if not data:
+            return None
+        
+        self.redis.zadd(f"{self.prefix}:lru", {redis_key: time.time()})
+        meta = json.loads(data[b"meta"])
+        return CachedResponse(body=data[b"body"], **meta)
+    
+    def put(self, key: str, entry: CachedResponse):
+        meta = json.dumps({
+            "status": entry.status,
+            "headers": entry.headers,
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+            "vary": entry.vary
+        })
+        size = len(meta) + len(entry.body)
+        if size > self.max_bytes:
+            return
+        
+        redis_key = self._key(key)
+        previous = self.redis.hget(redis_key, "size")
+        
+        pipe = self.redis.pipeline()
+        pipe.hset(redis_key, mapping={"meta": meta, "body": entry.body, "size": size})
+        pipe.zadd(f"{self.prefix}:lru", {redis_key: time.time()})
+        pipe.incrby(f"{self.prefix}:bytes", size - int(previous or 0))
+        total = pipe.execute()[-1]
+        
+        while total > self.max_bytes:
+            oldest = self.redis.zpopmin(f"{self.prefix}:lru", 16)
+            if not oldest:
+                break
+            for evicted, _ in oldest:
+                evicted_size = int(self.redis.hget(evicted, "size") or 0)
+                self.redis.delete(evicted)
+                total = self.redis.decrby(f"{self.prefix}:bytes", evicted_size)
+
+
+class HTTPCache:
+    """
+    Conditional-request cache for GitHub API reads.
+    
+    Responses carrying an ETag or Last-Modified validator are stored with
+    their body. Later GETs for the same URL revalidate, and a 304 answer is
+    served from the stored body. GitHub does not count 304s against the
+    primary rate limit.
+    
+    The store may be shared across installations, so entries are keyed by
+    who made the request (`principal`, by default a hash of the
+    Authorization header) and only served to requests matching the
+    response's Vary headers.
+    """
+    
+    def __init__(self, store, stats_redis=None, principal: Optional[Callable] = None):
+        self.store = store
+        self.stats_redis = stats_redis
+        self.principal = principal or self.auth_principal
+        self.stats = {"hits": 0, "misses": 0, "stored": 0}
+        self._stats_lock = threading.Lock()
+    
+    @staticmethod
+    def auth_principal(request: requests.PreparedRequest) -> str:
+        authorization = request.headers.get("Authorization")
+        if not authorization:
+            return "anonymous"
+        return hashlib.sha256(authorization.encode()).hexdigest()
+    
+    def cache_key(self, request: requests.PreparedRequest) -> str:
+        # Different media types of one URL (JSON vs diff) are different entries
+        return f"{self.principal(request)} {request.url} {request.headers.get('Accept', '')}"
+    
+    @staticmethod
+    def vary_values(vary: str, request: requests.PreparedRequest) -> Optional[Dict[str, str]]:
+        """Values of the headers named by Vary, or None if the response can't be reused."""
+        names = {name.strip().lower() for name in vary.split(",") if name.strip()}
+        if "*" in names:
+            return None
+        return {name: request.headers.get(name, "") for name in sorted(names - KEYED_HEADERS)}
+    
+    def record(self, stat: str):
+        with self._stats_lock:
+            self.stats[stat] += 1
+        if self.stats_redis is not None:
+            try:
+                self.stats_redis.hincrby(STATS_KEY, stat, 1)
+            except Exception as e:
+                logger.debug(f"Could not record cache stat: {e}")
+
+
+class ConditionalCacheAdapter(requests.adapters.HTTPAdapter):
+    """requests adapter that revalidates cached GETs with conditional requests."""
+    
+    def __init__(self, cache: HTTPCache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+    
+    def send(self, request: requests.PreparedRequest, stream: bool = False, **kwargs) -> requests.Response:
+        if request.method != "GET" or stream:
+            return super().send(request, stream=stream, **kwargs)
+        
+        key = self.cache.cache_key(request)
+        entry = self.cache.store.get(key)
+        if entry is not None and entry.vary is not None:
+            if self.cache.vary_values(",".join(entry.vary), request) != entry.vary:
+                entry = None
+        if entry is not None:
+            if entry.etag:
+                request.headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                request.headers["If-Modified-Since"] = entry.last_modified
+        
+        response = super().send(request, stream=stream, **kwargs)
+        
+        if response.status_code == 304 and entry is not None:
+            self.cache.record("hits")
+            return self._from_cache(entry, response)
+        
+        self.cache.record("misses")
+        
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        vary = self.cache.vary_values(response.headers.get("Vary", ""), request)
+        if response.status_code == 200 and (etag or last_modified) and vary is not None:
+            self.cache.store.put(key, CachedResponse(
+                status=response.status_code,
+                headers=dict(response.headers),
+                body=response.content,
+                etag=etag,
+                last_modified=last_modified,
+                vary=vary
+            ))
+            self.cache.record("stored")
+        
+        return response
+    
+    @staticmethod
+    def _from_cache(entry: CachedResponse, not_modified: requests.Response) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry.status
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(entry.headers)
+        # Rate-limit and date headers must reflect the current request
+        for name, value in not_modified.headers.items():
+            if name.lower().startswith("x-ratelimit") or name.lower() == "date":
+                response.headers[name] = value
+        response.headers.pop("Content-Encoding", None)
+        response._content = entry.body
+        response.encoding = not_modified.encoding or "utf-8"
+        response.url = not_modified.url
+        response.request = not_modified.request
+        response.elapsed = not_modified.elapsed
+        response.connection = not_modified.connection
+        return response
+
+
+# Called with every GitHub response (after cache handling), e.g. to track rate limits
+_response_hooks: List[Callable] = []
+
+
+def add_response_hook(hook: Callable):
+    """Register a requests response hook for GitHub clients created afterwards."""
+    if hook not in _response_hooks:
+        _response_hooks.append(hook)
+
+
+def apply_response_hooks(session: requests.Session):
+    """Attach the registered response hooks to a requests session."""
+    session.hooks["response"].extend(_response_hooks)
+
+
+def _mount_cache(connection):
+    if settings.github_http_cache_enabled:
+        connection.adapter = ConditionalCacheAdapter(
+            get_http_cache(),
+            max_retries=connection.retry,
+            pool_connections=connection.pool_size,
+            pool_maxsize=connection.pool_size
+        )
+        connection.session.mount(f"{connection.protocol}://", connection.adapter)
+    
+    apply_response_hooks(connection.session)
+
+
+class CachingHTTPSConnectionClass(HTTPSRequestsConnectionClass):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _mount_cache(self)
+
+
+class CachingHTTPConnectionClass(HTTPRequestsConnectionClass):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _mount_cache(self)
+
+
+# Singleton instance
+_http_cache = None
+
+
+def get_http_cache() -> HTTPCache:
+    global _http_cache
+    if _http_cache is None:
+        import redis
+        from app.github_auth import cache_principal
+        redis_client = redis.Redis.from_url(settings.redis_url)
+        
+        if settings.github_http_cache_backend == "redis":
+            store = RedisCacheStore(redis_client, settings.github_http_cache_max_bytes)
+        else:
+            store = DiskCacheStore(settings.github_http_cache_dir, settings.github_http_cache_max_bytes)
+        
+        _http_cache = HTTPCache(store, stats_redis=redis_client, principal=cache_principal)
+    return _http_cache
+
+
+def install_http_cache():
+    """Route PyGithub requests from clients created afterwards through the cache and hooks."""
+    # Requester.injectConnectionClasses() would also disable connection
+    # persistence (it is meant for tests), so set the classes directly
+    Requester._Requester__httpConnectionClass = CachingHTTPConnectionClass
+    Requester._Requester__httpsConnectionClass = CachingHTTPSConnectionClass
+
+
+def get_cache_stats(redis_client) -> Dict[str, int]:
+    """Cluster-wide cache counters; every hit is a request that cost no rate limit."""
+    raw = redis_client.hgetall(STATS_KEY)
+    stats = {k.decode(): int(v) for k, v in raw.items()}
+    hits = stats.get("hits", 0)
+    total = hits + stats.get("misses", 0)
+    
+    return {
+        "hits": hits,
+        "misses": stats.get("misses", 0),
+        "stored": stats.get("stored", 0),
+        "hit_rate": hits / total if total else 0.0,
+        "rate_limit_saved": hits
+    }
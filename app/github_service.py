@@ -1,19 +1,255 @@
-from github import Github
-from typing import List, Dict, Optional
+import requests
+from github import Auth, Github, GithubException
+from github.Commit import Commit
+from github.File import File
+from github.PaginatedList import PaginatedList
+from github.PullRequest import PullRequest
+from github.Repository import Repository
+from typing import Callable, List, Dict, Optional, Tuple
+from app.config import get_settings
+from app.deadline import Deadline
+from app.diff_parser import FileSelector, UnifiedDiffParser, iter_lines
+from app.github_cache import apply_response_hooks
 import logging
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+DIFF_MEDIA_TYPE = "application/vnd.github.diff"
+
+# Metadata, head SHA and the bot's own inline comments in one round trip.
+# Patches are not available through GraphQL, so files still come from REST.
+PR_SNAPSHOT_QUERY = """
+query PullRequestSnapshot($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      title
+      body
+      state
+      createdAt
+      updatedAt
+      headRefOid
+      baseRefOid
+      author { login }
+      reviewThreads(last: 100) {
+        nodes {
+          comments(first: 100) {
+            nodes { path line body viewerDidAuthor }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+def format_graphql_snapshot(data: Dict) -> Dict:
+    """Convert a PR_SNAPSHOT_QUERY result to PR info and the bot's existing comments."""
+    pr = data["repository"]["pullRequest"]
+    
+    existing_comments = []
+    for thread in pr["reviewThreads"]["nodes"]:
+        for comment in thread["comments"]["nodes"]:
+            if comment["viewerDidAuthor"]:
+                existing_comments.append({
+                    "path": comment["path"],
+                    "line": comment["line"],
+                    "body": comment["body"]
+                })
+    
+    info = {
+        "title": pr["title"],
+        "description": pr["body"] or "",
+        "author": pr["author"]["login"] if pr["author"] else "ghost",
+        "head_sha": pr["headRefOid"],
+        "base_sha": pr["baseRefOid"],
+        "state": "open" if pr["state"] == "OPEN" else "closed",
+        "created_at": pr["createdAt"],
+        "updated_at": pr["updatedAt"]
+    }
+    return {"info": info, "existing_comments": existing_comments}
+
+
+def format_rest_comments(comments: List[Dict], bot_login: str) -> List[Dict]:
+    """The bot's comments among REST review comments, shaped like format_graphql_snapshot's."""
+    return [
+        {"path": c["path"], "line": c.get("line"), "body": c["body"]}
+        for c in comments
+        if (c.get("user") or {}).get("login") == bot_login
+    ]
+
+
+def dedupe_review_comments(comments: List[Dict], existing: List[Dict]) -> List[Dict]:
+    """
+    Drop comments the bot has already posted on the same line.
+    
+    A comment is a duplicate when its path, line and body match an existing
+    (or earlier new) comment, so the same finding on another line is kept.
+    """
+    seen = {(c["path"], c.get("line"), c["body"].strip()) for c in existing}
+    result = []
+    for comment in comments:
+        key = (comment["path"], comment.get("line"), comment["body"].strip())
+        if key in seen:
+            continue
+        seen.add(key)
+        result.append(comment)
+    
+    if len(result) < len(comments):
+        logger.info(f"Skipped {len(comments) - len(result)} comments already on the PR")
+    return result
+
+
+# Plain session for streamed diff downloads, which PyGithub would buffer
+_diff_session: Optional[requests.Session] = None
+
+
+def _get_diff_session() -> requests.Session:
+    global _diff_session
+    if _diff_session is None:
+        _diff_session = requests.Session()
+        apply_response_hooks(_diff_session)
+    return _diff_session
+
+
+class ReviewContext:
+    """
+    Repository, pull request and commits used during one review.
+    
+    Each object is fetched from GitHub at most once and shared by every
+    GitHubService call for the same PR.
+    """
+    
+    def __init__(self, repo: Repository, pr_number: int):
+        self.repo = repo
+        self.pr_number = pr_number
+        self._pr: Optional[PullRequest] = None
+        self._commits: Dict[str, Commit] = {}
+    
+    @property
+    def pr(self) -> PullRequest:
+        if self._pr is None:
+            self._pr = self.repo.get_pull(self.pr_number)
+        return self._pr
+    
+    def get_commit(self, sha: str) -> Commit:
+        if sha not in self._commits:
+            self._commits[sha] = self.repo.get_commit(sha)
+        return self._commits[sha]
 
 
 class GitHubService:
-    def __init__(self, client: Github):
+    def __init__(self, client: Github, auth: Optional[Auth.Auth] = None, bot_login: Optional[str] = None):
+        # Same auth as the client, for requests made outside PyGithub
         self.client = client
+        self.auth = auth
+        # Login of the bot's own comments; None leaves existing comments unknown
+        self.bot_login = bot_login
+        self._repos: Dict[str, Repository] = {}
+        self._contexts: Dict[Tuple[str, int], ReviewContext] = {}
+    
+    def _get_repo(self, repo_name: str) -> Repository:
+        # Lazy repositories build URLs from the name without a GET /repos call
+        if repo_name not in self._repos:
+            self._repos[repo_name] = self.client.get_repo(repo_name, lazy=True)
+        return self._repos[repo_name]
+    
+    def review_context(self, repo_name: str, pr_number: int) -> ReviewContext:
+        """Get the shared context for a PR, creating it on first use."""
+        key = (repo_name, pr_number)
+        if key not in self._contexts:
+            self._contexts[key] = ReviewContext(self._get_repo(repo_name), pr_number)
+        return self._contexts[key]
+    
+    @staticmethod
+    def _format_pr_info(pr: PullRequest) -> Dict:
+        return {
+            "title": pr.title,
+            "description": pr.body or "",
+            "author": pr.user.login,
+            "head_sha": pr.head.sha,
+            "base_sha": pr.base.sha,
+            "state": pr.state,
+            "created_at": pr.created_at.isoformat(),
+            "updated_at": pr.updated_at.isoformat()
+        }
+    
+    @staticmethod
+    def _format_files(
+        files: PaginatedList,
+        max_files: int,
+        skip: Optional[Callable[[Dict], bool]] = None
+    ) -> List[Dict]:
+        result = []
+        for file in files:
+            if len(result) >= max_files:
+                break
+            
+            file_data = {
+                "filename": file.filename,
+                "status": file.status,
+                "additions": file.additions,
+                "deletions": file.deletions,
+                "changes": file.changes,
+                "patch": file.patch,
+                "sha": file.sha
+            }
+            if skip is None or not skip(file_data):
+                result.append(file_data)
+        
+        return result
+    
+    def get_pr_diff_files(
+        self,
+        repo_name: str,
+        pr_number: int,
+        max_files: int = 10,
+        skip: Optional[Callable[[Dict], bool]] = None
+    ) -> List[Dict]:
+        """
+        Get changed files from the PR's unified diff.
+        
+        The diff is fetched in one request and parsed as it streams, so
+        every file is considered and the most substantial max_files are
+        kept, leaving out files `skip` returns True for. Falls back to the
+        files API when GitHub refuses to render the diff (too large).
+        """
+        try:
+            headers = {"Accept": DIFF_MEDIA_TYPE}
+            if self.auth is not None:
+                headers["Authorization"] = f"{self.auth.token_type} {self.auth.token}"
+            
+            url = f"{settings.github_api_url.rstrip('/')}/repos/{repo_name}/pulls/{pr_number}"
+            with _get_diff_session().get(url, headers=headers, stream=True, timeout=60) as response:
+                if response.status_code == 406:
+                    logger.warning(f"Diff for PR #{pr_number} too large to render, using files API")
+                    return self.get_pr_files(repo_name, pr_number, max_files, skip)
+                response.raise_for_status()
+                
+                parser = UnifiedDiffParser(max_patch_size=settings.max_windowed_diff_size)
+                selector = FileSelector(max_files, skip)
+                for line in iter_lines(response.iter_content(chunk_size=64 * 1024)):
+                    diff_file = parser.feed(line)
+                    if diff_file is not None:
+                        selector.add(diff_file)
+                last = parser.close()
+                if last is not None:
+                    selector.add(last)
+            
+            logger.info(
+                f"Selected {len(selector.selected())} of {selector.total} files "
+                f"from PR #{pr_number} diff ({selector.skipped} without reviewable patch or skipped)"
+            )
+            return [f.to_dict() for f in selector.selected()]
+        except Exception as e:
+            logger.error(f"Error getting PR diff files: {e}")
+            raise
     
     def get_pr_diff(self, repo_name: str, pr_number: int) -> str:
         """Get the full diff for a PR."""
         try:
-            repo = self.client.get_repo(repo_name)
-            pr = repo.get_pull(pr_number)
+            pr = self.review_context(repo_name, pr_number).pr
             
             # Get the diff using the API
             files = pr.get_files()
@@ -31,44 +267,40 @@ class GitHubService:
             logger.error(f"Error getting PR diff: {e}")
             raise
     
-    def get_pr_files(self, repo_name: str, pr_number: int, max_files: int = 10) -> List[Dict]:
-        """Get changed files in a PR."""
+    def get_pr_files(
+        self,
+        repo_name: str,
+        pr_number: int,
+        max_files: int = 10,
+        skip: Optional[Callable[[Dict], bool]] = None
+    ) -> List[Dict]:
+        """Get the first max_files changed files in a PR that `skip` doesn't leave out."""
         try:
-            repo = self.client.get_repo(repo_name)
-            pr = repo.get_pull(pr_number)
-            
-            files = pr.get_files()
-            
-            result = []
-            for idx, file in enumerate(files):
-                if idx >= max_files:
-                    break
-                
-                result.append({
-                    "filename": file.filename,
-                    "status": file.status,
-                    "additions": file.additions,
-                    "deletions": file.deletions,
-                    "changes": file.changes,
-                    "patch": file.patch,
-                    "sha": file.sha
-                })
-            
-            return result
+            pr = self.review_context(repo_name, pr_number).pr
+            return self._format_files(pr.get_files(), max_files, skip)
         except Exception as e:
             logger.error(f"Error getting PR files: {e}")
             raise
     
-    def get_file_content(self, repo_name: str, file_path: str, ref: str) -> str:
-        """Get the content of a file at a specific commit."""
+    def get_file_content(self, repo_name: str, file_path: str, ref: str) -> Optional[str]:
+        """
+        Get the content of a file at a specific commit.
+        
+        None if there is no such file at ref, "" if it couldn't be read.
+        """
         try:
-            repo = self.client.get_repo(repo_name)
-            content = repo.get_contents(file_path, ref=ref)
+            content = self._get_repo(repo_name).get_contents(file_path, ref=ref)
             
             if isinstance(content, list):
                 return ""  # It's a directory
             
             return content.decoded_content.decode('utf-8')
+        except GithubException as e:
+            if e.status != 404:
+                logger.warning(f"Could not get file content for {file_path}: {e}")
+                return ""
+            logger.debug(f"No {file_path} at {ref}")
+            return None
         except Exception as e:
             logger.warning(f"Could not get file content for {file_path}: {e}")
             return ""
@@ -84,14 +316,14 @@ class GitHubService:
     ):
         """Post a review comment on a specific line or file."""
         try:
-            repo = self.client.get_repo(repo_name)
-            pr = repo.get_pull(pr_number)
+            context = self.review_context(repo_name, pr_number)
+            pr = context.pr
             
             if line:
                 # Inline comment on specific line
                 pr.create_review_comment(
                     body=body,
-                    commit=repo.get_commit(commit_id),
+                    commit=context.get_commit(commit_id),
                     path=path,
                     line=line
                 )
@@ -119,8 +351,8 @@ class GitHubService:
         event can be: APPROVE, REQUEST_CHANGES, or COMMENT
         """
         try:
-            repo = self.client.get_repo(repo_name)
-            pr = repo.get_pull(pr_number)
+            context = self.review_context(repo_name, pr_number)
+            pr = context.pr
             
             # Format comments for GitHub API
             review_comments = []
@@ -136,7 +368,7 @@ class GitHubService:
             # Create the review
             if review_comments:
                 pr.create_review(
-                    commit=repo.get_commit(commit_id),
+                    commit=context.get_commit(commit_id),
                     body=body,
                     event=event,
                     comments=review_comments
@@ -153,19 +385,106 @@ class GitHubService:
     def get_pr_info(self, repo_name: str, pr_number: int) -> Dict:
         """Get PR metadata."""
         try:
-            repo = self.client.get_repo(repo_name)
-            pr = repo.get_pull(pr_number)
-            
-            return {
-                "title": pr.title,
-                "description": pr.body or "",
-                "author": pr.user.login,
-                "head_sha": pr.head.sha,
-                "base_sha": pr.base.sha,
-                "state": pr.state,
-                "created_at": pr.created_at.isoformat(),
-                "updated_at": pr.updated_at.isoformat()
-            }
+            return self._format_pr_info(self.review_context(repo_name, pr_number).pr)
         except Exception as e:
             logger.error(f"Error getting PR info: {e}")
             raise
+    
+    def get_pr_graphql_snapshot(self, repo_name: str, pr_number: int) -> Dict:
+        """Get PR metadata and the bot's existing inline comments with one GraphQL query."""
+        owner, name = repo_name.split("/", 1)
+        requester = self._get_repo(repo_name)._requester
+        _, response = requester.requestJsonAndCheck(
+            "POST",
+            "/graphql",
+            input={
+                "query": PR_SNAPSHOT_QUERY,
+                "variables": {"owner": owner, "name": name, "number": pr_number}
+            }
+        )
+        if response.get("errors"):
+            raise GithubException(200, response, None)
+        return format_graphql_snapshot(response["data"])
+    
+    def get_bot_review_comments(self, repo_name: str, pr_number: int) -> List[Dict]:
+        """Get the bot's existing inline comments on a PR through REST."""
+        if not self.bot_login:
+            return []
+        repo = self._get_repo(repo_name)
+        comments = []
+        page = 1
+        while True:
+            _, batch = repo._requester.requestJsonAndCheck(
+                "GET",
+                f"{repo.url}/pulls/{pr_number}/comments",
+                parameters={"per_page": 100, "page": page}
+            )
+            comments.extend(batch)
+            if len(batch) < 100:
+                break
+            page += 1
+        return format_rest_comments(comments, self.bot_login)
+    
+    def get_pr_snapshot(
+        self,
+        repo_name: str,
+        pr_number: int,
+        max_files: int = 10,
+        skip: Optional[Callable[[Dict], bool]] = None
+    ) -> Dict:
+        """
+        Get PR metadata and changed files together.
+        
+        Files `skip` returns True for are left out before max_files are
+        chosen, so they don't take the place of files worth reviewing.
+        Costs one request for the PR plus one per page of files, or a
+        single diff request when GITHUB_DIFF_MODE is "unified". With
+        GITHUB_SNAPSHOT_API "graphql" the PR request is a GraphQL query
+        that also returns the bot's existing comments; otherwise they cost
+        one more request per page of review comments.
+        """
+        try:
+            if settings.github_snapshot_api == "graphql":
+                snapshot = self.get_pr_graphql_snapshot(repo_name, pr_number)
+                # List files from the URL so no REST fetch of the PR is needed
+                repo = self._get_repo(repo_name)
+                files = PaginatedList(File, repo._requester, f"{repo.url}/pulls/{pr_number}/files", None)
+            else:
+                pr = self.review_context(repo_name, pr_number).pr
+                snapshot = {
+                    "info": self._format_pr_info(pr),
+                    "existing_comments": self.get_bot_review_comments(repo_name, pr_number)
+                }
+                files = pr.get_files()
+            
+            if settings.github_diff_mode == "unified":
+                snapshot["files"] = self.get_pr_diff_files(repo_name, pr_number, max_files, skip)
+            else:
+                snapshot["files"] = self._format_files(files, max_files, skip)
+            
+            return snapshot
+        except Exception as e:
+            logger.error(f"Error getting PR snapshot: {e}")
+            raise
+
+
+def get_github_service(installation_id: int, deadline: Optional[Deadline] = None):
+    """
+    Get the GitHub service for an installation.
+    
+    GITHUB_CLIENT_BACKEND selects PyGithub or the async httpx client; both
+    expose the same methods and return the same shapes. On the httpx
+    backend each call is bounded by the time left before `deadline`;
+    PyGithub clients are shared per installation and keep their
+    per-request timeout.
+    """
+    if settings.github_client_backend == "httpx":
+        from app.github_async import BlockingGitHubService, get_async_github_service
+        return BlockingGitHubService(get_async_github_service(installation_id), deadline)
+    
+    from app.github_auth import get_bot_login, get_github_client, get_installation_auth
+    return GitHubService(
+        get_github_client(installation_id),
+        get_installation_auth(installation_id),
+        bot_login=get_bot_login()
+    )
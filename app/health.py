@@ -0,0 +1,168 @@
+import asyncio
+import time
+from typing import Callable, Dict, Iterable, Optional
+from app.config import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+def check_database() -> Dict:
+    from sqlalchemy import text
+    from app.database import engine
+    
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return {}
+
+
+def check_redis() -> Dict:
+    import redis
+    
+    client = redis.Redis.from_url(
+        settings.redis_url,
+        socket_timeout=settings.health_probe_timeout,
+        socket_connect_timeout=settings.health_probe_timeout
+    )
+    try:
+        client.ping()
+    finally:
+        client.close()
+    return {}
+
+
+def check_celery_workers() -> Dict:
+    from app.celery_app import celery_app
+    
+    replies = celery_app.control.inspect(timeout=min(1.0, settings.health_probe_timeout)).ping() or {}
+    if not replies:
+        raise RuntimeError("no workers replied")
+    return {"workers": len(replies)}
+
+
+class HealthMonitor:
+    """
+    Runs dependency probes in the background and serves the last results.
+    
+    Health endpoints read the cached snapshot, so however often an
+    orchestrator polls, each dependency sees one probe per interval.
+    Probes are blocking callables returning a dict of details; they run in
+    threads, and one that raises or exceeds the timeout is reported down.
+    """
+    
+    def __init__(
+        self,
+        checks: Dict[str, Callable[[], Dict]],
+        required: Iterable[str],
+        interval: float = 10,
+        timeout: float = 3
+    ):
+        self.checks = checks
+        self.required = set(required)
+        self.interval = interval
+        self.timeout = timeout
+        self.results: Dict[str, Dict] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    async def _probe(self, name: str, check: Callable[[], Dict]) -> Dict:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            details = await asyncio.wait_for(loop.run_in_executor(None, check), self.timeout)
+            result = {"status": "up", **details}
+        except asyncio.TimeoutError:
+            result = {"status": "down", "error": f"timed out after {self.timeout}s"}
+        except Exception as e:
+            result = {"status": "down", "error": str(e) or type(e).__name__}
+        
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        result["checked_at"] = time.time()
+        if result["status"] == "down":
+            logger.warning(f"Health probe {name} failed: {result['error']}")
+        return result
+    
+    async def refresh(self):
+        """Run every probe concurrently and store the results."""
+        names = list(self.checks)
+        results = await asyncio.gather(*(self._probe(name, self.checks[name]) for name in names))
+        self.results = dict(zip(names, results))
+    
+    async def run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def snapshot(self) -> Dict:
+        """
+        Overall status and per-check results.
+        
+        "healthy" when every probe is up, "degraded" when only optional
+        probes are down, and "unhealthy" when a required probe is down,
+        missing, or left over from three or more rounds ago (e.g. the loop
+        is stuck).
+        """
+        now = time.time()
+        checks = {}
+        for name in self.checks:
+            result = dict(self.results.get(name) or {"status": "down", "error": "not probed yet"})
+            if "checked_at" in result:
+                age = now - result["checked_at"]
+                if age > 3 * self.interval + self.timeout:
+                    result.update(status="down", error=f"stale result ({age:.0f}s old)")
+                result["age_seconds"] = round(age, 1)
+                del result["checked_at"]
+            checks[name] = result
+        
+        down = {name for name, result in checks.items() if result["status"] != "up"}
+        if down & self.required:
+            status = "unhealthy"
+        elif down:
+            status = "degraded"
+        else:
+            status = "healthy"
+        return {"status": status, "checks": checks}
+    
+    def status_code(self, snapshot: Dict) -> int:
+        return 503 if snapshot["status"] == "unhealthy" else 200
+
+
+# Singleton instance
+_health_monitor = None
+
+def get_health_monitor() -> HealthMonitor:
+    """
+    The API's health monitor.
+    
+    The embedding model is loaded by workers, not the API; its load state
+    is exported with their metrics (embedding_model_loaded).
+    """
+    global _health_monitor
+    if _health_monitor is None:
+        required = ["database", "redis"]
+        if settings.health_require_workers:
+            required.append("celery")
+        _health_monitor = HealthMonitor(
+            checks={
+                "database": check_database,
+                "redis": check_redis,
+                "celery": check_celery_workers,
+            },
+            required=required,
+            interval=settings.health_probe_interval,
+            timeout=settings.health_probe_timeout
+        )
+    return _health_monitor
@@ -1,6 +1,7 @@
-from anthropic import Anthropic
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from app.config import get_settings
+from app.deadline import Deadline
+from app.metrics import record_llm_usage
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,7 +10,9 @@ settings = get_settings()
 
 class LLMService:
     def __init__(self):
-        self.client = Anthropic(api_key=settings.anthropic_api_key)
+        from anthropic import Anthropic
+        
+        self.client = Anthropic(api_key=settings.anthropic_api_key, base_url=settings.anthropic_base_url)
         self.model = settings.llm_model
     
     async def generate_review(
@@ -17,7 +20,8 @@ class LLMService:
         code_diff: str,
         file_path: str,
         context: Optional[str] = None,
-        user_memory: Optional[str] = None
+        user_memory: Optional[str] = None,
+        deadline: Optional[Deadline] = None
     ) -> Dict[str, any]:
         """
         Generate a code review using Claude Sonnet 4.5.
@@ -27,10 +31,118 @@ class LLMService:
             file_path: Path to the file being reviewed
             context: Additional context from RAG retrieval
             user_memory: User-specific memory/preferences
+            deadline: Review budget the call's timeout is derived from
             
         Returns:
             Dictionary with review comments and suggestions
         """
+        system_prompt, user_prompt = self._review_prompts(code_diff, file_path, context, user_memory)
+        
+        try:
+            client, options = self._bounded(self.client, deadline)
+            response = client.messages.create(
+                model=self.model,
+                max_tokens=4096,
+                system=system_prompt,
+                messages=[
+                    {"role": "user", "content": user_prompt}
+                ],
+                **options
+            )
+            record_llm_usage(self.model, response.usage)
+            
+            return self.parse_review(response.content[0].text)
+        
+        except Exception as e:
+            logger.error(f"Error generating review: {e}")
+            raise
+    
+    async def generate_reviews(
+        self,
+        requests: List[Dict],
+        concurrency: int = 4,
+        deadline: Optional[Deadline] = None,
+        return_exceptions: bool = False
+    ) -> List[Dict]:
+        """
+        Generate several reviews concurrently.
+        
+        Each request holds generate_review's arguments. At most `concurrency`
+        calls are in flight, each timed out from what is left of `deadline`
+        when it starts; results are returned in request order. With
+        return_exceptions, failed calls are returned as their exception
+        instead of failing the others.
+        """
+        import asyncio
+        from anthropic import AsyncAnthropic
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async with AsyncAnthropic(api_key=settings.anthropic_api_key, base_url=settings.anthropic_base_url) as client:
+            async def review(request: Dict) -> Dict:
+                system_prompt, user_prompt = self._review_prompts(**request)
+                async with semaphore:
+                    bounded, options = self._bounded(client, deadline)
+                    response = await bounded.messages.create(
+                        model=self.model,
+                        max_tokens=4096,
+                        system=system_prompt,
+                        messages=[
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        **options
+                    )
+                record_llm_usage(self.model, response.usage)
+                return self.parse_review(response.content[0].text)
+            
+            try:
+                return list(await asyncio.gather(
+                    *(review(request) for request in requests),
+                    return_exceptions=return_exceptions
+                ))
+            except Exception as e:
+                logger.error(f"Error generating reviews: {e}")
+                raise
+    
+    def _bounded(self, client, deadline: Optional[Deadline]) -> Tuple[object, Dict]:
+        """
+        Client and extra create() arguments for a call within the deadline.
+        
+        The timeout is what is left of the deadline, at most
+        LLM_REQUEST_TIMEOUT. SDK retries are off then: a retry would start
+        past the budget the timeout was derived from, and the task retries
+        instead.
+        """
+        if deadline is None:
+            return client, {}
+        return client.with_options(max_retries=0), {"timeout": deadline.timeout(settings.llm_request_timeout)}
+    
+    def review_params(
+        self,
+        code_diff: str,
+        file_path: str,
+        context: Optional[str] = None,
+        user_memory: Optional[str] = None
+    ) -> Dict:
+        """Messages API parameters of a review, e.g. for a Message Batches request."""
+        system_prompt, user_prompt = self._review_prompts(code_diff, file_path, context, user_memory)
+        return {
+            "model": self.model,
+            "max_tokens": 4096,
+            "system": system_prompt,
+            "messages": [
+                {"role": "user", "content": user_prompt}
+            ]
+        }
+    
+    def _review_prompts(
+        self,
+        code_diff: str,
+        file_path: str,
+        context: Optional[str] = None,
+        user_memory: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """System and user prompt for reviewing one diff."""
         # Build the prompt
         system_prompt = """You are an expert code reviewer with deep knowledge of software engineering best practices.
 Your role is to provide constructive, actionable feedback on pull requests.
@@ -85,36 +197,20 @@ Format your response as JSON with the following structure:
 }
 """
         
+        return system_prompt, user_prompt
+    
+    def parse_review(self, review_text: str) -> Dict[str, any]:
+        """Parse a review as JSON, falling back to the raw text."""
+        import json
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=4096,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": user_prompt}
-                ]
-            )
-            
-            # Parse the response
-            review_text = response.content[0].text
-            
-            # Try to parse as JSON, fallback to text if fails
-            import json
-            try:
-                review_data = json.loads(review_text)
-            except json.JSONDecodeError:
-                review_data = {
-                    "overall_assessment": review_text[:200],
-                    "issues": [],
-                    "positive_notes": [],
-                    "raw_text": review_text
-                }
-            
-            return review_data
-            
-        except Exception as e:
-            logger.error(f"Error generating review: {e}")
-            raise
+            return json.loads(review_text)
+        except json.JSONDecodeError:
+            return {
+                "overall_assessment": review_text[:200],
+                "issues": [],
+                "positive_notes": [],
+                "raw_text": review_text
+            }
     
     async def summarize_pr(
         self,
@@ -142,6 +238,7 @@ Provide a concise summary of what this PR does and its potential impact.
                     {"role": "user", "content": prompt}
                 ]
             )
+            record_llm_usage(self.model, response.usage)
             
             return response.content[0].text
             
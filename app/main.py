@@ -1,11 +1,12 @@
 from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List, Dict, Any
 from app.config import get_settings
 from app.database import init_db
-from app.tasks import process_pr_review, process_review_command
+from app.admission import AdmissionRejected, get_admission_controller
+from app.task_signatures import process_pr_review, process_review_command, ingest_feedback_batch
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -27,6 +28,13 @@ class ReviewRequest(BaseModel):
     repo: str
     pr_number: int
     installation_id: int
+    head_sha: Optional[str] = None
+
+
+class ReviewBatchRequest(BaseModel):
+    """Request model for bulk PR reviews."""
+    reviews: List[ReviewRequest]
+    message_batches: Optional[bool] = None  # defaults to BULK_REVIEWS_USE_MESSAGE_BATCHES
 
 
 class ReviewCommandRequest(BaseModel):
@@ -38,11 +46,61 @@ class ReviewCommandRequest(BaseModel):
     comment_body: str
 
 
+class FeedbackRecord(BaseModel):
+    """A single piece of historical reviewer feedback."""
+    user_id: str
+    repository_id: str
+    feedback_type: str
+    context: Dict[str, Any]
+    created_at: Optional[str] = None
+    id: Optional[str] = None  # source system's id, e.g. the review comment's
+
+
+class FeedbackBatchRequest(BaseModel):
+    """Request model for bulk feedback ingestion."""
+    records: List[FeedbackRecord]
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup."""
     init_db()
     logger.info("Database initialized")
+    
+    from app.health import get_health_monitor
+    get_health_monitor().start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the background health probes and close shared Redis clients."""
+    from app.health import get_health_monitor
+    await get_health_monitor().stop()
+    
+    global _async_redis
+    if _async_redis is not None:
+        await _async_redis.aclose()
+        _async_redis = None
+
+
+# Redis clients shared by all requests, each with its own connection pool
+_redis = None
+_async_redis = None
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(settings.redis_url)
+    return _redis
+
+
+def get_async_redis():
+    global _async_redis
+    if _async_redis is None:
+        import redis.asyncio
+        _async_redis = redis.asyncio.Redis.from_url(settings.redis_url)
+    return _async_redis
 
 
 def verify_api_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> bool:
@@ -52,6 +110,38 @@ def verify_api_token(credentials: HTTPAuthorizationCredentials = Depends(securit
     return True
 
 
+def admit_review(pr_data: dict, queue: str):
+    """
+    Reserve an in-flight slot for a review, or answer 429.
+    
+    The review's task id is chosen here so the slot, the progress events
+    and the task share one id.
+    """
+    from celery.utils import uuid
+    
+    pr_data["review_id"] = uuid()
+    try:
+        get_admission_controller().admit(pr_data, queue=queue)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected review of {pr_data['repository']}#{pr_data['pr_number']}: {e}")
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+def enqueue_admitted(task, pr_data: dict, **options):
+    """Queue an admitted review under its review_id, undoing the admission if that fails."""
+    try:
+        return task.apply_async(args=[pr_data], task_id=pr_data["review_id"], **options)
+    except Exception:
+        admission = get_admission_controller()
+        admission.release(pr_data)
+        admission.forget(pr_data)
+        raise
+
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
@@ -64,12 +154,33 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Detailed health check."""
-    return {
-        "status": "healthy",
-        "database": "connected",
-        "celery": "running"
-    }
+    """
+    Readiness check from cached background probes.
+    
+    Returns 503 while a required dependency (database, Redis) is down so a
+    load balancer stops routing to this node; degraded optional checks
+    still return 200.
+    """
+    from app.health import get_health_monitor
+    
+    monitor = get_health_monitor()
+    snapshot = monitor.snapshot()
+    return JSONResponse(snapshot, status_code=monitor.status_code(snapshot))
+
+
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness check: the process is up and serving requests."""
+    return {"status": "alive"}
+
+
+@app.get("/metrics")
+async def metrics(authorized: bool = Depends(verify_api_token)):
+    """Prometheus metrics of the API process (workers export their own)."""
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+    from app.metrics import metrics_registry
+    
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.post("/api/review")
@@ -92,18 +203,131 @@ async def trigger_review(
         "repository_id": f"{request.owner}/{request.repo}",  # Simplified
         "installation_id": request.installation_id,
     }
+    if request.head_sha:
+        pr_data["head_sha"] = request.head_sha
+    
+    # Repeats for an already queued head get the original task back
+    admission = get_admission_controller()
+    duplicate = admission.duplicate_of(pr_data)
+    if duplicate:
+        logger.info(f"Duplicate review request, already queued as {duplicate}")
+        return JSONResponse({
+            "status": "duplicate",
+            "task_id": duplicate,
+            "pr_number": pr_data["pr_number"],
+            "events_url": f"/api/review/{duplicate}/events"
+        })
+    
+    admit_review(pr_data, queue="reviews")
+    
+    # Later triggers for the same PR replace this one; waiting out the
+    # debounce window lets a burst of pushes collapse into one review
+    from app.review_coalescer import get_review_coalescer
+    pr_data["review_generation"] = get_review_coalescer().register(
+        pr_data["repository"], pr_data["pr_number"]
+    )
     
     # Enqueue review task
-    task = process_pr_review.delay(pr_data)
+    task = enqueue_admitted(
+        process_pr_review, pr_data,
+        countdown=settings.review_debounce_seconds
+    )
     logger.info(f"Enqueued PR review task: {task.id}")
     
     return JSONResponse({
         "status": "queued",
         "task_id": task.id,
-        "pr_number": pr_data["pr_number"]
+        "pr_number": pr_data["pr_number"],
+        "events_url": f"/api/review/{task.id}/events"
+    })
+
+
+@app.post("/api/review/batch")
+async def trigger_review_batch(
+    request: ReviewBatchRequest,
+    authorized: bool = Depends(verify_api_token)
+):
+    """
+    Review many PRs, e.g. to backfill open PRs across an organization.
+    
+    Reviews run on the bulk queue, started at most
+    BATCH_REVIEWS_PER_MINUTE per installation; poll
+    /api/review/batch/{batch_id} for progress. PRs already queued for the
+    same head, or with any review pending, are left alone and listed as
+    skipped rather than replaced by a bulk review.
+    """
+    if len(request.reviews) > settings.max_batch_reviews:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.max_batch_reviews} reviews per batch"
+        )
+    
+    from celery.utils import uuid
+    from app.review_batch import enqueue_review_batch
+    from app.review_coalescer import get_review_coalescer
+    
+    admission = get_admission_controller()
+    coalescer = get_review_coalescer()
+    pr_data_list = []
+    skipped = []
+    for review in request.reviews:
+        pr_data = {
+            "pr_number": review.pr_number,
+            "repository": f"{review.owner}/{review.repo}",
+            "repository_id": f"{review.owner}/{review.repo}",
+            "installation_id": review.installation_id,
+            "review_id": uuid(),
+        }
+        if review.head_sha:
+            pr_data["head_sha"] = review.head_sha
+        
+        duplicate = admission.duplicate_of(pr_data)
+        if duplicate:
+            skipped.append({
+                "repository": pr_data["repository"], "pr_number": review.pr_number,
+                "reason": "duplicate", "task_id": duplicate
+            })
+            continue
+        
+        # Never replace a live review (or an earlier bulk one) still on its way
+        generation = coalescer.register_if_idle(pr_data["repository"], pr_data["pr_number"])
+        if generation is None:
+            skipped.append({
+                "repository": pr_data["repository"], "pr_number": review.pr_number,
+                "reason": "review pending"
+            })
+            continue
+        pr_data["review_generation"] = generation
+        admission.remember(pr_data)
+        pr_data_list.append(pr_data)
+    
+    message_batches = request.message_batches
+    if message_batches is None:
+        message_batches = settings.bulk_reviews_use_message_batches
+    batch_id = None
+    if pr_data_list:
+        batch_id = enqueue_review_batch(pr_data_list, message_batches=message_batches).id
+    
+    return JSONResponse({
+        "status": "queued" if pr_data_list else "skipped",
+        "batch_id": batch_id,
+        "reviews": len(pr_data_list),
+        "skipped": skipped,
+        "message_batches": message_batches
     })
 
 
+@app.get("/api/review/batch/{batch_id}")
+async def review_batch_status(batch_id: str, authorized: bool = Depends(verify_api_token)):
+    """Aggregate progress of a review batch."""
+    from app.review_batch import batch_progress
+    
+    progress = batch_progress(batch_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired batch")
+    return progress
+
+
 @app.post("/api/review/command")
 async def trigger_review_command(
     request: ReviewCommandRequest,
@@ -125,17 +349,93 @@ async def trigger_review_command(
         "commenter": "github-actions",  # From GitHub Actions
     }
     
+    admit_review(review_data, queue="interactive")
+    
+    # Explicit commands run immediately but still replace pending reviews
+    from app.review_coalescer import get_review_coalescer
+    review_data["review_generation"] = get_review_coalescer().register(
+        review_data["repository"], review_data["pr_number"]
+    )
+    
     # Enqueue review command task
-    task = process_review_command.delay(review_data)
+    task = enqueue_admitted(process_review_command, review_data)
     logger.info(f"Enqueued review command task: {task.id}")
     
     return JSONResponse({
         "status": "queued",
         "task_id": task.id,
-        "pr_number": review_data["pr_number"]
+        "pr_number": review_data["pr_number"],
+        "events_url": f"/api/review/{task.id}/events"
     })
 
 
+@app.get("/api/review/{review_id}/events")
+async def review_events(review_id: str, authorized: bool = Depends(verify_api_token)):
+    """
+    Stream a review's progress as Server-Sent Events.
+    
+    review_id is the task_id returned when the review was queued. Events
+    already published are replayed first; the stream ends once the review
+    is posted, superseded or failed.
+    """
+    from app.progress import stream_progress
+    
+    return StreamingResponse(
+        stream_progress(
+            get_async_redis(),
+            review_id,
+            timeout=settings.progress_stream_timeout
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/feedback/batch")
+async def ingest_feedback(
+    request: FeedbackBatchRequest,
+    authorized: bool = Depends(verify_api_token)
+):
+    """
+    Bulk-ingest dismissed/accepted suggestion feedback into user memory.
+    
+    Records are embedded and stored in the background; poll
+    /task/{task_id} for progress.
+    """
+    if len(request.records) > settings.max_feedback_records_per_request:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.max_feedback_records_per_request} records per request"
+        )
+    
+    logger.info(f"Feedback ingestion requested for {len(request.records)} records")
+    
+    task = ingest_feedback_batch.delay([record.model_dump() for record in request.records])
+    logger.info(f"Enqueued feedback ingestion task: {task.id}")
+    
+    return JSONResponse({
+        "status": "queued",
+        "task_id": task.id,
+        "records": len(request.records)
+    })
+
+
+@app.get("/api/github/cache")
+async def github_cache_stats(authorized: bool = Depends(verify_api_token)):
+    """GitHub conditional-request cache hit rate and rate limit saved."""
+    from app.github_cache import get_cache_stats
+    
+    return get_cache_stats(get_redis())
+
+
+@app.get("/api/github/rate-limits")
+async def github_rate_limits(authorized: bool = Depends(verify_api_token)):
+    """Remaining GitHub API budget per installation, as last reported by GitHub."""
+    from app.rate_limit import get_rate_limit_governor
+    
+    return {"installations": get_rate_limit_governor().all_statuses()}
+
+
 @app.get("/task/{task_id}")
 async def get_task_status(task_id: str):
     """Check the status of a review task."""
@@ -146,5 +446,6 @@ async def get_task_status(task_id: str):
     return {
         "task_id": task_id,
         "status": task.status,
+        "progress": task.info if task.status == "PROGRESS" else None,
         "result": task.result if task.ready() else None
     }
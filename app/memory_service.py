@@ -1,14 +1,41 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime
 from app.database import UserMemory, PRReview
 from app.embedding_service import get_embedding_service
+import hashlib
 import logging
 import json
 
 logger = logging.getLogger(__name__)
 
 
+def feedback_dedupe_key(
+    user_id: str,
+    repository_id: str,
+    feedback_type: str,
+    context: Dict,
+    created_at: Optional[str] = None,
+    record_id: Optional[str] = None
+) -> str:
+    """
+    Stable idempotency key for a feedback record.
+    
+    A client-supplied record id identifies the record on its own (within
+    the repository); otherwise identical feedback given at different times
+    gets different keys through created_at.
+    """
+    if record_id is not None:
+        fields = ["id", repository_id, record_id]
+    else:
+        fields = [user_id, repository_id, feedback_type, context]
+        if created_at is not None:
+            fields.append(created_at)
+    payload = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 class MemoryService:
     """Service for managing persistent user and repository memory."""
     
@@ -32,8 +59,8 @@ class MemoryService:
             repository_id=repository_id,
             memory_type=preference_type,
             content=content,
-            metadata=metadata or {},
-            embedding=embedding
+            metadata_=metadata or {},
+            **self.embedding_service.vector_columns(embedding)
         )
         
         db.add(memory)
@@ -122,6 +149,97 @@ class MemoryService:
             {"learned_at": datetime.utcnow().isoformat()}
         )
     
+    async def ingest_feedback_batch(
+        self,
+        db: Session,
+        records: List[Dict],
+        batch_size: int = 256,
+        on_progress: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, int]:
+        """
+        Bulk version of learn_from_feedback for backfills.
+        
+        Records are embedded in chunks of batch_size and written with one
+        INSERT per chunk. Each record carries a dedupe key derived from its
+        content, so re-running the same records (e.g. on task retry) skips
+        rows that are already stored instead of duplicating them.
+        
+        Each record needs user_id, repository_id, feedback_type and context;
+        created_at is optional and defaults to now. Records with the same
+        content but a different created_at are distinct; an optional id
+        (e.g. the source system's comment id) replaces the content as the
+        dedupe key.
+        """
+        inserted = 0
+        skipped = 0
+        seen = set()
+        
+        for start in range(0, len(records), batch_size):
+            chunk = records[start:start + batch_size]
+            
+            keyed = {}
+            for record in chunk:
+                key = feedback_dedupe_key(
+                    record["user_id"],
+                    record["repository_id"],
+                    record["feedback_type"],
+                    record["context"],
+                    created_at=record.get("created_at"),
+                    record_id=record.get("id")
+                )
+                if key in seen or key in keyed:
+                    skipped += 1
+                    continue
+                keyed[key] = record
+            
+            # Skip embedding work for rows a previous attempt already stored
+            if keyed:
+                existing = {
+                    row.dedupe_key for row in db.query(UserMemory.dedupe_key).filter(
+                        UserMemory.dedupe_key.in_(list(keyed))
+                    )
+                }
+                for key in existing:
+                    del keyed[key]
+                skipped += len(existing)
+            
+            if keyed:
+                contents = [json.dumps(r["context"]) for r in keyed.values()]
+                embeddings = self.embedding_service.create_embeddings_batch(contents)
+                
+                rows = []
+                for (key, record), content, embedding in zip(keyed.items(), contents, embeddings):
+                    learned_at = record.get("created_at") or datetime.utcnow().isoformat()
+                    rows.append({
+                        "user_id": record["user_id"],
+                        "repository_id": record["repository_id"],
+                        "memory_type": f"feedback_{record['feedback_type']}",
+                        "content": content,
+                        "metadata": {"learned_at": str(learned_at), "source": "bulk"},
+                        "dedupe_key": key,
+                        **self.embedding_service.vector_columns(embedding)
+                    })
+                
+                # Concurrent retries can race past the lookup above, so the
+                # unique dedupe_key index is the final guard
+                result = db.execute(
+                    insert(UserMemory.__table__)
+                    .values(rows)
+                    .on_conflict_do_nothing(index_elements=["dedupe_key"])
+                )
+                db.commit()
+                
+                inserted += result.rowcount
+                skipped += len(rows) - result.rowcount
+            
+            seen.update(keyed)
+            
+            if on_progress:
+                on_progress(min(start + batch_size, len(records)), len(records))
+        
+        logger.info(f"Ingested {inserted} feedback records ({skipped} already present)")
+        return {"inserted": inserted, "skipped": skipped}
+    
     async def get_pr_history(
         self,
         db: Session,
@@ -0,0 +1,234 @@
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+import httpx
+from app.config import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+ANTHROPIC_API_URL = "https://api.anthropic.com"
+ANTHROPIC_VERSION = "2023-06-01"
+
+
+class MessageBatchClient:
+    """
+    Anthropic Message Batches API over httpx.
+    
+    The pinned SDK predates batches, so requests go to
+    /v1/messages/batches directly.
+    """
+    
+    def __init__(self, api_key: str, base_url: Optional[str] = None, timeout: float = 60.0):
+        self.http = httpx.Client(
+            base_url=base_url or ANTHROPIC_API_URL,
+            headers={
+                "x-api-key": api_key,
+                "anthropic-version": ANTHROPIC_VERSION,
+                "content-type": "application/json"
+            },
+            timeout=timeout
+        )
+    
+    def create(self, requests: List[Dict]) -> Dict:
+        """Submit requests ({custom_id, params}) as one batch."""
+        response = self.http.post("/v1/messages/batches", json={"requests": requests})
+        response.raise_for_status()
+        return response.json()
+    
+    def retrieve(self, batch_id: str) -> Dict:
+        response = self.http.get(f"/v1/messages/batches/{batch_id}")
+        response.raise_for_status()
+        return response.json()
+    
+    def results(self, batch: Dict) -> Iterator[Dict]:
+        """Stream the JSONL results of an ended batch."""
+        url = batch.get("results_url") or f"/v1/messages/batches/{batch['id']}/results"
+        with self.http.stream("GET", url) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+    
+    def close(self):
+        self.http.close()
+
+
+def custom_id(review_id: str, file_index: int, window_index: int) -> str:
+    # Batch custom ids allow [a-zA-Z0-9_-] only
+    return f"{review_id}_{file_index}_{window_index}"
+
+
+def parse_custom_id(value: str) -> Tuple[str, int, int]:
+    review_id, file_index, window_index = value.rsplit("_", 2)
+    return review_id, int(file_index), int(window_index)
+
+
+class BatchReviewStore:
+    """
+    Redis state of reviews waiting on the Message Batches API.
+    
+    A review's record (PR data, files, expected requests) is stored when it
+    is queued; its requests wait in a pending list until the next
+    submission, and results accumulate per review until every request
+    has one. Complete reviews are kept in a set until finish_review, so a
+    run that stops before finalizing them leaves them for the next one.
+    """
+    
+    prefix = "llm_batch"
+    
+    def __init__(self, redis_client, ttl: int = 172800):
+        self.redis = redis_client
+        self.ttl = ttl
+    
+    def _review_key(self, review_id: str) -> str:
+        return f"{self.prefix}:review:{review_id}"
+    
+    def _results_key(self, review_id: str) -> str:
+        return f"{self.prefix}:results:{review_id}"
+    
+    @property
+    def _pending_key(self) -> str:
+        return f"{self.prefix}:pending"
+    
+    @property
+    def _batches_key(self) -> str:
+        return f"{self.prefix}:batches"
+    
+    @property
+    def _completed_key(self) -> str:
+        return f"{self.prefix}:completed"
+    
+    def add_review(self, review_id: str, record: Dict, requests: List[Dict]):
+        """Store a review and queue its requests ({custom_id, params}) for submission."""
+        pipe = self.redis.pipeline()
+        pipe.set(self._review_key(review_id), json.dumps({**record, "expected": len(requests)}), ex=self.ttl)
+        pipe.rpush(self._pending_key, *(json.dumps(r) for r in requests))
+        pipe.execute()
+    
+    def take_pending(self, limit: int) -> List[Dict]:
+        pipe = self.redis.pipeline()
+        pipe.lrange(self._pending_key, 0, limit - 1)
+        pipe.ltrim(self._pending_key, limit, -1)
+        requests, _ = pipe.execute()
+        return [json.loads(r) for r in requests]
+    
+    def return_pending(self, requests: List[Dict]):
+        """Put requests back at the front of the queue after a failed submission."""
+        if requests:
+            self.redis.lpush(self._pending_key, *(json.dumps(r) for r in reversed(requests)))
+    
+    def pending_count(self) -> int:
+        return self.redis.llen(self._pending_key)
+    
+    def track_batch(self, batch_id: str):
+        self.redis.sadd(self._batches_key, batch_id)
+    
+    def untrack_batch(self, batch_id: str):
+        self.redis.srem(self._batches_key, batch_id)
+    
+    def active_batches(self) -> List[str]:
+        return sorted(b.decode() for b in self.redis.smembers(self._batches_key))
+    
+    def record_result(self, review_id: str, request_id: str, result: Dict):
+        key = self._results_key(review_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(key, request_id, json.dumps(result))
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+    
+    def completed_review(self, review_id: str) -> Optional[Tuple[Dict, Dict[str, Dict]]]:
+        """The review's record and results once every request has a result."""
+        record = self.redis.get(self._review_key(review_id))
+        if record is None:
+            return None
+        record = json.loads(record)
+        results = self.redis.hgetall(self._results_key(review_id))
+        if len(results) < record["expected"]:
+            return None
+        return record, {k.decode(): json.loads(v) for k, v in results.items()}
+    
+    def mark_completed(self, review_ids: List[str]):
+        if review_ids:
+            self.redis.sadd(self._completed_key, *review_ids)
+    
+    def completed_reviews(self) -> List[str]:
+        """Reviews with every result in that have not been finished yet."""
+        return sorted(r.decode() for r in self.redis.smembers(self._completed_key))
+    
+    def finish_review(self, review_id: str):
+        pipe = self.redis.pipeline()
+        pipe.delete(self._review_key(review_id), self._results_key(review_id))
+        pipe.srem(self._completed_key, review_id)
+        pipe.execute()
+    
+    def lock(self, timeout: int):
+        """Held while submitting and polling, so overlapping runs skip instead."""
+        return self.redis.lock(f"{self.prefix}:lock", timeout=timeout, blocking=False)
+
+
+def batch_result(entry: Dict) -> Dict:
+    """Normalize one JSONL result to {"message": ...} or {"error": ...}."""
+    result = entry.get("result") or {}
+    if result.get("type") == "succeeded":
+        return {"message": result["message"]}
+    error = (result.get("error") or {}).get("error", {}).get("message") or result.get("type", "unknown")
+    return {"error": f"Batch request {result.get('type', 'failed')}: {error}"}
+
+
+def submit_pending(store: BatchReviewStore, client: MessageBatchClient, limit: int) -> Optional[str]:
+    """Submit up to `limit` pending requests as one batch; returns its id."""
+    requests = store.take_pending(limit)
+    if not requests:
+        return None
+    try:
+        batch = client.create(requests)
+    except Exception:
+        store.return_pending(requests)
+        raise
+    store.track_batch(batch["id"])
+    logger.info(f"Submitted message batch {batch['id']} with {len(requests)} requests")
+    return batch["id"]
+
+
+def collect_results(store: BatchReviewStore, client: MessageBatchClient) -> List[str]:
+    """
+    Store results of batches that have ended.
+    
+    Returns the ids of reviews whose requests have all been answered and
+    that are not finished yet, including ones an earlier run collected
+    but stopped before finalizing.
+    """
+    for batch_id in store.active_batches():
+        batch = client.retrieve(batch_id)
+        if batch.get("processing_status") != "ended":
+            continue
+        touched = set()
+        for entry in client.results(batch):
+            review_id, _, _ = parse_custom_id(entry["custom_id"])
+            store.record_result(review_id, entry["custom_id"], batch_result(entry))
+            touched.add(review_id)
+        # Mark before untracking: the batch is how we'd find these reviews again
+        store.mark_completed([r for r in touched if store.completed_review(r) is not None])
+        store.untrack_batch(batch_id)
+        logger.info(f"Collected results of message batch {batch_id}")
+    return store.completed_reviews()
+
+
+# Singleton instances
+_store = None
+_client = None
+
+def get_batch_review_store() -> BatchReviewStore:
+    global _store
+    if _store is None:
+        import redis
+        _store = BatchReviewStore(redis.Redis.from_url(settings.redis_url), ttl=settings.llm_batch_ttl)
+    return _store
+
+
+def get_message_batch_client() -> MessageBatchClient:
+    global _client
+    if _client is None:
+        _client = MessageBatchClient(settings.anthropic_api_key, settings.anthropic_base_url)
+    return _client
@@ -0,0 +1,177 @@
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY
+from app.config import get_settings
+from app.profiling import record_stage_timing
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Review pipeline stages timed by review_stage_seconds. Labels are limited to
+# these names so a typo cannot create new series.
+STAGES = ("fetch", "user_context", "rag", "embed", "llm", "post", "history")
+REVIEW_OUTCOMES = ("posted", "superseded", "failed")
+OTHER_REPOSITORY = "other"
+
+STAGE_SECONDS = Histogram(
+    "review_stage_seconds",
+    "Time spent in each review pipeline stage",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "LLM tokens reported in Anthropic usage",
+    ["model", "direction"]
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "celery_task_queue_wait_seconds",
+    "Time between enqueueing a task (or its countdown expiring) and a worker starting it",
+    ["task", "queue"],
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 900, 1800, 3600)
+)
+REVIEWS = Counter(
+    "reviews_total",
+    "Completed reviews by repository and outcome",
+    ["repository", "outcome"]
+)
+TRIAGE_FILES = Counter(
+    "review_triage_files_total",
+    "Changed files by triage decision (review, low, skip)",
+    ["decision"]
+)
+REVIEW_LATENCY_SECONDS = Histogram(
+    "review_end_to_end_seconds",
+    "Time from admitting a review request at the API to posting the review",
+    buckets=(5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+)
+# Live pool processes only, so a recycled child's model doesn't count
+EMBEDDING_MODEL_LOADED = Gauge(
+    "embedding_model_loaded",
+    "Whether a live process has loaded the embedding model (1) or not yet (absent)",
+    ["model"],
+    multiprocess_mode="livemax"
+)
+
+_repositories: Set[str] = set()
+
+
+def repository_label(repository: str) -> str:
+    """
+    Label value for a repository, capped at METRICS_MAX_REPOSITORIES.
+    
+    The first repositories seen by a process keep their own series; the rest
+    are counted under "other" so label cardinality stays bounded.
+    """
+    if repository in _repositories:
+        return repository
+    if len(_repositories) < settings.metrics_max_repositories:
+        _repositories.add(repository)
+        return repository
+    return OTHER_REPOSITORY
+
+
+@contextmanager
+def _timed_stage(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        record_stage_timing(stage, elapsed)
+
+
+def observe_stage(stage: str):
+    """Context manager timing one pipeline stage (and the profiled task's breakdown)."""
+    if stage not in STAGES:
+        raise ValueError(f"Unknown review stage: {stage}")
+    return _timed_stage(stage)
+
+
+def record_llm_usage(model: str, usage):
+    """Count input/output tokens from an Anthropic response's usage."""
+    if usage is None:
+        return
+    LLM_TOKENS.labels(model, "input").inc(getattr(usage, "input_tokens", 0) or 0)
+    LLM_TOKENS.labels(model, "output").inc(getattr(usage, "output_tokens", 0) or 0)
+
+
+def record_embedding_model_loaded(model: str):
+    """Report that this process has loaded the embedding model."""
+    EMBEDDING_MODEL_LOADED.labels(model).set(1)
+
+
+def record_review(repository: str, outcome: str):
+    if outcome not in REVIEW_OUTCOMES:
+        raise ValueError(f"Unknown review outcome: {outcome}")
+    REVIEWS.labels(repository_label(repository), outcome).inc()
+
+
+def record_triage(decisions: Iterable):
+    for decision in decisions:
+        TRIAGE_FILES.labels(decision.action).inc()
+
+
+def observe_review_latency(pr_data: Dict):
+    """Observe end-to-end latency of a posted review admitted by the API."""
+    if pr_data.get('enqueued_at'):
+        REVIEW_LATENCY_SECONDS.observe(max(time.time() - pr_data['enqueued_at'], 0.0))
+
+
+def queue_wait_seconds(enqueued_at: Optional[float], eta: Optional[str], now: float) -> Optional[float]:
+    """
+    Seconds a task waited in the queue.
+    
+    Tasks with a countdown are measured from their ETA, so a deliberate
+    delay (debounce, rate-limit deferral, retry backoff) is not counted.
+    """
+    if enqueued_at is None:
+        return None
+    ready_at = float(enqueued_at)
+    if eta:
+        ready_at = max(ready_at, datetime.fromisoformat(eta).timestamp())
+    return max(now - ready_at, 0.0)
+
+
+def stamp_enqueue_time(headers: Dict):
+    """before_task_publish handler: record when the task was enqueued."""
+    headers["enqueued_at"] = time.time()
+
+
+def observe_queue_wait(task):
+    """task_prerun handler: observe how long the task waited in its queue."""
+    request = task.request
+    wait = queue_wait_seconds(request.get("enqueued_at"), request.eta, time.time())
+    if wait is None:
+        return
+    queue = (request.delivery_info or {}).get("routing_key") or "unknown"
+    QUEUE_WAIT_SECONDS.labels(task.name, queue).observe(wait)
+
+
+def metrics_registry() -> CollectorRegistry:
+    """
+    Registry to export.
+    
+    With PROMETHEUS_MULTIPROC_DIR set (required for prefork workers), metrics
+    from every process sharing the directory are aggregated.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def start_worker_exporter():
+    """Serve worker metrics on METRICS_WORKER_PORT (0 disables the exporter)."""
+    if not settings.metrics_worker_port:
+        return
+    from prometheus_client import start_http_server
+    start_http_server(settings.metrics_worker_port, registry=metrics_registry())
+    logger.info(f"Worker metrics exporter listening on :{settings.metrics_worker_port}")
@@ -0,0 +1,160 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+from celery import Task
+from app.config import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Stage timings of the task being profiled in this context, if any
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+
+def record_stage_timing(stage: str, seconds: float):
+    """Add a stage's duration to the profiled task's breakdown (no-op otherwise)."""
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage_timings() -> Iterator[Dict[str, float]]:
+    """Collect the stage durations of everything run inside the block (e.g. eager tasks)."""
+    timings: Dict[str, float] = {}
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
+
+
+def frame_label(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack from a background thread.
+    
+    Stacks are counted in collapsed form (root;...;leaf), the input format
+    of flamegraph.pl and speedscope. Overhead is one stack walk per
+    interval, independent of how many calls the task makes.
+    """
+    
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="task-profiler", daemon=True)
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+    
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+    
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class TaskProfile:
+    """Sampling profile and stage breakdown of one task run."""
+    
+    def __init__(self, task_id: str, output_dir: str, interval: float):
+        self.task_id = task_id
+        self.path = os.path.join(output_dir, f"{task_id}.collapsed")
+        self.sampler = StackSampler(threading.get_ident(), interval)
+        self.stages: Dict[str, float] = {}
+        self.started = 0.0
+        self.seconds = 0.0
+        self._token = None
+    
+    def __enter__(self) -> "TaskProfile":
+        self._token = _stage_timings.set(self.stages)
+        self.started = time.perf_counter()
+        self.sampler.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.sampler.stop()
+        self.seconds = time.perf_counter() - self.started
+        _stage_timings.reset(self._token)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as f:
+                f.write(self.sampler.collapsed())
+        except OSError as e:
+            logger.warning(f"Could not write profile for task {self.task_id}: {e}")
+        return False
+    
+    def summary(self) -> Dict:
+        return {
+            "task_id": self.task_id,
+            "seconds": round(self.seconds, 3),
+            "stages": {stage: round(seconds, 3) for stage, seconds in self.stages.items()},
+            "samples": self.sampler.samples,
+            "stacks": self.path
+        }
+
+
+def should_profile(request) -> bool:
+    """A task is profiled when its message asks for it or it is sampled."""
+    # Worker requests carry message headers as attributes; eager ones nest them
+    if request.get("profile") or (request.headers or {}).get("profile"):
+        return True
+    return settings.task_profile_rate > 0 and random.random() < settings.task_profile_rate
+
+
+class ProfiledTask(Task):
+    """
+    Task base class with opt-in sampling profiles.
+    
+    Profiled runs write collapsed stacks to TASK_PROFILE_DIR/<task_id>.collapsed
+    and add a "profile" entry (stage breakdown, sample count, stack file) to
+    dict results. Tasks called from another task are covered by the
+    caller's profile.
+    """
+    
+    def __call__(self, *args, **kwargs):
+        request = self.request_stack.top
+        if request is None or request.called_directly:
+            # Plain function call, e.g. from another task
+            return super().__call__(*args, **kwargs)
+        
+        # Run by the worker (or eagerly): the request is already pushed, so
+        # call run() directly as Celery does for tasks without __call__
+        if _stage_timings.get() is not None or not should_profile(request):
+            return self.run(*args, **kwargs)
+        
+        with TaskProfile(request.id, settings.task_profile_dir, settings.task_profile_interval) as profile:
+            result = self.run(*args, **kwargs)
+        
+        logger.info(f"Profiled {self.name} [{request.id}]: {profile.summary()}")
+        if isinstance(result, dict):
+            result = {**result, "profile": profile.summary()}
+        return result
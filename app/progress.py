@@ -0,0 +1,129 @@
+import json
+import time
+from typing import AsyncIterator, Dict, List, Optional
+from app.config import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Stages after which no more events are published for a review
+TERMINAL_STAGES = {"posted", "superseded", "failed"}
+
+
+class ReviewProgress:
+    """
+    Publishes review progress events through Redis.
+    
+    Events go out on a pub/sub channel per review and are also kept in a
+    short, expiring list so a client that connects late sees what it missed.
+    """
+    
+    prefix = "review:progress"
+    
+    def __init__(self, redis_client, ttl: int = 3600, max_events: int = 500):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.max_events = max_events
+    
+    @classmethod
+    def channel(cls, review_id: str) -> str:
+        return f"{cls.prefix}:{review_id}"
+    
+    @classmethod
+    def log_key(cls, review_id: str) -> str:
+        return f"{cls.prefix}:{review_id}:log"
+    
+    def publish(self, review_id: str, stage: str, **data) -> Dict:
+        """Record and broadcast one event."""
+        seq_key = f"{self.prefix}:{review_id}:seq"
+        seq = self.redis.incr(seq_key)
+        event = {"seq": seq, "stage": stage, "ts": time.time(), **data}
+        payload = json.dumps(event)
+        
+        pipe = self.redis.pipeline()
+        pipe.rpush(self.log_key(review_id), payload)
+        pipe.ltrim(self.log_key(review_id), -self.max_events, -1)
+        pipe.expire(self.log_key(review_id), self.ttl)
+        pipe.expire(seq_key, self.ttl)
+        pipe.publish(self.channel(review_id), payload)
+        pipe.execute()
+        return event
+    
+    def history(self, review_id: str) -> List[Dict]:
+        return [json.loads(e) for e in self.redis.lrange(self.log_key(review_id), 0, -1)]
+
+
+def format_sse(event: Dict) -> str:
+    return f"id: {event['seq']}\nevent: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream_progress(
+    redis_client,
+    review_id: str,
+    timeout: float = 900,
+    heartbeat: float = 15
+) -> AsyncIterator[str]:
+    """
+    Server-Sent Events for one review, ending after a terminal stage.
+    
+    redis_client is an asyncio Redis client. Subscribes before replaying the
+    stored events so nothing published in between is lost.
+    """
+    pubsub = redis_client.pubsub()
+    await pubsub.subscribe(ReviewProgress.channel(review_id))
+    deadline = time.monotonic() + timeout
+    last_seq = 0
+    
+    try:
+        for raw in await redis_client.lrange(ReviewProgress.log_key(review_id), 0, -1):
+            event = json.loads(raw)
+            last_seq = event["seq"]
+            yield format_sse(event)
+            if event["stage"] in TERMINAL_STAGES:
+                return
+        
+        while time.monotonic() < deadline:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+            if message is None:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            
+            event = json.loads(message["data"])
+            if event["seq"] <= last_seq:
+                continue
+            last_seq = event["seq"]
+            yield format_sse(event)
+            if event["stage"] in TERMINAL_STAGES:
+                return
+        
+        yield "event: timeout\ndata: {}\n\n"
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+
+# Singleton instance
+_progress = None
+
+def get_review_progress() -> ReviewProgress:
+    global _progress
+    if _progress is None:
+        import redis
+        _progress = ReviewProgress(
+            redis.Redis.from_url(settings.redis_url),
+            ttl=settings.progress_event_ttl
+        )
+    return _progress
+
+
+def publish_progress(pr_data: Dict, stage: str, **data):
+    """Publish an event for the review in pr_data; never fails the caller."""
+    review_id: Optional[str] = pr_data.get('review_id')
+    if not review_id:
+        return
+    try:
+        get_review_progress().publish(review_id, stage, pr_number=pr_data['pr_number'], **data)
+    except Exception as e:
+        logger.warning(f"Could not publish review progress: {e}")
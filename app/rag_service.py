@@ -1,6 +1,6 @@
 from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
-from app.database import SessionLocal, CodeEmbedding
+from app.database import SessionLocal, CodeChunkRef
 from app.embedding_service import get_embedding_service
 from app.config import get_settings
 import logging
@@ -47,21 +47,15 @@ class RAGService:
         if current_chunk:
             chunks.append('\n'.join(current_chunk))
         
-        # Store chunks with embeddings
-        for idx, chunk in enumerate(chunks):
-            if chunk.strip():  # Skip empty chunks
-                await self.embedding_service.store_code_embedding(
-                    db=db,
-                    repository_id=repository_id,
-                    file_path=file_path,
-                    code_chunk=chunk,
-                    metadata={
-                        "chunk_index": idx,
-                        "total_chunks": len(chunks)
-                    }
-                )
+        # Store chunks; only content not seen before is embedded
+        embedded = await self.embedding_service.store_code_chunks(
+            db=db,
+            repository_id=repository_id,
+            file_path=file_path,
+            chunks=chunks
+        )
         
-        logger.info(f"Indexed {len(chunks)} chunks from {file_path}")
+        logger.info(f"Indexed {len(chunks)} chunks from {file_path} ({embedded} newly embedded)")
     
     async def retrieve_relevant_context(
         self,
@@ -107,9 +101,9 @@ class RAGService:
         
         for file_path in changed_files[:5]:  # Limit to prevent too many queries
             # Query for similar code in other files
-            chunks = db.query(CodeEmbedding).filter(
-                CodeEmbedding.repository_id == repository_id,
-                CodeEmbedding.file_path != file_path
+            chunks = db.query(CodeChunkRef).filter(
+                CodeChunkRef.repository_id == repository_id,
+                CodeChunkRef.file_path != file_path
             ).limit(10).all()
             
             for chunk in chunks:
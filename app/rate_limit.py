@@ -0,0 +1,192 @@
+import math
+import time
+from typing import Dict, List, Optional
+from app.config import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Reserve `cost` requests unless that would dip below the floor. Returns 0
+# on success, otherwise the seconds until the budget is expected back.
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local floor = tonumber(ARGV[3])
+
+local secondary_until = tonumber(redis.call('HGET', KEYS[1], 'secondary_until') or '0')
+if secondary_until > now then
+    return math.ceil(secondary_until - now)
+end
+
+local remaining = redis.call('HGET', KEYS[1], 'remaining')
+local reset = tonumber(redis.call('HGET', KEYS[1], 'reset') or '0')
+if remaining and reset > now then
+    local reserved = tonumber(redis.call('HGET', KEYS[1], 'reserved') or '0')
+    if tonumber(remaining) - reserved - cost < floor then
+        return math.ceil(reset - now)
+    end
+end
+
+redis.call('HINCRBY', KEYS[1], 'reserved', cost)
+return 0
+"""
+
+# Claim the next start slot of KEYS[1], at least ARGV[2] seconds after the
+# slot claimed before it. Returns the seconds until the claimed slot.
+SCHEDULE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+
+local slot = math.max(now, tonumber(redis.call('GET', KEYS[1]) or '0'))
+redis.call('SET', KEYS[1], tostring(slot + interval))
+redis.call('EXPIRE', KEYS[1], math.ceil(slot + interval - now) + 60)
+return math.ceil(slot - now)
+"""
+
+
+class RateLimitGovernor:
+    """
+    Tracks GitHub rate-limit budget per installation in Redis.
+    
+    Every GitHub response updates the installation's remaining budget,
+    reset time and any secondary-limit backoff. Reviews reserve an
+    estimated number of requests before starting; when the budget is
+    exhausted the caller is told how long to wait instead of failing.
+    
+    It also keeps a start schedule per installation, shared by every API
+    process and worker, that spaces review starts out.
+    """
+    
+    prefix = "github:ratelimit"
+    schedule_prefix = "github:reviewstarts"
+    
+    def __init__(self, redis_client, floor: int = 100):
+        self.redis = redis_client
+        self.floor = floor
+        self._reserve = redis_client.register_script(RESERVE_SCRIPT)
+        self._schedule = redis_client.register_script(SCHEDULE_SCRIPT)
+    
+    def _key(self, installation_id: int) -> str:
+        return f"{self.prefix}:{installation_id}"
+    
+    def record(self, installation_id: int, status: int, headers, body: str = ""):
+        """Update the budget from a GitHub response."""
+        key = self._key(installation_id)
+        now = time.time()
+        
+        # GraphQL and search have budgets of their own; only track the REST one
+        if headers.get("X-RateLimit-Resource", "core") != "core":
+            remaining = reset = None
+        else:
+            remaining = headers.get("X-RateLimit-Remaining")
+            reset = headers.get("X-RateLimit-Reset")
+        retry_after = headers.get("Retry-After")
+        
+        pipe = self.redis.pipeline()
+        
+        if remaining is not None and reset is not None:
+            previous_reset = self.redis.hget(key, "reset")
+            if previous_reset is not None and int(previous_reset) != int(reset):
+                # New rate-limit window: earlier reservations no longer apply
+                pipe.hset(key, "reserved", 0)
+            pipe.hset(key, mapping={
+                "limit": headers.get("X-RateLimit-Limit", ""),
+                "remaining": int(remaining),
+                "reset": int(reset),
+                "updated_at": now
+            })
+        
+        if status in (403, 429):
+            if retry_after is not None:
+                pipe.hset(key, "secondary_until", now + int(retry_after))
+            elif remaining != "0" and "secondary rate limit" in body.lower():
+                # GitHub asks for at least a minute when no Retry-After is given
+                pipe.hset(key, "secondary_until", now + 60)
+        
+        # Forget installations that stop making requests
+        pipe.expire(key, 2 * 3600)
+        pipe.execute()
+    
+    def reserve(self, installation_id: int, cost: int) -> int:
+        """
+        Reserve budget for cost requests.
+        
+        Returns 0 when reserved, otherwise the number of seconds to wait.
+        """
+        return int(self._reserve(
+            keys=[self._key(installation_id)],
+            args=[time.time(), cost, self.floor]
+        ))
+    
+    def release(self, installation_id: int, cost: int):
+        """Return a reservation once the work it covered is done."""
+        key = self._key(installation_id)
+        if self.redis.hincrby(key, "reserved", -cost) < 0:
+            self.redis.hset(key, "reserved", 0)
+    
+    def schedule_start(self, installation_id: int, interval: float) -> int:
+        """
+        Claim the installation's next review start, interval seconds after
+        the previous one.
+        
+        Returns the seconds until it; callers that can't wait still claim
+        a start so the others are spaced around it.
+        """
+        return int(self._schedule(
+            keys=[f"{self.schedule_prefix}:{installation_id}"],
+            args=[time.time(), interval]
+        ))
+    
+    def wait_time(self, installation_id: int) -> int:
+        """Seconds until the installation can make requests again."""
+        state = self.status(installation_id)
+        now = time.time()
+        wait = 0.0
+        
+        if state["secondary_until"]:
+            wait = max(wait, state["secondary_until"] - now)
+        if state["remaining"] is not None and state["remaining"] <= 0 and state["reset"]:
+            wait = max(wait, state["reset"] - now)
+        return math.ceil(wait)
+    
+    def status(self, installation_id: int) -> Dict:
+        """Current known budget for an installation."""
+        raw = self.redis.hgetall(self._key(installation_id))
+        data = {k.decode(): v.decode() for k, v in raw.items()}
+        
+        def number(field: str, cast=int) -> Optional[float]:
+            value = data.get(field)
+            return cast(float(value)) if value not in (None, "") else None
+        
+        return {
+            "installation_id": installation_id,
+            "limit": number("limit"),
+            "remaining": number("remaining"),
+            "reserved": number("reserved") or 0,
+            "reset": number("reset"),
+            "secondary_until": number("secondary_until", float)
+        }
+    
+    def all_statuses(self) -> List[Dict]:
+        """Budget of every installation seen recently."""
+        statuses = []
+        for key in self.redis.scan_iter(match=f"{self.prefix}:*"):
+            installation_id = key.decode().rsplit(":", 1)[1]
+            if installation_id.isdigit():
+                statuses.append(self.status(int(installation_id)))
+        return statuses
+
+
+# Singleton instance
+_governor = None
+
+def get_rate_limit_governor() -> RateLimitGovernor:
+    global _governor
+    if _governor is None:
+        import redis
+        _governor = RateLimitGovernor(
+            redis.Redis.from_url(settings.redis_url),
+            floor=settings.github_rate_limit_floor
+        )
+    return _governor
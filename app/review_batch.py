@@ -0,0 +1,114 @@
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+from celery import group
+from celery.result import GroupResult
+from app.celery_app import celery_app, max_countdown, queue_task_options
+from app.config import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+def review_countdowns(installation_ids: Iterable[int], per_minute: float, governor) -> List[int]:
+    """
+    Start delay for each review of a batch, in seconds.
+    
+    Starts are claimed from each installation's shared schedule, so an
+    installation starts at most `per_minute` reviews a minute across
+    concurrent batches and live reviews, while different installations run
+    side by side.
+    """
+    interval = 60.0 / per_minute
+    return [governor.schedule_start(installation_id, interval) for installation_id in installation_ids]
+
+
+def enqueue_review_batch(pr_data_list: List[Dict], message_batches: bool = False) -> GroupResult:
+    """
+    Queue a throttled group of reviews on the bulk queue.
+    
+    With message_batches, their LLM requests go through the Message
+    Batches API (cheaper, results within hours). The group result is saved
+    so progress can be looked up by its id later. Reviews due later than
+    the broker can hold a countdown carry their start time and defer
+    themselves until it. Each review is queued under its review_id
+    (assigned if missing), the task id its progress and dedupe key use.
+    """
+    from celery.utils import uuid
+    from app.rate_limit import get_rate_limit_governor
+    from app.task_signatures import process_pr_review
+    
+    countdowns = review_countdowns(
+        (pr_data['installation_id'] for pr_data in pr_data_list),
+        settings.batch_reviews_per_minute,
+        get_rate_limit_governor()
+    )
+    now = time.time()
+    for pr_data, countdown in zip(pr_data_list, countdowns):
+        # Per-file reviews and the final post stay on the bulk queue too
+        pr_data['queue'] = "bulk"
+        pr_data.setdefault('review_id', uuid())
+        pr_data['start_after'] = now + countdown
+        if message_batches:
+            pr_data['llm_mode'] = "batch"
+    
+    result = group(
+        process_pr_review.clone(args=(pr_data,)).set(
+            task_id=pr_data['review_id'], countdown=min(countdown, max_countdown()), **queue_task_options("bulk")
+        )
+        for pr_data, countdown in zip(pr_data_list, countdowns)
+    ).apply_async()
+    result.save()
+    logger.info(f"Enqueued review batch {result.id} with {len(pr_data_list)} reviews")
+    return result
+
+
+def review_status(result, lookup: Callable, started: bool = False) -> str:
+    """
+    Where one review stands, following its finalize task and re-runs by id.
+    
+    started marks results of follow-up tasks, which count as running
+    rather than queued until they finish.
+    """
+    if result.state == "FAILURE":
+        return "failed"
+    if not result.successful():
+        return "queued" if result.state == "PENDING" and not started else "running"
+    
+    status = (result.result or {}).get("status")
+    if status == "dispatched":
+        return review_status(lookup(result.result["finalize_task_id"]), lookup, started=True)
+    if status == "deferred":
+        task_id = result.result.get("task_id")
+        return review_status(lookup(task_id), lookup) if task_id else "queued"
+    if status in ("superseded", "failed"):
+        return status
+    return "completed"
+
+
+def summarize_batch(children: List, lookup: Callable = celery_app.AsyncResult) -> Dict:
+    """
+    Aggregate progress of a batch's review tasks.
+    
+    A review counts as done once its finalize task has finished; until then
+    it is queued (fetch task not started or deferred), running or failed.
+    """
+    counts = {"queued": 0, "running": 0, "completed": 0, "superseded": 0, "failed": 0}
+    for child in children:
+        counts[review_status(child, lookup)] += 1
+    
+    total = len(children)
+    finished = counts["completed"] + counts["superseded"] + counts["failed"]
+    return {
+        "total": total,
+        **counts,
+        "progress": round(finished / total, 3) if total else 1.0
+    }
+
+
+def batch_progress(batch_id: str) -> Optional[Dict]:
+    """Progress of a saved batch, or None if it is unknown or expired."""
+    result = GroupResult.restore(batch_id, app=celery_app)
+    if result is None:
+        return None
+    return {"batch_id": batch_id, **summarize_batch(result.results)}
@@ -0,0 +1,116 @@
+from typing import Optional
+from app.config import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Bump the generation KEYS[1] unless a review of the PR is pending (KEYS[2]
+# exists), marking the new one pending for ARGV[2] seconds. Returns the new
+# generation, or false if a review is pending.
+REGISTER_IF_IDLE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return false
+end
+local generation = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('SET', KEYS[2], generation, 'EX', ARGV[2])
+return generation
+"""
+
+# Clear the pending marker KEYS[1] only while it is still generation ARGV[1]
+FINISH_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class ReviewSuperseded(Exception):
+    """Raised when a newer review request for the same PR exists."""
+
+
+class ReviewCoalescer:
+    """
+    Tracks the latest review request per PR in Redis.
+    
+    Every trigger bumps the PR's generation. A review carries the generation
+    it was queued with and gives up as soon as a newer one exists, so a
+    burst of pushes ends in a single review of the latest head.
+    
+    The latest generation is also marked pending until its review finishes
+    (or pending_ttl passes), so bulk requests can leave a PR with a review
+    on the way alone instead of replacing it.
+    """
+    
+    prefix = "review:generation"
+    pending_prefix = "review:pending"
+    
+    def __init__(self, redis_client, ttl: int = 24 * 3600, pending_ttl: int = 3600):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self._register_if_idle = redis_client.register_script(REGISTER_IF_IDLE_SCRIPT)
+        self._finish = redis_client.register_script(FINISH_SCRIPT)
+    
+    def _key(self, repository: str, pr_number: int) -> str:
+        return f"{self.prefix}:{repository}#{pr_number}"
+    
+    def _pending_key(self, repository: str, pr_number: int) -> str:
+        return f"{self.pending_prefix}:{repository}#{pr_number}"
+    
+    def register(self, repository: str, pr_number: int) -> int:
+        """Record a new review request and return its generation."""
+        key = self._key(repository, pr_number)
+        pipe = self.redis.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, self.ttl)
+        generation = pipe.execute()[0]
+        self.redis.set(self._pending_key(repository, pr_number), generation, ex=self.pending_ttl)
+        return generation
+    
+    def register_if_idle(self, repository: str, pr_number: int) -> Optional[int]:
+        """Like register, but None (replacing nothing) while a review of the PR is pending."""
+        generation = self._register_if_idle(
+            keys=[self._key(repository, pr_number), self._pending_key(repository, pr_number)],
+            args=[self.ttl, self.pending_ttl]
+        )
+        return int(generation) if generation is not None else None
+    
+    def finish(self, pr_data: dict):
+        """Clear the PR's pending marker if it is still this review's."""
+        if pr_data.get('review_generation') is None:
+            return
+        self._finish(
+            keys=[self._pending_key(pr_data['repository'], pr_data['pr_number'])],
+            args=[pr_data['review_generation']]
+        )
+    
+    def is_current(self, repository: str, pr_number: int, generation: Optional[int]) -> bool:
+        """Whether a review of this generation is still the latest request."""
+        if generation is None:
+            return True  # queued without coalescing
+        latest = self.redis.get(self._key(repository, pr_number))
+        return latest is None or int(latest) <= generation
+    
+    def ensure_current(self, pr_data: dict):
+        """Raise ReviewSuperseded if the review in pr_data has been replaced."""
+        if not self.is_current(pr_data['repository'], pr_data['pr_number'], pr_data.get('review_generation')):
+            raise ReviewSuperseded(
+                f"Review of {pr_data['repository']}#{pr_data['pr_number']} superseded by a newer request"
+            )
+
+
+# Singleton instance
+_coalescer = None
+
+def get_review_coalescer() -> ReviewCoalescer:
+    global _coalescer
+    if _coalescer is None:
+        import redis
+        _coalescer = ReviewCoalescer(
+            redis.Redis.from_url(settings.redis_url),
+            pending_ttl=settings.admission_in_flight_ttl
+        )
+    return _coalescer
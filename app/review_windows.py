@@ -0,0 +1,224 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from app.config import get_settings
+from app.deadline import Deadline
+from app.diff_parser import DiffHunk, parse_patch
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CHARS_PER_TOKEN = 4  # rough average for source code
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def hunk_text(hunk: DiffHunk) -> str:
+    return "\n".join([hunk.header] + hunk.lines)
+
+
+def hunk_line_numbers(hunk: DiffHunk) -> List[Optional[int]]:
+    """New-file line number of each line of a hunk (None for removed lines)."""
+    numbers = []
+    line_no = hunk.new_start
+    for line in hunk.lines:
+        if line.startswith(("-", "\\")):
+            numbers.append(None)
+        else:
+            numbers.append(line_no)
+            line_no += 1
+    return numbers
+
+
+def split_hunk(hunk: DiffHunk, max_chars: int, context: int = 3) -> List[DiffHunk]:
+    """
+    Split a hunk longer than max_chars into consecutive hunks.
+    
+    Every piece after the first also repeats the `context` lines before it,
+    and carries a header with its own line numbers in the original file.
+    """
+    if len(hunk_text(hunk)) <= max_chars:
+        return [hunk]
+    
+    # Old/new line number at which each line of the hunk sits
+    positions = []
+    old_no, new_no = hunk.old_start, hunk.new_start
+    for line in hunk.lines:
+        positions.append((old_no, new_no))
+        if not line.startswith(("+", "\\")):
+            old_no += 1
+        if not line.startswith(("-", "\\")):
+            new_no += 1
+    
+    bounds = []
+    start, size = 0, 0
+    for i, line in enumerate(hunk.lines):
+        if i > start and size + len(line) + 1 > max_chars:
+            bounds.append((start, i))
+            start, size = i, 0
+        size += len(line) + 1
+    bounds.append((start, len(hunk.lines)))
+    
+    pieces = []
+    for start, end in bounds:
+        start = max(start - context, 0) if start else 0
+        lines = hunk.lines[start:end]
+        old_start, new_start = positions[start]
+        old_count = sum(1 for line in lines if not line.startswith(("+", "\\")))
+        new_count = sum(1 for line in lines if not line.startswith(("-", "\\")))
+        pieces.append(DiffHunk(
+            old_start=old_start,
+            old_count=old_count,
+            new_start=new_start,
+            new_count=new_count,
+            header=f"@@ -{old_start},{old_count} +{new_start},{new_count} @@",
+            lines=lines
+        ))
+    return pieces
+
+
+@dataclass
+class ReviewWindow:
+    """Hunks of one file reviewed together in a single LLM call."""
+    hunks: List[DiffHunk]
+    index: int
+    total: int
+    
+    @property
+    def patch(self) -> str:
+        return "\n".join(hunk_text(hunk) for hunk in self.hunks)
+    
+    def line_numbers(self) -> List[Optional[int]]:
+        """New-file line number of each diff line, hunk headers excluded."""
+        return [number for hunk in self.hunks for number in hunk_line_numbers(hunk)]
+    
+    @property
+    def line_range(self) -> str:
+        numbers = [n for n in self.line_numbers() if n is not None]
+        return f"{min(numbers)}-{max(numbers)}" if numbers else "removed lines only"
+    
+    def map_line(self, line) -> Optional[int]:
+        """
+        File line for an issue the model placed at `line`, or None.
+        
+        Lines the window shows on the new side are kept. A model that counted
+        from the top of the window instead is mapped back, but only when that
+        reading can't be confused with a file line number.
+        """
+        if not isinstance(line, int):
+            return None
+        numbers = self.line_numbers()
+        commentable = {n for n in numbers if n is not None}
+        if line in commentable:
+            return line
+        if commentable and 1 <= line <= len(numbers) < min(commentable):
+            return numbers[line - 1]
+        return None
+
+
+def build_windows(patch: str, max_tokens: int, context: int = 3) -> List[ReviewWindow]:
+    """Group a patch's hunks into windows of at most max_tokens, splitting oversized hunks."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    groups: List[List[DiffHunk]] = []
+    current: List[DiffHunk] = []
+    size = 0
+    for hunk in parse_patch(patch):
+        for piece in split_hunk(hunk, max_chars, context):
+            piece_size = len(hunk_text(piece)) + 1
+            if current and size + piece_size > max_chars:
+                groups.append(current)
+                current, size = [], 0
+            current.append(piece)
+            size += piece_size
+    if current:
+        groups.append(current)
+    return [ReviewWindow(hunks, i, len(groups)) for i, hunks in enumerate(groups)]
+
+
+def window_context(window: ReviewWindow, file_path: str, codebase_context: Optional[str]) -> str:
+    """Tell the model which part of the file it sees and how to number lines."""
+    note = (
+        f"This is part {window.index + 1} of {window.total} of a large diff to {file_path}, "
+        f"covering new-file lines {window.line_range}. Report line numbers as positions in "
+        f"the new file, as given by the @@ hunk headers."
+    )
+    return f"{note}\n\n{codebase_context}" if codebase_context else note
+
+
+def merge_window_reviews(windows: List[ReviewWindow], reviews: List[Dict]) -> Dict:
+    """
+    Combine per-window reviews into one review of the file.
+    
+    Issue lines are mapped back to (and validated against) the new file;
+    issues repeated in overlapping windows are kept once. A window whose
+    review failed (an exception in `reviews`) is noted as not reviewed.
+    """
+    issues = []
+    seen = set()
+    notes: List[str] = []
+    assessments = []
+    unreviewed = 0
+    for window, review in zip(windows, reviews):
+        if isinstance(review, Exception):
+            assessments.append(f"Lines {window.line_range}: not reviewed ({type(review).__name__})")
+            unreviewed += 1
+            continue
+        assessments.append(f"Lines {window.line_range}: {review.get('overall_assessment', 'No issues found')}")
+        for issue in review.get('issues') or []:
+            line = window.map_line(issue.get('line'))
+            key = (line, issue.get('description'))
+            if key in seen:
+                continue
+            seen.add(key)
+            issues.append({**issue, "line": line})
+        for note in review.get('positive_notes') or []:
+            if note not in notes:
+                notes.append(note)
+    
+    return {
+        "overall_assessment": "\n".join(assessments),
+        "issues": issues,
+        "positive_notes": notes,
+        "windows": len(windows),
+        "unreviewed_windows": unreviewed
+    }
+
+
+async def review_in_windows(
+    llm_service,
+    file_path: str,
+    patch: str,
+    context: Optional[str] = None,
+    user_memory: Optional[str] = None,
+    deadline: Optional[Deadline] = None
+) -> Dict:
+    """
+    Review an oversized patch as concurrent hunk windows and merge the results.
+    
+    Windows that fail or run out of time are left out, so the windows
+    already reviewed are kept; only a file with no window reviewed fails.
+    """
+    windows = build_windows(patch, settings.review_window_tokens, settings.review_window_context)
+    logger.info(f"Reviewing {file_path} in {len(windows)} windows")
+    reviews = await llm_service.generate_reviews(
+        [
+            {
+                "code_diff": window.patch,
+                "file_path": file_path,
+                "context": window_context(window, file_path, context),
+                "user_memory": user_memory
+            }
+            for window in windows
+        ],
+        concurrency=settings.review_window_concurrency,
+        deadline=deadline,
+        return_exceptions=True
+    )
+    failures = [r for r in reviews if isinstance(r, Exception)]
+    if len(failures) == len(reviews):
+        raise failures[0]
+    if failures:
+        logger.warning(f"{len(failures)} of {len(windows)} windows of {file_path} not reviewed: {failures[0]}")
+    return merge_window_reviews(windows, reviews)
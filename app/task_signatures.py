@@ -0,0 +1,9 @@
+from app.celery_app import celery_app
+
+# Worker tasks by name, for processes that only enqueue them (the API).
+# Importing app.tasks loads the embedding model's dependencies and the LLM
+# client; these signatures are sent by name instead and routed by
+# celery_app's task_routes exactly like the tasks themselves.
+process_pr_review = celery_app.signature("app.tasks.process_pr_review")
+process_review_command = celery_app.signature("app.tasks.process_review_command")
+ingest_feedback_batch = celery_app.signature("app.tasks.ingest_feedback_batch")
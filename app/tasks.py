@@ -1,160 +1,606 @@
-from app.celery_app import celery_app
+from celery import chord
+from celery.exceptions import SoftTimeLimitExceeded
+from github import RateLimitExceededException
+from sqlalchemy import text
+from app.celery_app import celery_app, max_countdown, queue_task_options
 from app.database import SessionLocal
 from app.github_auth import get_github_client
-from app.github_service import GitHubService
+from app.github_service import dedupe_review_comments, get_github_service
 from app.llm_service import get_llm_service
 from app.memory_service import get_memory_service
 from app.rag_service import get_rag_service
+from app.admission import get_admission_controller
+from app.deadline import Deadline, DeadlineExceeded, limit_statement_time, task_deadline
+from app.message_batches import (
+    collect_results,
+    custom_id,
+    get_batch_review_store,
+    get_message_batch_client,
+    submit_pending,
+)
+from app.metrics import observe_review_latency, observe_stage, record_llm_usage, record_review, record_triage
+from app.progress import publish_progress
+from app.rate_limit import get_rate_limit_governor
+from app.review_coalescer import ReviewSuperseded, get_review_coalescer
+from app.review_windows import build_windows, merge_window_reviews, review_in_windows, window_context
+from app.triage import REVIEW, SKIP, load_triage_rules, triage_file, triage_files
 from app.config import get_settings
 import logging
-from typing import Dict
+import time
+from typing import Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+def format_review_comments(file_name: str, review: Dict) -> List[Dict]:
+    """Turn the issues of one file's review into GitHub review comments."""
+    comments = []
+    for issue in review.get('issues') or []:
+        comment_body = f"**{issue['severity'].upper()}**: {issue['description']}\n\n"
+        if issue.get('suggestion'):
+            comment_body += f"💡 **Suggestion**: {issue['suggestion']}"
+        
+        comments.append({
+            "path": file_name,
+            "body": comment_body,
+            "line": issue.get('line')
+        })
+    return comments
+
+
+def build_review_summary(file_results: List[Dict], triage: Optional[List[Dict]] = None) -> str:
+    """Build the overall review body from per-file results and triage decisions."""
+    summary_parts = ["## 🤖 AI Code Review\n"]
+    
+    for file_review in file_results:
+        if 'review' not in file_review:
+            continue
+        summary_parts.append(f"### 📄 {file_review['file']}")
+        summary_parts.append(file_review['review'].get('overall_assessment', 'No issues found'))
+        
+        if file_review['review'].get('positive_notes'):
+            summary_parts.append("\n✅ **Good practices:**")
+            for note in file_review['review']['positive_notes']:
+                summary_parts.append(f"- {note}")
+        
+        summary_parts.append("")
+    
+    failed = [r['file'] for r in file_results if r.get('error')]
+    if failed:
+        summary_parts.append("⚠️ **Not reviewed (errors):** " + ", ".join(f"`{f}`" for f in failed))
+    
+    unreached = [r['file'] for r in file_results if r.get('unreached')]
+    if unreached:
+        summary_parts.append("⏱️ **Not reviewed (out of time):** " + ", ".join(f"`{f}`" for f in unreached))
+    
+    skipped = [d for d in triage or [] if d['action'] == SKIP]
+    if skipped:
+        summary_parts.append("\n🗂️ **Skipped by triage:**")
+        for decision in skipped:
+            summary_parts.append(f"- `{decision['file']}`: {decision['reason']}")
+    
+    return "\n".join(summary_parts)
+
+
+def lookup_context(db, deadline: Deadline, what: str, fetch) -> str:
+    """
+    Run an optional context lookup (RAG, user memory) within the review's budget.
+    
+    Its queries are limited to CONTEXT_TIMEOUT or the time left, whichever
+    is less; a lookup that runs out is skipped instead of failing the review.
+    """
+    import asyncio
+    from sqlalchemy.exc import OperationalError
+    
+    try:
+        limit_statement_time(db, deadline.timeout(settings.context_timeout))
+        return asyncio.run(fetch())
+    except DeadlineExceeded as e:
+        logger.warning(f"Skipping {what}: {e}")
+        return ""
+    except OperationalError as e:
+        if "statement timeout" not in str(e):
+            raise
+        logger.warning(f"Skipping {what}: timed out")
+        return ""
+    finally:
+        # Ends the transaction, and with it the statement timeout
+        db.rollback()
+
+
+def unreached_file(pr_data: Dict, file_data: Dict) -> Dict:
+    """Result of a file whose review ran out of time."""
+    logger.warning(f"Out of time reviewing {file_data['filename']} of PR #{pr_data['pr_number']}")
+    publish_progress(pr_data, "file_reviewed", file=file_data['filename'], unreached=True)
+    return {"file": file_data['filename'], "unreached": True}
+
+
+def retry_unreviewed(pr_data: Dict, file_results: List[Dict]) -> Dict:
+    """
+    Handle a review in which no file could be reviewed, instead of posting it.
+    
+    If files ran out of time, the whole review runs again (up to
+    REVIEW_DEADLINE_RETRIES times) under a task id the batch progress can
+    follow; otherwise it has failed.
+    """
+    from celery.utils import uuid
+    
+    attempts = pr_data.get('deadline_retries', 0)
+    if any(r.get('unreached') for r in file_results) and attempts < settings.review_deadline_retries:
+        pr_data['deadline_retries'] = attempts + 1
+        task_id = uuid()
+        logger.warning(f"No file of PR #{pr_data['pr_number']} reviewed in time, running the review again")
+        publish_progress(pr_data, "deferred", retry_in=60)
+        process_pr_review.apply_async(args=[pr_data], countdown=60, task_id=task_id, **queue_options(pr_data))
+        return {"status": "deferred", "pr_number": pr_data['pr_number'], "retry_in": 60, "task_id": task_id}
+    
+    finish_review(pr_data, "failed", error="No file could be reviewed")
+    return {"status": "failed", "pr_number": pr_data['pr_number']}
+
+
+def queue_options(pr_data: Dict) -> Dict:
+    """Queue, priority and time limits for follow-up tasks of a review, matching the request."""
+    return queue_task_options(pr_data.get('queue', 'reviews'))
+
+
+def finish_review(pr_data: Dict, outcome: str, **data):
+    """
+    Report a review's final outcome, free its in-flight slot and stop
+    marking its PR as having a review pending.
+    
+    A superseded or failed review no longer answers repeats of its request.
+    """
+    publish_progress(pr_data, outcome, **data)
+    record_review(pr_data['repository'], outcome)
+    if outcome == "posted":
+        observe_review_latency(pr_data)
+    try:
+        admission = get_admission_controller()
+        admission.release(pr_data)
+        if outcome in ("superseded", "failed"):
+            admission.forget(pr_data)
+        get_review_coalescer().finish(pr_data)
+    except Exception as e:
+        logger.warning(f"Could not release review slot: {e}")
+
+
 @celery_app.task(bind=True, max_retries=3)
 def process_pr_review(self, pr_data: Dict):
     """
     Process a PR review request.
     
-    This is the main task that orchestrates the entire review process:
-    1. Fetch PR diff and metadata
-    2. Retrieve relevant codebase context (RAG)
-    3. Get user memory/preferences
-    4. Generate review using LLM
-    5. Post review comments to GitHub
-    6. Store review in memory
+    This task fetches the PR and fans the review out as a chord:
+    1. Fetch PR diff and metadata, and user memory/preferences (this task)
+    2. review_pr_file per changed file, in parallel across workers:
+       retrieve codebase context (RAG) and generate the review using LLM
+    3. finalize_pr_review once all files are done: post review comments
+       to GitHub and store the review in memory
+    
+    Each stage retries on its own, so a failed post does not redo the
+    LLM calls and one slow file does not hold up the others.
     """
+    # Progress events of all stages are keyed by the first task's id
+    pr_data.setdefault('review_id', self.request.id)
+    installation_id = pr_data['installation_id']
+    governor = get_rate_limit_governor()
+    budget = settings.github_review_request_budget
+    coalescer = get_review_coalescer()
+    
+    # A newer push or command replaced this request while it was queued
+    if not coalescer.is_current(pr_data['repository'], pr_data['pr_number'], pr_data.get('review_generation')):
+        logger.info(f"Skipping superseded review of PR #{pr_data['pr_number']}")
+        finish_review(pr_data, "superseded")
+        return {"status": "superseded", "pr_number": pr_data['pr_number']}
+    
+    # Bulk reviews scheduled further out than one countdown wait in steps;
+    # other reviews start now but take a slot of the installation's schedule
+    if pr_data.get('start_after'):
+        wait = int(pr_data['start_after'] - time.time())
+        if wait > 0:
+            from celery.utils import uuid
+            
+            task_id = uuid()
+            publish_progress(pr_data, "deferred", retry_in=wait)
+            process_pr_review.apply_async(
+                args=[pr_data], countdown=min(wait, max_countdown()), task_id=task_id, **queue_options(pr_data)
+            )
+            return {"status": "deferred", "pr_number": pr_data['pr_number'], "retry_in": wait, "task_id": task_id}
+    else:
+        governor.schedule_start(installation_id, 60.0 / settings.batch_reviews_per_minute)
+    
+    # Wait for the rate-limit window to reset rather than burning retries
+    wait = governor.reserve(installation_id, budget)
+    if wait > 0:
+        logger.info(f"Deferring review of PR #{pr_data['pr_number']} by {wait}s: GitHub rate limit low")
+        publish_progress(pr_data, "deferred", retry_in=wait)
+        process_pr_review.apply_async(args=[pr_data], countdown=wait, **queue_options(pr_data))
+        return {
+            "status": "deferred",
+            "pr_number": pr_data['pr_number'],
+            "retry_in": wait
+        }
+    
+    # Budget of this task, passed to every stage
+    deadline = task_deadline(pr_data)
     db = SessionLocal()
     
     try:
         logger.info(f"Processing PR review for #{pr_data['pr_number']}")
         
         # Get GitHub client
-        github_client = get_github_client(pr_data['installation_id'])
-        github_service = GitHubService(github_client)
+        github_service = get_github_service(installation_id, deadline=deadline)
         
-        # Get services
-        llm_service = get_llm_service()
-        memory_service = get_memory_service()
-        rag_service = get_rag_service()
-        
-        # Get PR information
-        pr_info = github_service.get_pr_info(
-            pr_data['repository'],
-            pr_data['pr_number']
-        )
+        # Cheap static triage (lockfiles, generated code, whitespace-only
+        # changes, repo rules) before any LLM call. Files it skips are left
+        # out before the files to review are chosen, so they don't use up
+        # MAX_FILES_TO_REVIEW.
+        skip_file = None
+        skipped_files = []
+        if settings.triage_enabled:
+            with observe_stage("fetch"):
+                # The repo rules are read at the PR head
+                if not pr_data.get('head_sha'):
+                    pr_data['head_sha'] = github_service.get_pr_info(
+                        pr_data['repository'], pr_data['pr_number']
+                    )['head_sha']
+                rules = load_triage_rules(github_service, pr_data['repository'], pr_data['head_sha'])
+            
+            def skip_file(file_data: Dict) -> bool:
+                decision = triage_file(file_data, rules)
+                if decision.action == SKIP:
+                    skipped_files.append(decision)
+                return decision.action == SKIP
         
-        # Get changed files
-        changed_files = github_service.get_pr_files(
-            pr_data['repository'],
-            pr_data['pr_number'],
-            max_files=settings.max_files_to_review
-        )
+        # Get PR information and changed files in one pass
+        with observe_stage("fetch"):
+            snapshot = github_service.get_pr_snapshot(
+                pr_data['repository'],
+                pr_data['pr_number'],
+                max_files=settings.max_files_to_review,
+                skip=skip_file
+            )
+        pr_info = snapshot['info']
+        changed_files = snapshot['files']
         
-        logger.info(f"Reviewing {len(changed_files)} files")
+        # Triggers don't always carry these; fall back to the fetched PR
+        pr_data.setdefault('head_sha', pr_info['head_sha'])
+        pr_data.setdefault('author', pr_info['author'])
         
         # Get user context from memory
         user_context = ""
         if settings.enable_memory_persistence:
-            import asyncio
-            user_context = asyncio.run(memory_service.get_user_context(
-                db=db,
-                user_id=pr_data['author'],
-                repository_id=pr_data['repository_id']
-            ))
+            with observe_stage("user_context"):
+                user_context = lookup_context(
+                    db, deadline, "user context",
+                    lambda: get_memory_service().get_user_context(
+                        db=db,
+                        user_id=pr_data['author'],
+                        repository_id=pr_data['repository_id']
+                    )
+                )
         
-        # Process each file
-        all_reviews = []
-        review_comments = []
+        # Order the files kept and apply the low-priority limit
+        if settings.triage_enabled:
+            candidates, decisions = triage_files(changed_files, rules, settings.triage_max_low_priority_files)
+            decisions = skipped_files + decisions
+            record_triage(decisions)
+            pr_data['triage'] = [d.to_dict() for d in decisions if d.action != REVIEW]
+        else:
+            candidates = [f for f in changed_files if f.get('patch')]
         
-        for file_data in changed_files:
-            if not file_data.get('patch'):
-                continue
-            
-            # Check diff size
-            if len(file_data['patch']) > settings.max_diff_size:
+        files_to_review = []
+        for file_data in candidates:
+            # Large diffs are reviewed in windows, up to a hard limit
+            if len(file_data['patch']) > settings.max_windowed_diff_size:
                 logger.warning(f"Skipping {file_data['filename']}: diff too large")
                 continue
             
-            # Get relevant context from codebase
-            codebase_context = ""
-            if settings.enable_memory_persistence:
-                import asyncio
-                codebase_context = asyncio.run(rag_service.retrieve_relevant_context(
-                    db=db,
-                    repository_id=pr_data['repository_id'],
-                    query=file_data['patch'][:500]  # Use first part of diff as query
+            files_to_review.append(file_data)
+        
+        logger.info(f"Reviewing {len(files_to_review)} files")
+        publish_progress(
+            pr_data, "fetched",
+            files=[f['filename'] for f in files_to_review],
+            total_files=len(changed_files) + len(skipped_files),
+            skipped=[d['file'] for d in pr_data.get('triage', []) if d['action'] == SKIP]
+        )
+        
+        if files_to_review and pr_data.get('llm_mode') == "batch":
+            # Not urgent: answered through the Message Batches API and posted
+            # by process_message_batches once every request has a result
+            return {
+                "status": "dispatched",
+                "pr_number": pr_data['pr_number'],
+                "files": len(files_to_review),
+                "finalize_task_id": queue_batch_review(
+                    pr_data, files_to_review, user_context, snapshot['existing_comments'], db, deadline
+                ),
+                "llm_mode": "batch"
+            }
+        
+        # Subtasks stay on the queue (and priority) of the request
+        options = queue_options(pr_data)
+        callback = finalize_pr_review.s(pr_data, snapshot['existing_comments']).set(**options)
+        
+        if files_to_review:
+            result = chord(
+                review_pr_file.s(pr_data, file_data, user_context).set(**options)
+                for file_data in files_to_review
+            )(callback)
+        else:
+            result = callback.delay([])
+        
+        return {
+            "status": "dispatched",
+            "pr_number": pr_data['pr_number'],
+            "files": len(files_to_review),
+            "finalize_task_id": result.id
+        }
+    
+    except ReviewSuperseded as e:
+        logger.info(str(e))
+        finish_review(pr_data, "superseded")
+        return {"status": "superseded", "pr_number": pr_data['pr_number']}
+    
+    except RateLimitExceededException:
+        # Not a failure: run again once GitHub resets the budget
+        wait = max(governor.wait_time(installation_id), 60)
+        logger.warning(f"GitHub rate limit hit reviewing PR #{pr_data['pr_number']}, rescheduling in {wait}s")
+        publish_progress(pr_data, "deferred", retry_in=wait)
+        process_pr_review.apply_async(args=[pr_data], countdown=wait, **queue_options(pr_data))
+        return {
+            "status": "deferred",
+            "pr_number": pr_data['pr_number'],
+            "retry_in": wait
+        }
+    
+    except Exception as e:
+        logger.error(f"Error processing PR review: {e}", exc_info=True)
+        if self.request.retries >= self.max_retries:
+            finish_review(pr_data, "failed", error=str(e))
+        # Retry with exponential backoff
+        raise self.retry(exc=e, countdown=60 * (2 ** self.request.retries))
+    
+    finally:
+        governor.release(installation_id, budget)
+        db.close()
+
+
+@celery_app.task(bind=True, max_retries=3)
+def review_pr_file(self, pr_data: Dict, file_data: Dict, user_context: str):
+    """
+    Review one changed file of a PR (chord header task).
+    
+    Returns the file's review, or an error entry once retries are
+    exhausted so the rest of the PR is still posted. Calls are timed out
+    from the task's own budget; a file that runs out of it is marked
+    unreached instead of failing the chord.
+    """
+    deadline = task_deadline(pr_data)
+    db = SessionLocal()
+    
+    try:
+        # Stop before spending LLM calls on a stale head
+        get_review_coalescer().ensure_current(pr_data)
+        
+        # Get relevant context from codebase
+        codebase_context = ""
+        if settings.enable_memory_persistence:
+            with observe_stage("rag"):
+                codebase_context = lookup_context(
+                    db, deadline, "codebase context",
+                    lambda: get_rag_service().retrieve_relevant_context(
+                        db=db,
+                        repository_id=pr_data['repository_id'],
+                        query=file_data['patch'][:500]  # Use first part of diff as query
+                    )
+                )
+        
+        # Generate review; oversized diffs are split into concurrently
+        # reviewed hunk windows
+        import asyncio
+        with observe_stage("llm"):
+            if len(file_data['patch']) > settings.max_diff_size:
+                review = asyncio.run(review_in_windows(
+                    get_llm_service(),
+                    file_path=file_data['filename'],
+                    patch=file_data['patch'],
+                    context=codebase_context,
+                    user_memory=user_context,
+                    deadline=deadline
                 ))
-            
-            # Generate review
-            import asyncio
-            review = asyncio.run(llm_service.generate_review(
-                code_diff=file_data['patch'],
-                file_path=file_data['filename'],
-                context=codebase_context,
-                user_memory=user_context
-            ))
-            
-            all_reviews.append({
-                "file": file_data['filename'],
-                "review": review
+            else:
+                review = asyncio.run(get_llm_service().generate_review(
+                    code_diff=file_data['patch'],
+                    file_path=file_data['filename'],
+                    context=codebase_context,
+                    user_memory=user_context,
+                    deadline=deadline
+                ))
+        
+        comments = format_review_comments(file_data['filename'], review)
+        publish_progress(pr_data, "file_reviewed", file=file_data['filename'], issues=len(comments))
+        
+        return {
+            "file": file_data['filename'],
+            "review": review,
+            "comments": comments
+        }
+    
+    except ReviewSuperseded:
+        return {"file": file_data['filename'], "superseded": True}
+    
+    except (DeadlineExceeded, SoftTimeLimitExceeded):
+        # Out of time: give this file up so the rest of the review is posted
+        return unreached_file(pr_data, file_data)
+    
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=30 * (2 ** self.request.retries))
+        logger.error(f"Giving up on {file_data['filename']}: {e}", exc_info=True)
+        publish_progress(pr_data, "file_reviewed", file=file_data['filename'], error=str(e))
+        return {"file": file_data['filename'], "error": str(e)}
+    
+    finally:
+        db.close()
+
+
+def queue_batch_review(
+    pr_data: Dict,
+    files_to_review: List[Dict],
+    user_context: str,
+    existing_comments: List[Dict],
+    db,
+    deadline: Deadline
+) -> str:
+    """
+    Queue a review's LLM requests for the Message Batches API.
+    
+    Returns the id the finalize task will be sent with once the batch
+    results are in.
+    """
+    from celery.utils import uuid
+    
+    llm_service = get_llm_service()
+    review_id = pr_data['review_id']
+    requests = []
+    files = []
+    for file_index, file_data in enumerate(files_to_review):
+        codebase_context = ""
+        if settings.enable_memory_persistence:
+            with observe_stage("rag"):
+                codebase_context = lookup_context(
+                    db, deadline, "codebase context",
+                    lambda: get_rag_service().retrieve_relevant_context(
+                        db=db,
+                        repository_id=pr_data['repository_id'],
+                        query=file_data['patch'][:500]
+                    )
+                )
+        
+        if len(file_data['patch']) > settings.max_diff_size:
+            windows = build_windows(file_data['patch'], settings.review_window_tokens, settings.review_window_context)
+            prompts = [(w.patch, window_context(w, file_data['filename'], codebase_context)) for w in windows]
+        else:
+            prompts = [(file_data['patch'], codebase_context)]
+        
+        for window_index, (code_diff, context) in enumerate(prompts):
+            requests.append({
+                "custom_id": custom_id(review_id, file_index, window_index),
+                "params": llm_service.review_params(
+                    code_diff=code_diff,
+                    file_path=file_data['filename'],
+                    context=context,
+                    user_memory=user_context
+                )
             })
-            
-            # Format comments for GitHub
-            if review.get('issues'):
-                for issue in review['issues']:
-                    comment_body = f"**{issue['severity'].upper()}**: {issue['description']}\n\n"
-                    if issue.get('suggestion'):
-                        comment_body += f"💡 **Suggestion**: {issue['suggestion']}"
-                    
-                    comment = {
-                        "path": file_data['filename'],
-                        "body": comment_body,
-                        "line": issue.get('line')
-                    }
-                    review_comments.append(comment)
+        files.append({"file": file_data['filename'], "patch": file_data['patch'], "windows": len(prompts)})
+    
+    finalize_task_id = uuid()
+    get_batch_review_store().add_review(review_id, {
+        "pr_data": pr_data,
+        "existing_comments": existing_comments,
+        "files": files,
+        "finalize_task_id": finalize_task_id,
+        "window_tokens": settings.review_window_tokens,
+        "window_context": settings.review_window_context
+    }, requests)
+    
+    logger.info(f"Queued {len(requests)} batch requests for PR #{pr_data['pr_number']}")
+    publish_progress(pr_data, "batched", requests=len(requests))
+    return finalize_task_id
+
+
+def batch_file_results(record: Dict, results: Dict[str, Dict]) -> List[Dict]:
+    """Per-file results, shaped like review_pr_file's, from a batched review."""
+    from types import SimpleNamespace
+    
+    llm_service = get_llm_service()
+    review_id = record['pr_data']['review_id']
+    file_results = []
+    for file_index, entry in enumerate(record['files']):
+        answers = [results[custom_id(review_id, file_index, w)] for w in range(entry['windows'])]
+        errors = [a['error'] for a in answers if 'error' in a]
+        if errors:
+            publish_progress(record['pr_data'], "file_reviewed", file=entry['file'], error=errors[0])
+            file_results.append({"file": entry['file'], "error": errors[0]})
+            continue
         
-        # Create overall review summary
-        summary_parts = ["## 🤖 AI Code Review\n"]
+        reviews = []
+        for answer in answers:
+            message = answer['message']
+            record_llm_usage(message.get('model', llm_service.model), SimpleNamespace(**message.get('usage', {})))
+            reviews.append(llm_service.parse_review(message['content'][0]['text']))
         
-        for file_review in all_reviews:
-            summary_parts.append(f"### 📄 {file_review['file']}")
-            summary_parts.append(file_review['review'].get('overall_assessment', 'No issues found'))
-            
-            if file_review['review'].get('positive_notes'):
-                summary_parts.append("\n✅ **Good practices:**")
-                for note in file_review['review']['positive_notes']:
-                    summary_parts.append(f"- {note}")
-            
-            summary_parts.append("")
+        if entry['windows'] > 1:
+            windows = build_windows(entry['patch'], record['window_tokens'], record['window_context'])
+            review = merge_window_reviews(windows, reviews)
+        else:
+            review = reviews[0]
+        
+        comments = format_review_comments(entry['file'], review)
+        publish_progress(record['pr_data'], "file_reviewed", file=entry['file'], issues=len(comments))
+        file_results.append({"file": entry['file'], "review": review, "comments": comments})
+    return file_results
+
+
+@celery_app.task(bind=True, max_retries=3)
+def finalize_pr_review(self, file_results: List[Dict], pr_data: Dict, existing_comments: List[Dict]):
+    """
+    Post the combined review (chord callback).
+    
+    Storing it in memory is a separate task, so a failed history write is
+    retried without posting the review again.
+    """
+    try:
+        coalescer = get_review_coalescer()
+        if any(r.get('superseded') for r in file_results):
+            raise ReviewSuperseded(f"Review of PR #{pr_data['pr_number']} superseded")
+        
+        all_reviews = [r for r in file_results if 'review' in r]
+        review_comments = [c for r in all_reviews for c in r['comments']]
         
-        summary = "\n".join(summary_parts)
+        # Posting a review of nothing would make the PR look reviewed
+        if file_results and not all_reviews:
+            return retry_unreviewed(pr_data, file_results)
+        
+        # Create overall review summary
+        summary = build_review_summary(file_results, pr_data.get('triage'))
+        
+        # Re-reviews should not repeat comments already on the PR
+        review_comments = dedupe_review_comments(review_comments, existing_comments)
         
         # Post review to GitHub
-        github_service.post_pr_review(
-            repo_name=pr_data['repository'],
-            pr_number=pr_data['pr_number'],
-            commit_id=pr_data['head_sha'],
-            body=summary,
-            event="COMMENT",
-            comments=review_comments
-        )
+        coalescer.ensure_current(pr_data)
+        github_service = get_github_service(pr_data['installation_id'])
+        with observe_stage("post"):
+            github_service.post_pr_review(
+                repo_name=pr_data['repository'],
+                pr_number=pr_data['pr_number'],
+                commit_id=pr_data['head_sha'],
+                body=summary,
+                event="COMMENT",
+                comments=review_comments
+            )
         
-        # Store review in memory
+        # Store review in memory; nothing after the post may retry this task
         if settings.enable_memory_persistence:
-            import asyncio
-            asyncio.run(memory_service.store_review_history(
-                db=db,
-                pr_number=pr_data['pr_number'],
-                repository_id=pr_data['repository_id'],
-                user_id=pr_data['author'],
-                review_content=summary,
-                comments_count=len(review_comments)
-            ))
+            try:
+                store_review_history.apply_async(
+                    args=[pr_data, summary, len(review_comments)],
+                    **queue_options(pr_data)
+                )
+            except Exception as e:
+                logger.error(f"Could not queue review history for PR #{pr_data['pr_number']}: {e}")
         
         logger.info(f"Successfully completed review for PR #{pr_data['pr_number']}")
+        finish_review(
+            pr_data, "posted",
+            files_reviewed=len(all_reviews),
+            comments=len(review_comments),
+            unreached=[r['file'] for r in file_results if r.get('unreached')]
+        )
         
         return {
             "status": "success",
@@ -163,9 +609,44 @@ def process_pr_review(self, pr_data: Dict):
             "comments_posted": len(review_comments)
         }
         
+    except ReviewSuperseded as e:
+        logger.info(str(e))
+        finish_review(pr_data, "superseded")
+        return {"status": "superseded", "pr_number": pr_data['pr_number']}
+    
+    except RateLimitExceededException as e:
+        # Only the post is repeated; file reviews are already done
+        wait = max(get_rate_limit_governor().wait_time(pr_data['installation_id']), 60)
+        raise self.retry(exc=e, countdown=wait)
+    
     except Exception as e:
-        logger.error(f"Error processing PR review: {e}", exc_info=True)
-        # Retry with exponential backoff
+        logger.error(f"Error posting PR review: {e}", exc_info=True)
+        if self.request.retries >= self.max_retries:
+            finish_review(pr_data, "failed", error=str(e))
+        raise self.retry(exc=e, countdown=60 * (2 ** self.request.retries))
+
+
+@celery_app.task(bind=True, max_retries=3)
+def store_review_history(self, pr_data: Dict, summary: str, comments_count: int):
+    """
+    Store a posted review in memory.
+    """
+    db = SessionLocal()
+    
+    try:
+        import asyncio
+        with observe_stage("history"):
+            asyncio.run(get_memory_service().store_review_history(
+                db=db,
+                pr_number=pr_data['pr_number'],
+                repository_id=pr_data['repository_id'],
+                user_id=pr_data['author'],
+                review_content=summary,
+                comments_count=comments_count
+            ))
+    
+    except Exception as e:
+        logger.error(f"Error storing review history: {e}", exc_info=True)
         raise self.retry(exc=e, countdown=60 * (2 ** self.request.retries))
     
     finally:
@@ -179,8 +660,14 @@ def process_review_command(self, review_data: Dict):
     
     Similar to process_pr_review but triggered by explicit command.
     """
-    # Reuse the PR review logic
-    return process_pr_review(review_data)
+    # Keep the per-file reviews on the interactive queue
+    review_data.setdefault('queue', 'interactive')
+    review_data.setdefault('review_id', self.request.id)
+    
+    # Reuse the PR review logic as its own task, so its retries and final
+    # failure (freeing the admission slot) happen as for any other review
+    result = process_pr_review.apply_async(args=[review_data], **queue_options(review_data))
+    return {"status": "dispatched", "pr_number": review_data['pr_number'], "review_task_id": result.id}
 
 
 @celery_app.task
@@ -246,3 +733,190 @@ def index_repository_code(repository_id: str, repository_name: str, installation
     
     finally:
         db.close()
+
+
+@celery_app.task(bind=True, max_retries=3)
+def ingest_feedback_batch(self, records: List[Dict]):
+    """
+    Bulk-ingest feedback records into user memory.
+    
+    Safe to retry: records already stored by an earlier attempt are
+    recognised by their dedupe key and skipped.
+    """
+    db = SessionLocal()
+    
+    def report_progress(processed: int, total: int):
+        self.update_state(
+            state="PROGRESS",
+            meta={"processed": processed, "total": total}
+        )
+    
+    try:
+        logger.info(f"Ingesting {len(records)} feedback records")
+        
+        memory_service = get_memory_service()
+        
+        import asyncio
+        counts = asyncio.run(memory_service.ingest_feedback_batch(
+            db=db,
+            records=records,
+            batch_size=settings.feedback_batch_size,
+            on_progress=report_progress
+        ))
+        
+        return {
+            "status": "success",
+            "total": len(records),
+            **counts
+        }
+    
+    except Exception as e:
+        logger.error(f"Error ingesting feedback: {e}", exc_info=True)
+        db.rollback()
+        raise self.retry(exc=e, countdown=60 * (2 ** self.request.retries))
+    
+    finally:
+        db.close()
+
+
+@celery_app.task(bind=True)
+def backfill_compact_vectors(self, batch_size: int = 1000, drop_float32: bool = False):
+    """
+    Populate the compact vector columns from existing float32 embeddings.
+    
+    Run this before switching VECTOR_STORAGE_MODE to "compact". Rows are
+    converted in batches and only rows without a half-precision copy are
+    touched, so the task can be re-run or resumed at any point. With
+    drop_float32 the original vectors are cleared to reclaim space.
+    """
+    db = SessionLocal()
+    
+    try:
+        converted = {}
+        
+        for table, key in (("code_chunks", "content_hash"), ("code_embeddings", "id"), ("user_memory", "id")):
+            clear_float32 = ", embedding = NULL" if drop_float32 else ""
+            statement = text(f"""
+                UPDATE {table}
+                SET embedding_half = embedding::halfvec(384),
+                    embedding_bits = binary_quantize(embedding)::bit(384){clear_float32}
+                WHERE {key} IN (
+                    SELECT {key} FROM {table}
+                    WHERE embedding_half IS NULL AND embedding IS NOT NULL
+                    LIMIT :batch_size
+                )
+            """)
+            
+            converted[table] = 0
+            while True:
+                result = db.execute(statement, {"batch_size": batch_size})
+                db.commit()
+                
+                if result.rowcount == 0:
+                    break
+                
+                converted[table] += result.rowcount
+                self.update_state(state="PROGRESS", meta={"converted": converted})
+            
+            logger.info(f"Backfilled {converted[table]} compact vectors in {table}")
+        
+        return {
+            "status": "success",
+            "converted": converted
+        }
+    
+    except Exception as e:
+        logger.error(f"Error backfilling compact vectors: {e}", exc_info=True)
+        raise
+    
+    finally:
+        db.close()
+
+
+@celery_app.task
+def prune_orphan_code_chunks():
+    """
+    Delete shared code chunks no repository references any more.
+    
+    Re-indexing a file replaces its chunk references, so chunks from old
+    versions of files accumulate until pruned. Schedule it while no
+    indexing runs, since a file being indexed may reference a chunk that
+    has no refs yet.
+    """
+    db = SessionLocal()
+    
+    try:
+        result = db.execute(text("""
+            DELETE FROM code_chunks
+            WHERE NOT EXISTS (
+                SELECT 1 FROM code_chunk_refs
+                WHERE code_chunk_refs.content_hash = code_chunks.content_hash
+            )
+        """))
+        db.commit()
+        
+        logger.info(f"Pruned {result.rowcount} orphaned code chunks")
+        
+        return {
+            "status": "success",
+            "pruned": result.rowcount
+        }
+    
+    finally:
+        db.close()
+
+
+@celery_app.task
+def process_message_batches():
+    """
+    Submit queued batch-mode requests and post reviews whose batches ended.
+    
+    Runs on the beat schedule every LLM_BATCH_POLL_INTERVAL seconds; a run
+    that overlaps the previous one does nothing.
+    """
+    store = get_batch_review_store()
+    client = get_message_batch_client()
+    lock = store.lock(timeout=settings.llm_batch_poll_interval * 5)
+    if not lock.acquire():
+        return {"status": "busy"}
+    
+    try:
+        batch_id = submit_pending(store, client, settings.llm_batch_max_requests)
+        
+        finalized = 0
+        for review_id in collect_results(store, client):
+            # Reviews stay completed until finish_review below, so a run that
+            # dies in between finalizes them next time instead of losing them
+            completed = store.completed_review(review_id)
+            if completed is None:
+                # Its record expired before it could be finalized
+                store.finish_review(review_id)
+                continue
+            record, results = completed
+            pr_data = record['pr_data']
+            try:
+                file_results = batch_file_results(record, results)
+            except Exception as e:
+                # Don't let one malformed review block the others every run
+                logger.error(f"Dropping batched review {review_id}: {e}", exc_info=True)
+                finish_review(pr_data, "failed", error=str(e))
+                store.finish_review(review_id)
+                continue
+            
+            finalize_pr_review.apply_async(
+                args=[file_results, pr_data, record['existing_comments']],
+                task_id=record['finalize_task_id'],
+                **queue_options(pr_data)
+            )
+            store.finish_review(review_id)
+            finalized += 1
+        
+        return {
+            "status": "ok",
+            "submitted_batch": batch_id,
+            "reviews_finalized": finalized,
+            "pending_requests": store.pending_count()
+        }
+    
+    finally:
+        lock.release()
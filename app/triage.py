@@ -0,0 +1,312 @@
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from app.config import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+REVIEW = "review"
+LOW_PRIORITY = "low"
+SKIP = "skip"
+
+# Files that are never worth an LLM call: lockfiles, vendored and build
+# output, minified and generated code
+DEFAULT_SKIP_PATTERNS = (
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml",
+    "poetry.lock", "Pipfile.lock", "uv.lock", "Cargo.lock", "go.sum",
+    "composer.lock", "Gemfile.lock", "mix.lock", "packages.lock.json",
+    "vendor/**", "node_modules/**", "third_party/**", "dist/**", "build/**",
+    "*.min.js", "*.min.css", "*.map", "*.snap",
+    "*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.generated.*", "*.g.dart",
+)
+DEFAULT_LOW_PRIORITY_PATTERNS = ("docs/**", "*.md", "*.rst", "*.txt", "*.svg", "CHANGELOG*")
+
+# Explicit markers generators put at the top of their output, looked for
+# in the first GENERATED_HEADER_LINES lines of new files only
+GENERATED_MARKERS = re.compile(
+    r"@generated\b|\bCode generated\b.*\bDO NOT EDIT\b|\bgenerated by\b.*\bdo not (?:edit|modify)\b",
+    re.IGNORECASE
+)
+GENERATED_HEADER_LINES = 5
+MINIFIED_LINE_LENGTH = 500  # average added line length of minified assets
+
+# Rules loaded per (repository, commit); files at a commit never change
+RULES_CACHE_SIZE = 256
+_rules_cache: "OrderedDict[Tuple[str, str], TriageRules]" = OrderedDict()
+_rules_cache_lock = threading.Lock()
+
+
+def glob_to_regex(pattern: str) -> re.Pattern:
+    """
+    Compile a gitignore-style glob.
+    
+    A pattern without a slash matches the file name at any depth; `**`
+    spans directories and `*` stays within one.
+    """
+    pattern = pattern.strip()
+    anchored = "/" in pattern.rstrip("/")
+    pattern = pattern.lstrip("/")
+    if pattern.endswith("/"):
+        pattern += "**"
+    
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return re.compile(regex + r"\Z")
+
+
+def path_matches(path: str, patterns) -> Optional[str]:
+    """First pattern matching path, if any."""
+    for pattern in patterns:
+        if glob_to_regex(pattern).match(path):
+            return pattern
+    return None
+
+
+def parse_gitattributes(text: str) -> List[Tuple[str, Dict[str, object]]]:
+    """(pattern, attributes) per line; `attr` is True, `-attr` False, `attr=v` "v"."""
+    rules = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        pattern, *tokens = line.split()
+        attributes = {}
+        for token in tokens:
+            if token.startswith("-"):
+                attributes[token[1:]] = False
+            elif "=" in token:
+                name, value = token.split("=", 1)
+                attributes[name] = value
+            else:
+                attributes[token] = True
+        rules.append((pattern, attributes))
+    return rules
+
+
+def gitattributes_for(path: str, rules: List[Tuple[str, Dict[str, object]]]) -> Dict[str, object]:
+    """Attributes of path; later lines override earlier ones, as in git."""
+    attributes: Dict[str, object] = {}
+    for pattern, attrs in rules:
+        if glob_to_regex(pattern).match(path):
+            attributes.update(attrs)
+    return attributes
+
+
+def _is_set(value) -> bool:
+    return value is True or (isinstance(value, str) and value.lower() in ("true", "1", "yes"))
+
+
+@dataclass
+class TriageRules:
+    """
+    Per-repository triage configuration.
+    
+    `review`, `skip` and `low_priority` are glob lists from the repository's
+    rule file; `review` overrides every other rule. `gitattributes` holds the
+    parsed .gitattributes of the PR head.
+    """
+    review: List[str] = field(default_factory=list)
+    skip: List[str] = field(default_factory=list)
+    low_priority: List[str] = field(default_factory=list)
+    gitattributes: List[Tuple[str, Dict[str, object]]] = field(default_factory=list)
+    
+    @classmethod
+    def from_files(cls, rule_file: Optional[str] = "", gitattributes: Optional[str] = "") -> "TriageRules":
+        rules = cls(gitattributes=parse_gitattributes(gitattributes or ""))
+        if not rule_file:
+            return rules
+        
+        import yaml
+        try:
+            config = yaml.safe_load(rule_file) or {}
+        except yaml.YAMLError as e:
+            logger.warning(f"Ignoring invalid triage rule file: {e}")
+            return rules
+        if not isinstance(config, dict):
+            logger.warning("Ignoring triage rule file: expected a mapping")
+            return rules
+        
+        for key in ("review", "skip", "low_priority"):
+            patterns = config.get(key) or []
+            if isinstance(patterns, list):
+                setattr(rules, key, [str(p) for p in patterns])
+        return rules
+
+
+@dataclass
+class TriageDecision:
+    file: str
+    action: str
+    reason: str = ""
+    
+    def to_dict(self) -> Dict:
+        return {"file": self.file, "action": self.action, "reason": self.reason}
+
+
+def change_lines(patch: str) -> Tuple[List[str], List[str]]:
+    """Added and removed lines of a patch, without their +/- prefix."""
+    added, removed = [], []
+    for line in patch.split("\n"):
+        if line.startswith("+"):
+            added.append(line[1:])
+        elif line.startswith("-"):
+            removed.append(line[1:])
+    return added, removed
+
+
+def hunk_texts(patch: str) -> List[Tuple[List[str], List[str]]]:
+    """(old lines, new lines) of each hunk, context included."""
+    hunks = []
+    for line in patch.split("\n"):
+        if line.startswith("@@"):
+            hunks.append(([], []))
+            continue
+        if not hunks or line.startswith("\\"):
+            continue
+        old, new = hunks[-1]
+        if not line.startswith("+"):
+            old.append(line[1:])
+        if not line.startswith("-"):
+            new.append(line[1:])
+    return hunks
+
+
+def _without_whitespace(lines: List[str]) -> List[str]:
+    return [s for s in ("".join(line.split()) for line in lines) if s]
+
+
+def is_whitespace_only(patch: str) -> bool:
+    """
+    Every hunk only adds, removes or changes whitespace.
+    
+    Old and new hunk text are compared line by line, in order, so moved or
+    reordered code still counts as a change.
+    """
+    hunks = hunk_texts(patch)
+    if not any(old != new for old, new in hunks):
+        return False
+    return all(_without_whitespace(old) == _without_whitespace(new) for old, new in hunks)
+
+
+def triage_file(file_data: Dict, rules: TriageRules) -> TriageDecision:
+    """Decide whether one changed file is reviewed, reviewed last, or skipped."""
+    path = file_data['filename']
+    patch = file_data.get('patch')
+    
+    if not patch:
+        if file_data.get('status') == "renamed":
+            return TriageDecision(path, SKIP, "renamed without changes")
+        return TriageDecision(path, SKIP, "no textual diff")
+    
+    pattern = path_matches(path, rules.review)
+    if pattern:
+        return TriageDecision(path, REVIEW, f"matches review rule `{pattern}`")
+    pattern = path_matches(path, rules.skip)
+    if pattern:
+        return TriageDecision(path, SKIP, f"matches skip rule `{pattern}`")
+    pattern = path_matches(path, rules.low_priority)
+    if pattern:
+        return TriageDecision(path, LOW_PRIORITY, f"matches low-priority rule `{pattern}`")
+    
+    attributes = gitattributes_for(path, rules.gitattributes)
+    for attribute in ("linguist-generated", "linguist-vendored"):
+        if _is_set(attributes.get(attribute)):
+            return TriageDecision(path, SKIP, f"{attribute} in .gitattributes")
+    if attributes.get("binary") is True or attributes.get("diff") is False:
+        return TriageDecision(path, SKIP, "marked binary in .gitattributes")
+    if _is_set(attributes.get("linguist-documentation")):
+        return TriageDecision(path, LOW_PRIORITY, "linguist-documentation in .gitattributes")
+    
+    pattern = path_matches(path, DEFAULT_SKIP_PATTERNS)
+    if pattern:
+        return TriageDecision(path, SKIP, f"matches `{pattern}`")
+    
+    added, _ = change_lines(patch)
+    if file_data.get('status') == "added" and any(
+        GENERATED_MARKERS.search(line) for line in added[:GENERATED_HEADER_LINES]
+    ):
+        return TriageDecision(path, SKIP, "generated file")
+    if added and sum(len(line) for line in added) / len(added) > MINIFIED_LINE_LENGTH:
+        return TriageDecision(path, SKIP, "minified")
+    if is_whitespace_only(patch):
+        return TriageDecision(path, SKIP, "whitespace-only changes")
+    
+    pattern = path_matches(path, DEFAULT_LOW_PRIORITY_PATTERNS)
+    if pattern:
+        return TriageDecision(path, LOW_PRIORITY, f"matches `{pattern}`")
+    return TriageDecision(path, REVIEW)
+
+
+def triage_files(
+    files: List[Dict],
+    rules: TriageRules,
+    max_low_priority: int = 2
+) -> Tuple[List[Dict], List[TriageDecision]]:
+    """
+    Files to send to the LLM, and the decision for every file.
+    
+    Low-priority files are reviewed after the rest, and only the first
+    max_low_priority of them; the others are skipped.
+    """
+    decisions = [triage_file(file_data, rules) for file_data in files]
+    
+    to_review = [f for f, d in zip(files, decisions) if d.action == REVIEW]
+    low = [(f, d) for f, d in zip(files, decisions) if d.action == LOW_PRIORITY]
+    for i, (file_data, decision) in enumerate(low):
+        if i < max_low_priority:
+            to_review.append(file_data)
+        else:
+            decision.action = SKIP
+            decision.reason += "; over the low-priority limit"
+    return to_review, decisions
+
+
+def load_triage_rules(github_service, repo_name: str, ref: str) -> TriageRules:
+    """
+    Fetch the repository's triage rule file and .gitattributes at ref.
+    
+    ref is a commit SHA, so the result (most often: neither file exists)
+    is cached unless a file couldn't be read.
+    """
+    key = (repo_name, ref)
+    with _rules_cache_lock:
+        if key in _rules_cache:
+            _rules_cache.move_to_end(key)
+            return _rules_cache[key]
+    
+    rule_file = None
+    if settings.triage_rules_path:
+        rule_file = github_service.get_file_content(repo_name, settings.triage_rules_path, ref)
+    gitattributes = github_service.get_file_content(repo_name, ".gitattributes", ref)
+    rules = TriageRules.from_files(rule_file, gitattributes)
+    
+    # "" is a read error (or an empty file): fetch again next time
+    if rule_file != "" and gitattributes != "":
+        with _rules_cache_lock:
+            _rules_cache[key] = rules
+            if len(_rules_cache) > RULES_CACHE_SIZE:
+                _rules_cache.popitem(last=False)
+    return rules
@@ -0,0 +1,6 @@
+"""
+Benchmarks for the PR Review Bot.
+
+Each module is runnable on its own, e.g.:
+    python -m benchmarks.vector_storage --help
+"""
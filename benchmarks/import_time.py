@@ -0,0 +1,100 @@
+"""
+Measure cold-start import cost of the API and worker entry points.
+
+Imports each module in fresh interpreters (as a new container would) and
+reports median import time, peak RSS, the slowest imports from
+`python -X importtime`, and which heavy dependencies were loaded. The API
+should not load any of them; only workers need the embedding model and
+the LLM client. Exits non-zero if the API does.
+
+Needs only the settings the app requires at import (e.g. from .env):
+    python -m benchmarks.import_time --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Loaded by workers only; the API process must stay free of them
+HEAVY_MODULES = ("app.tasks", "sentence_transformers", "torch", "transformers", "anthropic")
+ENTRY_POINTS = {"api": "app.main", "worker": "app.tasks"}
+
+CHILD = """
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": [m for m in {heavy!r} if m in sys.modules and m != {module!r}],
+}}))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int]]:
+    """(module, cumulative microseconds) from `python -X importtime` output."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            modules.append((name.strip(), int(cumulative)))
+    return modules
+
+
+def measure(module: str) -> Tuple[Dict, List[Tuple[str, int]]]:
+    """Import `module` in a fresh interpreter and return its stats and import times."""
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True,
+        text=True
+    )
+    if child.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{child.stderr[-2000:]}")
+    return json.loads(child.stdout.strip().splitlines()[-1]), parse_importtime(child.stderr)
+
+
+def run(module: str, runs: int, top: int) -> Dict:
+    samples = [measure(module) for _ in range(runs)]
+    stats = [s for s, _ in samples]
+    slowest = sorted(samples[-1][1], key=lambda m: m[1], reverse=True)
+    # Report top-level packages only: a parent's cumulative time includes its children
+    top_level = [(name, us) for name, us in slowest if "." not in name][:top]
+    return {
+        "module": module,
+        "seconds": round(statistics.median(s["seconds"] for s in stats), 3),
+        "rss_mb": round(statistics.median(s["rss_mb"] for s in stats), 1),
+        "heavy": stats[-1]["heavy"],
+        "slowest": [{"module": name, "ms": round(us / 1000, 1)} for name, us in top_level]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    parser.add_argument("--only", choices=sorted(ENTRY_POINTS), help="measure one entry point")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    
+    names = [args.only] if args.only else list(ENTRY_POINTS)
+    report = {name: run(ENTRY_POINTS[name], args.runs, args.top) for name in names}
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for name, result in report.items():
+            print(f"{name} ({result['module']}): {result['seconds']}s, {result['rss_mb']} MB peak RSS")
+            print(f"  heavy modules: {', '.join(result['heavy']) or 'none'}")
+            for entry in result["slowest"]:
+                print(f"  {entry['ms']:>9} ms  {entry['module']}")
+    
+    if report.get("api", {}).get("heavy"):
+        sys.exit(f"API process imports worker-only modules: {', '.join(report['api']['heavy'])}")
+
+
+if __name__ == "__main__":
+    main()
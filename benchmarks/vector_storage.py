@@ -0,0 +1,215 @@
+"""
+Compare float32 vector search against compact (halfvec + binary) storage.
+
+Loads synthetic clustered 384-dimension embeddings, spread over
+repositories of very different sizes, into a scratch table, builds the same
+indexes as init.sql, and runs per-repository searches the way
+EmbeddingService._nearest does. Reports recall@k against exact brute-force
+cosine within the repository, how often the exact-scan fallback ran, query
+latency and storage size for both paths.
+
+Requires a PostgreSQL database with pgvector >= 0.7:
+    python -m benchmarks.vector_storage --rows 50000 --queries 200
+"""
+import argparse
+import os
+import time
+from typing import List
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from app.embedding_service import quantize_binary
+
+DIMENSION = 384
+TABLE = "bench_vector_storage"
+
+FLOAT32_QUERY = text(f"""
+    SELECT id FROM {TABLE}
+    WHERE repository_id = :repository
+    ORDER BY embedding <=> CAST(:query AS vector)
+    LIMIT :k
+""")
+
+# Mirrors EmbeddingService._nearest_query in compact mode
+COMPACT_QUERY = text(f"""
+    SELECT id FROM {TABLE}
+    WHERE repository_id = :repository AND id IN (
+        SELECT id FROM {TABLE}
+        WHERE repository_id = :repository
+        ORDER BY embedding_bits <~> CAST(:bits AS bit({DIMENSION}))
+        LIMIT :candidates
+    )
+    ORDER BY embedding_half <=> CAST(:query AS halfvec)
+    LIMIT :k
+""")
+
+
+def synthetic_embeddings(count: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors grouped around random centres, like real code embeddings."""
+    centres = rng.standard_normal((clusters, DIMENSION))
+    vectors = centres[rng.integers(0, clusters, count)] + 0.35 * rng.standard_normal((count, DIMENSION))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def assign_repositories(count: int, repositories: int, rng: np.random.Generator) -> np.ndarray:
+    """Repository of each row: a few large repositories and many small ones."""
+    weights = 1.0 / np.arange(1, repositories + 1)
+    return rng.choice(repositories, size=count, p=weights / weights.sum())
+
+
+def to_literal(vector: np.ndarray) -> str:
+    return "[" + ",".join(f"{v:.6f}" for v in vector) + "]"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    return float(np.percentile(values, pct)) if values else 0.0
+
+
+def load(conn, vectors: np.ndarray, repositories: np.ndarray, chunk: int = 1000):
+    conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+    conn.execute(text(f"""
+        CREATE TABLE {TABLE} (
+            id INTEGER PRIMARY KEY,
+            repository_id INTEGER NOT NULL,
+            embedding vector({DIMENSION}),
+            embedding_half halfvec({DIMENSION}),
+            embedding_bits bit({DIMENSION})
+        )
+    """))
+
+    insert = text(f"""
+        INSERT INTO {TABLE} (id, repository_id, embedding, embedding_half, embedding_bits)
+        VALUES (:id, :repository, CAST(:vec AS vector), CAST(:vec AS halfvec), CAST(:bits AS bit({DIMENSION})))
+    """)
+    for start in range(0, len(vectors), chunk):
+        conn.execute(insert, [
+            {
+                "id": start + i, "repository": int(repositories[start + i]),
+                "vec": to_literal(v), "bits": quantize_binary(v)
+            }
+            for i, v in enumerate(vectors[start:start + chunk])
+        ])
+
+    lists = max(1, int(np.sqrt(len(vectors))))
+    conn.execute(text(f"CREATE INDEX ON {TABLE} USING ivfflat (embedding vector_cosine_ops) WITH (lists = {lists})"))
+    conn.execute(text(f"CREATE INDEX ON {TABLE} USING hnsw (embedding_bits bit_hamming_ops)"))
+    conn.execute(text(f"CREATE INDEX ON {TABLE} (repository_id)"))
+    conn.execute(text(f"ANALYZE {TABLE}"))
+
+
+def storage_report(conn) -> dict:
+    row = conn.execute(text(f"""
+        SELECT avg(pg_column_size(embedding)), avg(pg_column_size(embedding_half)),
+               avg(pg_column_size(embedding_bits))
+        FROM {TABLE}
+    """)).one()
+    indexes = conn.execute(text("""
+        SELECT indexdef, pg_relation_size(quote_ident(indexname)::regclass)
+        FROM pg_indexes
+        WHERE tablename = :table AND indexname <> :pkey
+    """), {"table": TABLE, "pkey": f"{TABLE}_pkey"}).all()
+    return {
+        "bytes_per_row": {"float32": row[0], "halfvec": row[1], "bits": row[2]},
+        "indexes": {definition.split(" USING ")[1]: size for definition, size in indexes},
+    }
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    vectors = synthetic_embeddings(args.rows, args.clusters, rng)
+    repositories = assign_repositories(args.rows, args.repositories, rng)
+    queries = synthetic_embeddings(args.queries, args.clusters, rng)
+    query_repositories = rng.choice(repositories, size=args.queries)
+
+    # Ground truth: exact cosine over float32 within the query's repository
+    truth = []
+    for query, repository in zip(queries, query_repositories):
+        rows = np.flatnonzero(repositories == repository)
+        truth.append(rows[np.argsort(-(vectors[rows] @ query))[:args.k]])
+
+    engine = create_engine(args.database_url)
+    with engine.begin() as conn:
+        print(f"Loading {args.rows} vectors...")
+        load(conn, vectors, repositories)
+
+    results = {}
+    with engine.connect() as conn:
+        for name, statement in (("float32", FLOAT32_QUERY), ("compact", COMPACT_QUERY)):
+            # Same index settings as widen_index_scan
+            candidates = args.k * args.oversample if name == "compact" else args.k
+            conn.execute(text(f"SET hnsw.ef_search = {min(max(args.ef_search, candidates), 1000)}"))
+            conn.execute(text(f"SET ivfflat.probes = {args.probes}"))
+
+            latencies, recalls, fallbacks = [], [], 0
+            for query, repository, expected in zip(queries, query_repositories, truth):
+                params = {
+                    "repository": int(repository),
+                    "query": to_literal(query),
+                    "bits": quantize_binary(query),
+                    "candidates": candidates,
+                    "k": args.k,
+                }
+                started = time.perf_counter()
+                ids = [row[0] for row in conn.execute(statement, params)]
+                if len(ids) < args.k:
+                    # Exact-scan fallback of EmbeddingService._nearest
+                    fallbacks += 1
+                    conn.execute(text("SET enable_indexscan = off"))
+                    ids = [row[0] for row in conn.execute(statement, params)]
+                    conn.execute(text("RESET enable_indexscan"))
+                latencies.append((time.perf_counter() - started) * 1000)
+                recalls.append(len(set(ids) & set(expected.tolist())) / len(expected))
+
+            results[name] = {
+                "recall": float(np.mean(recalls)),
+                "fallback": fallbacks / len(queries),
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+            }
+
+        storage = storage_report(conn)
+
+    if not args.keep:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+
+    print(
+        f"\nrows={args.rows} repositories={args.repositories} queries={args.queries} "
+        f"k={args.k} oversample={args.oversample} ef_search={args.ef_search} probes={args.probes}\n"
+    )
+    print(f"{'path':<10}{'recall@' + str(args.k):>12}{'fallback':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['recall']:>12.3f}{r['fallback']:>10.1%}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}")
+
+    print("\nAverage bytes per row:")
+    for column, size in storage["bytes_per_row"].items():
+        print(f"  {column:<10}{float(size or 0):>10.0f}")
+    print("Index sizes:")
+    for definition, size in storage["indexes"].items():
+        print(f"  {size / 1024 / 1024:>8.1f} MB  {definition}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--repositories", type=int, default=50)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--oversample", type=int, default=10)
+    parser.add_argument("--ef-search", type=int, default=100)
+    parser.add_argument("--probes", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch table afterwards")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
--- Enable pgvector extension
+-- Enable pgvector extension (>= 0.7: the tables below use halfvec and bit
+-- columns whatever VECTOR_STORAGE_MODE is)
 CREATE EXTENSION IF NOT EXISTS vector;
 
 -- User memory table
@@ -10,10 +11,17 @@ CREATE TABLE IF NOT EXISTS user_memory (
     content TEXT NOT NULL,
     metadata JSONB,
     embedding vector(384),
+    embedding_half halfvec(384),
+    embedding_bits bit(384),
+    dedupe_key VARCHAR(64),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Idempotency key for bulk feedback ingestion (for databases created before it existed)
+ALTER TABLE user_memory ADD COLUMN IF NOT EXISTS dedupe_key VARCHAR(64);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_memory_dedupe_key ON user_memory(dedupe_key);
+
 -- Code embeddings table
 CREATE TABLE IF NOT EXISTS code_embeddings (
     id SERIAL PRIMARY KEY,
@@ -21,10 +29,33 @@ CREATE TABLE IF NOT EXISTS code_embeddings (
     file_path TEXT NOT NULL,
     code_chunk TEXT NOT NULL,
     embedding vector(384),
+    embedding_half halfvec(384),
+    embedding_bits bit(384),
     metadata JSONB,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Content-addressed code chunks, shared across repositories and forks
+CREATE TABLE IF NOT EXISTS code_chunks (
+    content_hash VARCHAR(64) PRIMARY KEY,
+    code_chunk TEXT NOT NULL,
+    embedding vector(384),
+    embedding_half halfvec(384),
+    embedding_bits bit(384),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Where each chunk occurs
+CREATE TABLE IF NOT EXISTS code_chunk_refs (
+    id SERIAL PRIMARY KEY,
+    repository_id VARCHAR(255) NOT NULL,
+    file_path TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    content_hash VARCHAR(64) NOT NULL REFERENCES code_chunks(content_hash),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (repository_id, file_path, chunk_index)
+);
+
 -- PR review history table
 CREATE TABLE IF NOT EXISTS pr_reviews (
     id SERIAL PRIMARY KEY,
@@ -39,8 +70,36 @@ CREATE TABLE IF NOT EXISTS pr_reviews (
 -- Create indexes
 CREATE INDEX IF NOT EXISTS idx_user_memory_user_repo ON user_memory(user_id, repository_id);
 CREATE INDEX IF NOT EXISTS idx_code_embeddings_repo ON code_embeddings(repository_id);
+CREATE INDEX IF NOT EXISTS idx_code_chunk_refs_repo ON code_chunk_refs(repository_id);
+CREATE INDEX IF NOT EXISTS idx_code_chunk_refs_hash ON code_chunk_refs(content_hash);
 CREATE INDEX IF NOT EXISTS idx_pr_reviews_repo_pr ON pr_reviews(repository_id, pr_number);
 
 -- Create vector similarity search indexes
 CREATE INDEX IF NOT EXISTS idx_user_memory_embedding ON user_memory USING ivfflat (embedding vector_cosine_ops);
 CREATE INDEX IF NOT EXISTS idx_code_embeddings_embedding ON code_embeddings USING ivfflat (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS idx_code_chunks_embedding ON code_chunks USING ivfflat (embedding vector_cosine_ops);
+
+-- Compact vector storage (VECTOR_STORAGE_MODE=compact), for databases created before it existed
+ALTER TABLE user_memory ADD COLUMN IF NOT EXISTS embedding_half halfvec(384);
+ALTER TABLE user_memory ADD COLUMN IF NOT EXISTS embedding_bits bit(384);
+ALTER TABLE code_embeddings ADD COLUMN IF NOT EXISTS embedding_half halfvec(384);
+ALTER TABLE code_embeddings ADD COLUMN IF NOT EXISTS embedding_bits bit(384);
+
+CREATE INDEX IF NOT EXISTS idx_user_memory_embedding_bits ON user_memory USING hnsw (embedding_bits bit_hamming_ops);
+CREATE INDEX IF NOT EXISTS idx_code_embeddings_embedding_bits ON code_embeddings USING hnsw (embedding_bits bit_hamming_ops);
+CREATE INDEX IF NOT EXISTS idx_code_chunks_embedding_bits ON code_chunks USING hnsw (embedding_bits bit_hamming_ops);
+
+-- Move legacy code_embeddings rows into the content-addressed chunk store
+INSERT INTO code_chunks (content_hash, code_chunk, embedding, embedding_half, embedding_bits)
+SELECT DISTINCT ON (content_hash) content_hash, code_chunk, embedding, embedding_half, embedding_bits
+FROM (
+    SELECT encode(sha256(convert_to(code_chunk, 'UTF8')), 'hex') AS content_hash, *
+    FROM code_embeddings
+) legacy
+ON CONFLICT (content_hash) DO NOTHING;
+
+INSERT INTO code_chunk_refs (repository_id, file_path, chunk_index, content_hash)
+SELECT repository_id, file_path, COALESCE((metadata->>'chunk_index')::int, id),
+       encode(sha256(convert_to(code_chunk, 'UTF8')), 'hex')
+FROM code_embeddings
+ON CONFLICT (repository_id, file_path, chunk_index) DO NOTHING;
@@ -0,0 +1,399 @@
+"""
+Local stand-ins for external services, for tests and benchmarks.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.dialects import postgresql
+
+
+class FakeGitHubServer:
+    """
+    Minimal GitHub REST API served from a background thread.
+    
+    Routes map a path to a JSON-serialisable body (or raw bytes). Responses
+    carry an ETag and Vary and honour If-None-Match with 304, like
+    api.github.com.
+    A route without a query string also answers that path with any query.
+    POST routes map a path to a body or to a function of the request JSON.
+    Every request is recorded in `requests` as (method, path, headers), and
+    `latency` seconds are added to each response. Requests authorized with
+    a token in `revoked_tokens` get a 401.
+    """
+    
+    def __init__(
+        self,
+        routes: Optional[Dict[str, object]] = None,
+        post_routes: Optional[Dict[str, object]] = None,
+        latency: float = 0.0
+    ):
+        self.routes = dict(routes or {})
+        self.post_routes = dict(post_routes or {})
+        self.latency = latency
+        self.requests: List[Tuple[str, str, Dict[str, str]]] = []
+        self.rate_limit_remaining = 5000
+        self.revoked_tokens = set()
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+            
+            def do_GET(self):
+                server.requests.append(("GET", self.path, dict(self.headers)))
+                if server.latency:
+                    time.sleep(server.latency)
+                if self.headers.get("Authorization", "").split(" ")[-1] in server.revoked_tokens:
+                    self._send(401, b'{"message": "Bad credentials"}')
+                    return
+                body = server.routes.get(self.path)
+                if body is None:
+                    body = server.routes.get(self.path.split("?", 1)[0])
+                if body is None:
+                    self._send(404, b'{"message": "Not Found"}')
+                    return
+                
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, b"", etag)
+                    return
+                
+                server.rate_limit_remaining -= 1
+                self._send(200, body, etag)
+            
+            def do_POST(self):
+                server.requests.append(("POST", self.path, dict(self.headers)))
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"null")
+                if server.latency:
+                    time.sleep(server.latency)
+                body = server.post_routes.get(self.path.split("?", 1)[0])
+                if body is None:
+                    self._send(404, b'{"message": "Not Found"}')
+                    return
+                if callable(body):
+                    body = body(payload)
+                server.rate_limit_remaining -= 1
+                self._send(201, json.dumps(body).encode())
+            
+            def _send(self, status: int, body: bytes, etag: Optional[str] = None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("X-RateLimit-Limit", "5000")
+                self.send_header("X-RateLimit-Remaining", str(server.rate_limit_remaining))
+                if etag:
+                    self.send_header("ETag", etag)
+                    self.send_header("Vary", "Accept, Authorization, Cookie, X-GitHub-OTP")
+                self.end_headers()
+                self.wfile.write(body)
+        
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+    
+    def __enter__(self) -> "FakeGitHubServer":
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def count(self, path: str) -> int:
+        return sum(1 for _, p, _ in self.requests if p == path)
+
+
+class FakeAnthropicServer:
+    """
+    Anthropic Messages API stand-in (POST /v1/messages).
+    
+    Each call waits `latency` seconds and answers with a JSON review from
+    `review_fn(prompt)` padded to roughly `output_tokens` tokens. Usage is
+    reported as about one token per four characters, like the real API.
+    
+    Message Batches are served too: a batch ends `batch_latency` seconds
+    after it is created, and requests whose custom_id is in `fail_ids`
+    come back errored.
+    """
+    
+    def __init__(
+        self,
+        latency: float = 0.0,
+        output_tokens: int = 300,
+        review_fn: Optional[Callable[[str], Dict]] = None,
+        batch_latency: float = 0.0
+    ):
+        self.latency = latency
+        self.output_tokens = output_tokens
+        self.review_fn = review_fn or default_review
+        self.batch_latency = batch_latency
+        self.calls = 0
+        self.batches: Dict[str, Dict] = {}
+        self.fail_ids = set()
+        self._lock = threading.Lock()
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+            
+            def _send(self, payload, content_type="application/json"):
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length))
+                if self.path == "/v1/messages/batches":
+                    self._send(server.create_batch(request["requests"]))
+                    return
+                
+                with server._lock:
+                    server.calls += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                self._send(server.message(request))
+            
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                batch = server.batches.get(parts[3]) if len(parts) > 3 else None
+                if batch is None:
+                    self.send_error(404)
+                elif parts[-1] == "results":
+                    lines = [json.dumps(r) for r in batch["results"]]
+                    self._send("\n".join(lines).encode(), "application/x-jsonl")
+                else:
+                    self._send(server.batch_status(batch))
+        
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+    
+    def message(self, request: Dict) -> Dict:
+        prompt = "".join(
+            m["content"] if isinstance(m["content"], str) else json.dumps(m["content"])
+            for m in request["messages"]
+        )
+        text = self.review_text(prompt)
+        return {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": request["model"],
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": (len(prompt) + len(request.get("system") or "")) // 4,
+                "output_tokens": len(text) // 4
+            }
+        }
+    
+    def create_batch(self, requests: List[Dict]) -> Dict:
+        results = []
+        for request in requests:
+            if request["custom_id"] in self.fail_ids:
+                result = {"type": "errored", "error": {"type": "error", "error": {
+                    "type": "invalid_request_error", "message": "prompt is too long"
+                }}}
+            else:
+                with self._lock:
+                    self.calls += 1
+                result = {"type": "succeeded", "message": self.message(request["params"])}
+            results.append({"custom_id": request["custom_id"], "result": result})
+        
+        batch = {
+            "id": f"msgbatch_{uuid.uuid4().hex[:24]}",
+            "ends_at": time.monotonic() + self.batch_latency,
+            "results": results
+        }
+        self.batches[batch["id"]] = batch
+        return self.batch_status(batch)
+    
+    def batch_status(self, batch: Dict) -> Dict:
+        ended = time.monotonic() >= batch["ends_at"]
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else len(batch["results"]),
+                "succeeded": sum(r["result"]["type"] == "succeeded" for r in batch["results"]) if ended else 0,
+                "errored": sum(r["result"]["type"] == "errored" for r in batch["results"]) if ended else 0
+            },
+            "results_url": f"{self.url}/v1/messages/batches/{batch['id']}/results" if ended else None
+        }
+    
+    def review_text(self, prompt: str) -> str:
+        review = self.review_fn(prompt)
+        text = json.dumps(review)
+        missing = self.output_tokens * 4 - len(text)
+        if missing > 0:
+            review = {**review, "positive_notes": review.get("positive_notes", []) + ["ok " * (missing // 3)]}
+            text = json.dumps(review)
+        return text
+    
+    def __enter__(self) -> "FakeAnthropicServer":
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeAnthropicClient:
+    """
+    In-process stand-in for the SDK's Anthropic / AsyncAnthropic clients.
+    
+    messages.create() is answered by `server.message()` without HTTP, after
+    the server's latency; a call whose `timeout` is shorter raises
+    TimeoutError once it has passed. with_options() returns a client whose
+    `options` record what it was given, as the SDK's copies do.
+    """
+    
+    def __init__(self, server: FakeAnthropicServer, is_async: bool = False, options: Optional[Dict] = None):
+        self.server = server
+        self.is_async = is_async
+        self.options = options or {}
+        self.messages = SimpleNamespace(create=self._create_async if is_async else self._create)
+    
+    def with_options(self, **options) -> "FakeAnthropicClient":
+        return FakeAnthropicClient(self.server, self.is_async, {**self.options, **options})
+    
+    def _wait(self, timeout: Optional[float]) -> float:
+        with self.server._lock:
+            self.server.calls += 1
+        if timeout is not None and timeout < self.server.latency:
+            return timeout
+        return self.server.latency
+    
+    def _response(self, params: Dict, waited: float, timeout: Optional[float]):
+        if waited < self.server.latency:
+            raise TimeoutError(f"Request timed out after {timeout}s")
+        message = self.server.message(params)
+        return SimpleNamespace(
+            content=[SimpleNamespace(**block) for block in message["content"]],
+            usage=SimpleNamespace(**message["usage"])
+        )
+    
+    def _create(self, timeout: Optional[float] = None, **params):
+        waited = self._wait(timeout)
+        time.sleep(waited)
+        return self._response(params, waited, timeout)
+    
+    async def _create_async(self, timeout: Optional[float] = None, **params):
+        import asyncio
+        
+        waited = self._wait(timeout)
+        await asyncio.sleep(waited)
+        return self._response(params, waited, timeout)
+    
+    async def __aenter__(self) -> "FakeAnthropicClient":
+        return self
+    
+    async def __aexit__(self, *exc):
+        pass
+
+
+def default_review(prompt: str) -> Dict:
+    """A review with one minor issue on the first line."""
+    return {
+        "overall_assessment": "Looks reasonable.",
+        "issues": [{"line": 1, "severity": "minor", "description": "Consider a docstring.", "suggestion": "Add one."}],
+        "positive_notes": []
+    }
+
+
+class FakeSession:
+    """
+    SQLAlchemy session over in-memory tables, for the bulk-write paths.
+    
+    Handles multi-row INSERTs (skipping rows whose `unique` column is taken,
+    like ON CONFLICT DO NOTHING), and `query(...).filter(...)` with `==` and
+    `in_` conditions for iteration and delete. Tables are lists of dicts in
+    `tables`; executed INSERTs are also kept in `inserts`.
+    """
+    
+    def __init__(self, unique: Optional[Dict[str, str]] = None):
+        self.unique = unique or {"user_memory": "dedupe_key", "code_chunks": "content_hash"}
+        self.tables: Dict[str, List[Dict]] = defaultdict(list)
+        self.inserts: List[Tuple[str, List[Dict]]] = []
+        self.commits = 0
+    
+    @staticmethod
+    def insert_rows(statement) -> List[Dict]:
+        rows: Dict[int, Dict] = defaultdict(dict)
+        for name, value in statement.compile(dialect=postgresql.dialect()).params.items():
+            match = re.fullmatch(r"(.+)_m(\d+)", name)
+            column, index = (match.group(1), int(match.group(2))) if match else (name, 0)
+            rows[index][column] = value
+        return [rows[i] for i in sorted(rows)]
+    
+    def execute(self, statement):
+        table = statement.table.name
+        rows = self.insert_rows(statement)
+        self.inserts.append((table, rows))
+        
+        key = self.unique.get(table)
+        inserted = 0
+        for row in rows:
+            if key and any(r[key] == row[key] for r in self.tables[table]):
+                continue
+            self.tables[table].append(row)
+            inserted += 1
+        return SimpleNamespace(rowcount=inserted)
+    
+    def query(self, entity) -> "FakeQuery":
+        model = getattr(entity, "class_", entity)
+        return FakeQuery(self.tables[model.__tablename__])
+    
+    def commit(self):
+        self.commits += 1
+    
+    def rollback(self):
+        pass
+
+
+class FakeQuery:
+    def __init__(self, rows: List[Dict], conditions=()):
+        self.rows = rows
+        self.conditions = list(conditions)
+    
+    def filter(self, *conditions) -> "FakeQuery":
+        return FakeQuery(self.rows, self.conditions + list(conditions))
+    
+    def _matches(self, row: Dict) -> bool:
+        for condition in self.conditions:
+            value = condition.right.value
+            if isinstance(value, (list, tuple, set)):
+                if row.get(condition.left.key) not in value:
+                    return False
+            elif row.get(condition.left.key) != value:
+                return False
+        return True
+    
+    def __iter__(self):
+        return iter([SimpleNamespace(**row) for row in self.rows if self._matches(row)])
+    
+    def delete(self, synchronize_session=None) -> int:
+        kept = [row for row in self.rows if not self._matches(row)]
+        deleted = len(self.rows) - len(kept)
+        self.rows[:] = kept
+        return deleted
@@ -0,0 +1,78 @@
+import fakeredis
+import pytest
+
+from app.admission import AdmissionController, AdmissionRejected
+
+
+def pr(review_id, installation_id=1, pr_number=1, head_sha=None):
+    pr_data = {
+        "repository": "o/r", "pr_number": pr_number,
+        "installation_id": installation_id, "review_id": review_id
+    }
+    if head_sha:
+        pr_data["head_sha"] = head_sha
+    return pr_data
+
+
+def test_in_flight_limit_per_installation():
+    """Test that an installation is refused once its in-flight slots are taken."""
+    admission = AdmissionController(fakeredis.FakeRedis(), max_in_flight=2, retry_after=15)
+    admission.admit(pr("a"), queue="reviews")
+    admission.admit(pr("b"), queue="reviews")
+    
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit(pr("c"), queue="reviews")
+    assert rejected.value.retry_after == 15
+    
+    admission.admit(pr("d", installation_id=2), queue="reviews")
+    admission.release(pr("a"))
+    admission.admit(pr("c"), queue="reviews")
+    assert admission.in_flight(1) == 2
+
+
+def test_stale_slots_expire():
+    """Test that reviews that never finished stop counting after the TTL."""
+    admission = AdmissionController(fakeredis.FakeRedis(), max_in_flight=1, in_flight_ttl=0)
+    admission.admit(pr("a"), queue="reviews")
+    
+    admission.admit(pr("b"), queue="reviews")
+
+
+def test_queue_depth_across_priority_lists():
+    """Test that messages at every priority step count towards the queue depth."""
+    redis_client = fakeredis.FakeRedis()
+    redis_client.rpush("reviews", "m1")
+    redis_client.rpush("reviews:3", "m2", "m3")
+    redis_client.rpush("bulk:9", "m4")
+    admission = AdmissionController(redis_client, max_queue_depth=3)
+    
+    assert admission.queue_depth("reviews") == 3
+    with pytest.raises(AdmissionRejected):
+        admission.admit(pr("a"), queue="reviews")
+    admission.admit(pr("b"), queue="bulk")
+
+
+def test_duplicate_head_returns_original_task():
+    """Test that a repeated request for the same PR head is merged."""
+    admission = AdmissionController(fakeredis.FakeRedis())
+    first = pr("a", head_sha="abc")
+    admission.admit(first, queue="reviews")
+    
+    assert first["enqueued_at"] > 0
+    assert admission.duplicate_of(pr("b", head_sha="abc")) == "a"
+    assert admission.duplicate_of(pr("b", head_sha="def")) is None
+    assert admission.duplicate_of(pr("b")) is None
+
+
+def test_forget_drops_only_its_own_dedupe_key():
+    """Test that a failed or unqueued review stops answering repeats, newer ones kept."""
+    admission = AdmissionController(fakeredis.FakeRedis())
+    first = pr("a", head_sha="abc")
+    admission.admit(first, queue="reviews")
+    
+    admission.forget(first)
+    assert admission.duplicate_of(pr("b", head_sha="abc")) is None
+    
+    admission.admit(pr("b", head_sha="abc"), queue="reviews")
+    admission.forget(first)
+    assert admission.duplicate_of(pr("c", head_sha="abc")) == "b"
@@ -0,0 +1,39 @@
+from app.celery_app import QUEUES, TASK_QUEUES, celery_app
+
+
+def route(task_name: str) -> dict:
+    return celery_app.amqp.router.route({}, task_name)
+
+
+def test_tasks_routed_to_their_queues():
+    """Test that commands, reviews and indexing land on separate queues."""
+    assert route("app.tasks.process_review_command")["queue"].name == "interactive"
+    assert route("app.tasks.process_pr_review")["queue"].name == "reviews"
+    assert route("app.tasks.index_repository_code")["queue"].name == "bulk"
+
+
+def test_interactive_tasks_have_highest_priority():
+    """Test that interactive tasks carry a higher Redis priority than bulk work."""
+    assert route("app.tasks.process_review_command")["priority"] < route("app.tasks.index_repository_code")["priority"]
+
+
+def test_every_routed_queue_is_declared_with_limits():
+    """Test that each routed queue is declared and has time limits."""
+    declared = {queue.name for queue in celery_app.conf.task_queues}
+    
+    for task, queue in TASK_QUEUES.items():
+        assert queue in declared
+        annotation = celery_app.conf.task_annotations[task]
+        assert annotation["soft_time_limit"] < annotation["time_limit"] == QUEUES[queue]["time_limit"]
+
+
+def test_review_tasks_sent_with_their_queue_limits():
+    """Test that a bulk review runs under the bulk queue's limits its deadline is derived from."""
+    from app.deadline import task_deadline
+    from app.tasks import queue_options
+    
+    options = queue_options({"queue": "bulk"})
+    
+    assert (options["queue"], options["time_limit"]) == ("bulk", QUEUES["bulk"]["time_limit"])
+    assert task_deadline({"queue": "bulk"}).remaining() <= options["soft_time_limit"]
+    assert queue_options({})["soft_time_limit"] == QUEUES["reviews"]["soft_time_limit"]
@@ -0,0 +1,77 @@
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from celery.exceptions import SoftTimeLimitExceeded
+
+from app import tasks
+from app.celery_app import QUEUES
+from app.deadline import Deadline, DeadlineExceeded, task_deadline
+from tests.test_review_pipeline import FakeLLMService, pipeline  # noqa: F401
+
+
+def test_timeout_capped_by_time_available():
+    """Test that call timeouts shrink with the budget and stop at its end."""
+    deadline = Deadline(time.time() + 100, reserve=40)
+    
+    assert deadline.timeout(cap=120) == pytest.approx(60, abs=1)
+    assert deadline.timeout(cap=10) == 10
+    assert Deadline().timeout() is None and Deadline().timeout(cap=10) == 10
+    with pytest.raises(DeadlineExceeded):
+        Deadline(time.time() + 10, reserve=20).timeout(cap=5)
+
+
+def test_each_task_gets_its_queue_budget_from_when_it_starts():
+    """Test that the budget is the queue's soft limit, so queue wait doesn't count."""
+    deadline = task_deadline({"queue": "interactive"})
+    
+    assert deadline.remaining() == pytest.approx(QUEUES["interactive"]["soft_time_limit"], abs=1)
+    assert task_deadline({}).remaining() == pytest.approx(QUEUES["reviews"]["soft_time_limit"], abs=1)
+
+
+def test_review_with_no_file_reviewed_runs_again(pipeline, monkeypatch):  # noqa: F811
+    """Test that a review whose files all ran out of time is re-run, not posted."""
+    github_service, _ = pipeline
+    
+    class StuckLLMService(FakeLLMService):
+        async def generate_review(self, code_diff, file_path, **kwargs):
+            raise SoftTimeLimitExceeded()
+    
+    monkeypatch.setattr(tasks, "get_llm_service", StuckLLMService)
+    rerun = MagicMock()
+    monkeypatch.setattr(tasks.process_pr_review, "apply_async", rerun)
+    pr_data = {"pr_number": 1, "repository": "o/r", "repository_id": "o/r", "installation_id": 1}
+    
+    tasks.process_pr_review.apply(args=[pr_data])
+    
+    github_service.post_pr_review.assert_not_called()
+    rerun.assert_called_once()
+    rerun_data = rerun.call_args.kwargs["args"][0]
+    assert rerun_data["deadline_retries"] == 1
+    
+    # Out of re-runs: the review fails instead of being posted empty
+    file_results = [{"file": "a.py", "unreached": True}]
+    result = tasks.finalize_pr_review.apply(args=[file_results, {**rerun_data, "head_sha": "abc"}, []]).get()
+    
+    assert result["status"] == "failed"
+    github_service.post_pr_review.assert_not_called()
+
+
+def test_soft_time_limit_keeps_the_other_files(pipeline, monkeypatch):  # noqa: F811
+    """Test that a file cut off by the soft time limit doesn't sink the review."""
+    github_service, _ = pipeline
+    
+    class StuckLLMService(FakeLLMService):
+        async def generate_review(self, code_diff, file_path, **kwargs):
+            if file_path == "b.py":
+                raise SoftTimeLimitExceeded()
+            return await super().generate_review(code_diff, file_path, **kwargs)
+    
+    monkeypatch.setattr(tasks, "get_llm_service", StuckLLMService)
+    pr_data = {"pr_number": 1, "repository": "o/r", "repository_id": "o/r", "installation_id": 1}
+    
+    tasks.process_pr_review.apply(args=[pr_data])
+    
+    body = github_service.post_pr_review.call_args.kwargs["body"]
+    assert "Looks fine: a.py" in body
+    assert "Not reviewed (out of time):** `b.py`" in body
@@ -0,0 +1,107 @@
+from app.diff_parser import FileSelector, iter_lines, parse_patch, parse_unified_diff
+
+DIFF = """diff --git a/app/main.py b/app/main.py
+index 1111111..2222222 100644
+--- a/app/main.py
++++ b/app/main.py
+@@ -1,3 +1,4 @@ import os
+ import sys
++import json
+ 
+ def main():
+@@ -10 +11 @@ def main():
+-    pass
++    return 0
+diff --git a/docs/new.md b/docs/new.md
+new file mode 100644
+index 0000000..3333333
+--- /dev/null
++++ b/docs/new.md
+@@ -0,0 +1 @@
++# Title
+diff --git a/old.py b/old.py
+deleted file mode 100644
+index 4444444..0000000
+--- a/old.py
++++ /dev/null
+@@ -1,2 +0,0 @@
+-x = 1
+-y = 2
+diff --git a/a.py b/b.py
+similarity index 100%
+rename from a.py
+rename to b.py
+diff --git a/logo.png b/logo.png
+index 5555555..6666666 100644
+Binary files a/logo.png and b/logo.png differ
+"""
+
+
+def test_parses_files_and_hunks():
+    """Test that each file's status, counts and hunks are parsed."""
+    files = {f.filename: f for f in parse_unified_diff(DIFF.split("\n"))}
+    
+    main = files["app/main.py"]
+    assert main.status == "modified"
+    assert (main.additions, main.deletions) == (2, 1)
+    assert [(h.new_start, h.new_count) for h in main.hunks] == [(1, 4), (11, 1)]
+    assert main.patch.startswith("@@ -1,3 +1,4 @@ import os\n import sys\n+import json")
+    assert main.sha == "2222222"
+    
+    assert files["docs/new.md"].status == "added"
+    assert files["old.py"].status == "removed"
+    assert files["b.py"].status == "renamed"
+    assert files["b.py"].previous_filename == "a.py"
+    assert files["b.py"].patch is None
+    assert files["logo.png"].binary
+
+
+def test_oversized_patch_dropped_but_counted():
+    """Test that patches over the size limit are not retained."""
+    lines = ["diff --git a/big.py b/big.py", "--- a/big.py", "+++ b/big.py", "@@ -0,0 +1,1000 @@"]
+    lines += [f"+line {i}" for i in range(1000)]
+    
+    big = next(parse_unified_diff(lines, max_patch_size=500))
+    
+    assert big.truncated
+    assert big.patch is None
+    assert big.additions == 1000
+
+
+def test_selector_keeps_largest_changes_in_diff_order():
+    """Test that the selector keeps the top files and skips unreviewable ones."""
+    selector = FileSelector(max_files=2)
+    for diff_file in parse_unified_diff(DIFF.split("\n")):
+        selector.add(diff_file)
+    
+    assert [f.filename for f in selector.selected()] == ["app/main.py", "docs/new.md"]
+    assert selector.total == 5
+    assert selector.skipped == 2
+
+
+def test_selector_skips_before_choosing():
+    """Test that files the skip callback rejects don't take a place among the top files."""
+    selector = FileSelector(max_files=2, skip=lambda f: f["filename"] == "app/main.py")
+    for diff_file in parse_unified_diff(DIFF.split("\n")):
+        selector.add(diff_file)
+    
+    assert "app/main.py" not in [f.filename for f in selector.selected()]
+    assert len(selector.selected()) == 2
+    assert selector.skipped == 3
+
+
+def test_lines_split_across_chunks():
+    """Test that lines and multi-byte characters split across chunks are rejoined."""
+    data = "+café\r\n+x\x0cy\n".encode()
+    chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+    
+    assert list(iter_lines(chunks)) == ["+café\r", "+x\x0cy"]
+
+
+def test_parse_patch_from_files_api():
+    """Test that a files-API patch parses into hunks with line ranges."""
+    hunks = parse_patch("@@ -1 +1,2 @@\n-a\n+b\n+c")
+    
+    assert len(hunks) == 1
+    assert (hunks[0].old_count, hunks[0].new_count) == (1, 2)
+    assert hunks[0].lines == ["-a", "+b", "+c"]
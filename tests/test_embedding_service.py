@@ -0,0 +1,125 @@
+import asyncio
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Query, Session
+
+from app import embedding_service
+from app.database import CodeChunk, CodeChunkRef
+from app.embedding_service import EmbeddingService, chunk_hash, quantize_binary
+from tests.fakes import FakeSession
+
+
+def make_service() -> EmbeddingService:
+    # Skip loading the sentence-transformers model
+    return EmbeddingService.__new__(EmbeddingService)
+
+
+def make_session(monkeypatch) -> Session:
+    """Postgres session that records statements instead of connecting."""
+    db = Session(create_engine("postgresql://u:p@localhost/db"))
+    db.statements = []
+    monkeypatch.setattr(db, "execute", lambda statement, *args, **kwargs: db.statements.append(str(statement)))
+    return db
+
+
+def repository_chunks(db: Session, repository_id: str) -> Query:
+    return db.query(CodeChunkRef).join(CodeChunkRef.chunk).filter(CodeChunkRef.repository_id == repository_id)
+
+
+def test_compact_mode_stores_halfvec_and_sign_bits(monkeypatch):
+    """Test that compact rows keep a half-precision copy and one sign bit per dimension."""
+    monkeypatch.setattr(embedding_service.settings, "vector_storage_mode", "compact")
+    embedding = [0.3, -0.1, 0.0, 2.0]
+    
+    assert quantize_binary(embedding) == "1001"
+    assert make_service().vector_columns(embedding) == {
+        "embedding": None, "embedding_half": embedding, "embedding_bits": "1001"
+    }
+    
+    monkeypatch.setattr(embedding_service.settings, "vector_storage_mode", "float32")
+    assert make_service().vector_columns(embedding) == {"embedding": embedding}
+
+
+def test_compact_search_reranks_hamming_candidates(monkeypatch):
+    """Test that compact mode reranks the repository's nearest bit vectors by halfvec cosine."""
+    monkeypatch.setattr(embedding_service.settings, "vector_storage_mode", "compact")
+    monkeypatch.setattr(embedding_service.settings, "vector_rerank_oversample", 10)
+    db = make_session(monkeypatch)
+    
+    query = make_service()._nearest_query(repository_chunks(db, "o/r"), CodeChunk, CodeChunkRef.id, [0.5, -0.5], 5)
+    compiled = query.statement.compile(dialect=postgresql.dialect())
+    sql = " ".join(str(compiled).split())
+    
+    candidates, rerank = sql.split(") AS anon_1)")
+    assert "code_chunk_refs.repository_id = %(repository_id_1)s ORDER BY code_chunks.embedding_bits <~>" in candidates
+    assert rerank.startswith(" ORDER BY code_chunks.embedding_half <=> %(embedding_half_1)s")
+    assert compiled.params["embedding_bits_1"] == "10"
+    assert (compiled.params["param_1"], compiled.params["param_2"]) == (50, 5)
+
+
+def test_short_index_results_rescanned_exactly(monkeypatch):
+    """Test that a repository the index under-serves is searched again without it."""
+    monkeypatch.setattr(embedding_service.settings, "vector_storage_mode", "compact")
+    monkeypatch.setattr(embedding_service.settings, "vector_rerank_oversample", 10)
+    monkeypatch.setattr(embedding_service.settings, "vector_hnsw_ef_search", 40)
+    monkeypatch.setattr(embedding_service.settings, "vector_ivfflat_probes", 10)
+    db = make_session(monkeypatch)
+    results = iter([["a"], ["a", "b", "c"]])
+    monkeypatch.setattr(Query, "all", lambda self: next(results))
+    
+    found = make_service()._nearest(repository_chunks(db, "o/r"), CodeChunk, CodeChunkRef.id, [0.5, -0.5], 3)
+    
+    assert found == ["a", "b", "c"]
+    assert db.statements == [
+        "SET LOCAL hnsw.ef_search = 40",
+        "SET LOCAL ivfflat.probes = 10",
+        "SET LOCAL enable_indexscan = off",
+        "RESET enable_indexscan"
+    ]
+
+
+def test_code_search_fills_limit_for_one_repository(monkeypatch):
+    """Test that a repository's search returns limit chunks though the ivfflat scan found fewer."""
+    monkeypatch.setattr(embedding_service.settings, "vector_storage_mode", "float32")
+    monkeypatch.setattr(embedding_service.settings, "vector_ivfflat_probes", 20)
+    db = make_session(monkeypatch)
+    service = make_service()
+    service.create_embedding = lambda text: [0.5, -0.5]
+    ranked = iter([["r1", "r2"], ["r1", "r2", "r3", "r4", "r5"]])
+    monkeypatch.setattr(Query, "all", lambda self: next(ranked))
+    
+    found = asyncio.run(service.search_similar_code(db, "o/small", "def f(): pass", limit=5))
+    
+    assert len(found) == 5
+    assert "SET LOCAL ivfflat.probes = 20" in db.statements
+    assert "SET LOCAL enable_indexscan = off" in db.statements
+
+
+def test_chunks_shared_across_repositories_embedded_once():
+    """Test that only unseen chunk hashes are embedded and refs point at shared chunks."""
+    service = make_service()
+    embedded = []
+    
+    def create_embeddings_batch(texts):
+        embedded.extend(texts)
+        return [[0.1, -0.2] for _ in texts]
+    
+    service.create_embeddings_batch = create_embeddings_batch
+    db = FakeSession()
+    
+    first = asyncio.run(service.store_code_chunks(db, "o/r", "a.py", ["x = 1", "y = 2", "x = 1", "  "]))
+    fork = asyncio.run(service.store_code_chunks(db, "fork/r", "a.py", ["x = 1", "z = 3"]))
+    
+    assert (first, fork) == (2, 1)
+    assert embedded == ["x = 1", "y = 2", "z = 3"]
+    assert len(db.tables["code_chunks"]) == 3
+    refs = {(r["repository_id"], r["chunk_index"]): r["content_hash"] for r in db.tables["code_chunk_refs"]}
+    assert refs == {
+        ("o/r", 0): chunk_hash("x = 1"), ("o/r", 1): chunk_hash("y = 2"), ("o/r", 2): chunk_hash("x = 1"),
+        ("fork/r", 0): chunk_hash("x = 1"), ("fork/r", 1): chunk_hash("z = 3")
+    }
+    
+    # Re-indexing a file replaces its refs and embeds nothing new
+    assert asyncio.run(service.store_code_chunks(db, "o/r", "a.py", ["y = 2"])) == 0
+    assert [r["chunk_index"] for r in db.tables["code_chunk_refs"] if r["repository_id"] == "o/r"] == [0]
@@ -0,0 +1,229 @@
+import asyncio
+
+import httpx
+import pytest
+from github import GithubException, RateLimitExceededException
+
+from app.deadline import Deadline, DeadlineExceeded
+from app.github_async import AsyncGitHubClient, AsyncGitHubService, BlockingGitHubService
+
+PR = {
+    "title": "Add feature",
+    "body": None,
+    "user": {"login": "octocat"},
+    "head": {"sha": "abc123"},
+    "base": {"sha": "def456"},
+    "state": "open",
+    "created_at": "2025-01-01T00:00:00Z",
+    "updated_at": "2025-01-02T00:00:00Z"
+}
+
+
+def make_file(i: int) -> dict:
+    return {
+        "filename": f"file{i}.py", "status": "modified", "additions": 1,
+        "deletions": 0, "changes": 1, "patch": "@@ -1 +1 @@\n+x", "sha": f"sha{i}"
+    }
+
+
+class FakeGitHub:
+    """Answers the REST endpoints the review path uses, recording requests."""
+    
+    def __init__(self, file_count: int = 250, failures: int = 0, comments=()):
+        self.files = [make_file(i) for i in range(file_count)]
+        self.comments = list(comments)
+        self.failures = failures
+        self.requests = []
+    
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.failures:
+            self.failures -= 1
+            return httpx.Response(502)
+        
+        path = request.url.path
+        if request.headers.get("Accept") == "application/vnd.github.diff":
+            return httpx.Response(200, content="".join(
+                f"diff --git a/{f['filename']} b/{f['filename']}\n--- a/{f['filename']}\n"
+                f"+++ b/{f['filename']}\n{f['patch']}\n"
+                for f in self.files
+            ).encode())
+        if path.endswith("/files"):
+            page = int(request.url.params["page"])
+            per_page = int(request.url.params["per_page"])
+            last = -(-len(self.files) // per_page)
+            link = f'<{path}?per_page={per_page}&page={last}>; rel="last"'
+            body = self.files[(page - 1) * per_page:page * per_page]
+            return httpx.Response(200, json=body, headers={"Link": link})
+        if path.endswith("/comments") and request.method == "GET":
+            return httpx.Response(200, json=self.comments)
+        if path.endswith("/pulls/1"):
+            return httpx.Response(200, json=PR)
+        if path.endswith("/reviews") or path.endswith("/comments"):
+            return httpx.Response(201, json={"id": 1})
+        return httpx.Response(404, json={"message": "Not Found"})
+
+
+def make_service(fake: FakeGitHub, bot_login=None) -> AsyncGitHubService:
+    http = httpx.AsyncClient(base_url="https://api.github.test", transport=httpx.MockTransport(fake))
+    return AsyncGitHubService(AsyncGitHubClient(http, token_provider=lambda: "token", backoff=0), bot_login)
+
+
+def test_snapshot_fetches_pages_concurrently():
+    """Test that all file pages are fetched and formatted like GitHubService."""
+    fake = FakeGitHub(file_count=250)
+    snapshot = asyncio.run(make_service(fake).get_pr_snapshot("owner/repo", 1, max_files=250))
+    
+    assert snapshot["info"]["author"] == "octocat"
+    assert snapshot["info"]["description"] == ""
+    assert len(snapshot["files"]) == 250
+    assert snapshot["files"][249]["filename"] == "file249.py"
+    pages = sorted(int(r.url.params["page"]) for r in fake.requests if r.url.path.endswith("/files"))
+    assert pages == [1, 2, 3]
+
+
+def test_snapshot_lists_bot_comments():
+    """Test that the REST snapshot fetches only the bot's existing comments."""
+    fake = FakeGitHub(file_count=1, comments=[
+        {"path": "file0.py", "line": 3, "body": "**LOW**: nit", "user": {"login": "review-bot[bot]"}},
+        {"path": "file0.py", "line": 3, "body": "thanks", "user": {"login": "octocat"}}
+    ])
+    snapshot = asyncio.run(make_service(fake, "review-bot[bot]").get_pr_snapshot("owner/repo", 1))
+    
+    assert snapshot["existing_comments"] == [{"path": "file0.py", "line": 3, "body": "**LOW**: nit"}]
+
+
+def test_max_files_limits_pages():
+    """Test that pages beyond max_files are not requested."""
+    fake = FakeGitHub(file_count=250)
+    files = asyncio.run(make_service(fake).get_pr_files("owner/repo", 1, max_files=10))
+    
+    assert len(files) == 10
+    assert len(fake.requests) == 1
+
+
+def test_skipped_files_not_counted_against_max_files():
+    """Test that files left out by skip make room for files on later pages."""
+    fake = FakeGitHub(file_count=250)
+    
+    def skip(file_data):
+        return int(file_data["filename"][4:-3]) < 200
+    
+    files = asyncio.run(make_service(fake).get_pr_files("owner/repo", 1, max_files=10, skip=skip))
+    
+    assert [f["filename"] for f in files] == [f"file{i}.py" for i in range(200, 210)]
+
+
+def test_unified_diff_mode_uses_one_request():
+    """Test that diff mode considers every file from a single request."""
+    fake = FakeGitHub(file_count=2000)
+    files = asyncio.run(make_service(fake).get_pr_diff_files("owner/repo", 1, max_files=10))
+    
+    assert len(files) == 10
+    assert files[0]["patch"] == "@@ -1 +1 @@\n+x"
+    assert files[0]["additions"] == 1
+    assert len(fake.requests) == 1
+
+
+def test_server_errors_retried():
+    """Test that 5xx responses are retried before succeeding."""
+    fake = FakeGitHub(failures=2)
+    info = asyncio.run(make_service(fake).get_pr_info("owner/repo", 1))
+    
+    assert info["head_sha"] == "abc123"
+    assert len(fake.requests) == 3
+
+
+def test_server_error_on_post_not_retried():
+    """Test that a 502 answering a review POST is raised, since the review may have been posted."""
+    fake = FakeGitHub(failures=1)
+    
+    with pytest.raises(GithubException):
+        asyncio.run(make_service(fake).post_pr_review("owner/repo", 1, "abc123", "body", comments=[]))
+    
+    assert [r.method for r in fake.requests] == ["POST"]
+
+
+def test_unsent_post_retried():
+    """Test that a POST which never reached GitHub is sent again."""
+    attempts = []
+    
+    def handler(request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(201, json={"id": 1})
+    
+    http = httpx.AsyncClient(base_url="https://api.github.test", transport=httpx.MockTransport(handler))
+    client = AsyncGitHubClient(http, token_provider=lambda: "token", backoff=0)
+    
+    asyncio.run(client.request("POST", "/repos/owner/repo/issues/1/comments", json={"body": "hi"}))
+    
+    assert len(attempts) == 2
+
+
+def test_rejected_token_retried_with_new_one():
+    """Test that a 401 reports the token and the request is sent once more with a new one."""
+    tokens = ["old", "new"]
+    rejected = []
+    
+    def handler(request):
+        if request.headers["Authorization"] == "token old":
+            return httpx.Response(401, json={"message": "Bad credentials"})
+        return httpx.Response(200, json={"ok": True})
+    
+    def token_rejected(token):
+        rejected.append(token)
+        tokens.pop(0)
+    
+    http = httpx.AsyncClient(base_url="https://api.github.test", transport=httpx.MockTransport(handler))
+    client = AsyncGitHubClient(http, token_provider=lambda: tokens[0], backoff=0, token_rejected=token_rejected)
+    
+    response = asyncio.run(client.request("POST", "/repos/owner/repo/issues/1/comments", json={"body": "hi"}))
+    
+    assert response.json() == {"ok": True}
+    assert rejected == ["old"]
+
+
+def test_primary_rate_limit_not_retried():
+    """Test that an exhausted rate limit raises immediately."""
+    def handler(request):
+        return httpx.Response(403, json={"message": "API rate limit exceeded"}, headers={
+            "X-RateLimit-Remaining": "0"
+        })
+    
+    http = httpx.AsyncClient(base_url="https://api.github.test", transport=httpx.MockTransport(handler))
+    service = AsyncGitHubService(AsyncGitHubClient(http, token_provider=lambda: "token", backoff=0))
+    
+    with pytest.raises(RateLimitExceededException):
+        asyncio.run(service.get_pr_info("owner/repo", 1))
+
+
+def test_blocking_facade_posts_review():
+    """Test that the synchronous facade runs coroutines and posts reviews."""
+    fake = FakeGitHub()
+    service = BlockingGitHubService(make_service(fake))
+    
+    service.post_pr_review("owner/repo", 1, "abc123", "body", comments=[
+        {"path": "file0.py", "line": 1, "body": "nit"},
+        {"path": "file1.py", "line": None, "body": "dropped"}
+    ])
+    
+    review = fake.requests[-1]
+    assert review.url.path == "/repos/owner/repo/pulls/1/reviews"
+    assert review.headers["Authorization"] == "token token"
+    assert b'"file1.py"' not in review.content
+    with pytest.raises(GithubException):
+        service.get_pr_info("owner/repo", 2)
+
+
+def test_blocking_facade_times_each_call_from_the_deadline():
+    """Test that each call gets the time left when it starts, not when the service was made."""
+    import time
+    
+    service = BlockingGitHubService(make_service(FakeGitHub()), Deadline(time.time() + 0.3))
+    
+    assert service.get_pr_info("owner/repo", 1)["head_sha"] == "abc123"
+    time.sleep(0.4)
+    with pytest.raises(DeadlineExceeded):
+        service.get_pr_info("owner/repo", 1)
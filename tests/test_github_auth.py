@@ -0,0 +1,149 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import requests
+
+from app import github_auth
+from app.github_auth import InstallationTokenCache, retry_rejected_token
+from tests.fakes import FakeGitHubServer
+
+
+class FakeAppAuth:
+    """Stands in for GitHubAppAuth, issuing numbered tokens."""
+    
+    def __init__(self, lifetime: int = 3600, delay: float = 0):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.calls = 0
+    
+    def create_installation_token(self, installation_id: int):
+        time.sleep(self.delay)
+        self.calls += 1
+        return SimpleNamespace(
+            token=f"token-{installation_id}-{self.calls}",
+            expires_at=datetime.now(timezone.utc) + timedelta(seconds=self.lifetime)
+        )
+
+
+class FakeRedis:
+    """Minimal in-memory subset of the redis client used by the cache."""
+    
+    def __init__(self):
+        self.data = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        return self.data.get(key)
+    
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+    
+    def delete(self, key):
+        self.data.pop(key, None)
+    
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        return self._lock
+
+
+def test_token_reused_until_refresh_margin():
+    """Test that a cached token is returned without a new request."""
+    app_auth = FakeAppAuth()
+    cache = InstallationTokenCache(app_auth, refresh_margin=300)
+    
+    assert cache.get_token(1) == "token-1-1"
+    assert cache.get_token(1) == "token-1-1"
+    assert app_auth.calls == 1
+
+
+def test_token_refreshed_near_expiry():
+    """Test that tokens inside the refresh margin are replaced."""
+    app_auth = FakeAppAuth(lifetime=200)
+    cache = InstallationTokenCache(app_auth, refresh_margin=300)
+    
+    cache.get_token(1)
+    cache.get_token(1)
+    assert app_auth.calls == 2
+
+
+def test_tokens_keyed_by_installation():
+    """Test that each installation gets its own token."""
+    app_auth = FakeAppAuth()
+    cache = InstallationTokenCache(app_auth)
+    
+    assert cache.get_token(1) != cache.get_token(2)
+    assert app_auth.calls == 2
+
+
+def test_concurrent_refresh_is_single_flight():
+    """Test that concurrent callers share one token request."""
+    app_auth = FakeAppAuth(delay=0.05)
+    cache = InstallationTokenCache(app_auth)
+    
+    threads = [threading.Thread(target=cache.get_token, args=(1,)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert app_auth.calls == 1
+
+
+def test_redis_tier_shared_between_caches():
+    """Test that a second worker picks up the token from Redis."""
+    app_auth = FakeAppAuth()
+    redis_client = FakeRedis()
+    first = InstallationTokenCache(app_auth, redis_client=redis_client)
+    second = InstallationTokenCache(app_auth, redis_client=redis_client)
+    
+    assert first.get_token(1) == second.get_token(1)
+    assert app_auth.calls == 1
+
+
+def test_invalidate_forces_new_token():
+    """Test that invalidated tokens are requested again."""
+    app_auth = FakeAppAuth()
+    cache = InstallationTokenCache(app_auth, redis_client=FakeRedis())
+    
+    cache.get_token(1)
+    cache.invalidate(1)
+    
+    assert cache.get_token(1) == "token-1-2"
+
+
+def test_invalidate_spares_replaced_token():
+    """Test that invalidating a token someone already replaced keeps the new one."""
+    app_auth = FakeAppAuth()
+    cache = InstallationTokenCache(app_auth, redis_client=FakeRedis())
+    
+    cache.get_token(1)
+    cache.invalidate(1, "token-1-1")
+    assert cache.get_token(1) == "token-1-2"
+    
+    cache.invalidate(1, "token-1-1")
+    
+    assert cache.get_token(1) == "token-1-2"
+    assert cache.installation_for_token("token-1-1") is None
+    assert cache.installation_for_token("token-1-2") == 1
+
+
+def test_rejected_token_retried_with_new_one(monkeypatch):
+    """Test that a 401 invalidates the cached token and the request is sent again."""
+    cache = InstallationTokenCache(FakeAppAuth())
+    monkeypatch.setattr(github_auth, "_token_cache", cache)
+    
+    with FakeGitHubServer({"/repos/o/r/pulls/1": {"title": "x"}}) as server:
+        server.revoked_tokens.add(cache.get_token(1))
+        session = requests.Session()
+        session.hooks["response"].append(retry_rejected_token)
+        response = session.get(
+            f"{server.url}/repos/o/r/pulls/1",
+            headers={"Authorization": f"token {cache.get_token(1)}"}
+        )
+        
+        assert response.status_code == 200
+        assert response.history[0].status_code == 401
+        assert server.requests[1][2]["Authorization"] == "token token-1-2"
+    
+    assert cache.get_token(1) == "token-1-2"
@@ -0,0 +1,147 @@
+import requests
+
+from app.github_cache import ConditionalCacheAdapter, DiskCacheStore, HTTPCache, CachedResponse
+from tests.fakes import FakeGitHubServer
+
+
+def make_session(cache: HTTPCache) -> requests.Session:
+    session = requests.Session()
+    session.mount("http://", ConditionalCacheAdapter(cache))
+    return session
+
+
+def test_revalidated_response_served_from_cache(tmp_path):
+    """Test that a 304 is answered with the cached body."""
+    pr = {"number": 1, "title": "Add feature"}
+    cache = HTTPCache(DiskCacheStore(str(tmp_path), max_bytes=1024 * 1024))
+    
+    with FakeGitHubServer({"/repos/o/r/pulls/1": pr}) as server:
+        session = make_session(cache)
+        first = session.get(f"{server.url}/repos/o/r/pulls/1")
+        second = session.get(f"{server.url}/repos/o/r/pulls/1")
+        
+        assert first.json() == pr
+        assert second.status_code == 200
+        assert second.json() == pr
+        assert server.requests[1][2].get("If-None-Match") == first.headers["ETag"]
+        assert server.rate_limit_remaining == 4999
+    
+    assert cache.stats == {"hits": 1, "misses": 1, "stored": 1}
+
+
+def test_changed_resource_refetched(tmp_path):
+    """Test that a changed resource replaces the cached body."""
+    cache = HTTPCache(DiskCacheStore(str(tmp_path), max_bytes=1024 * 1024))
+    
+    with FakeGitHubServer({"/repos/o/r/pulls/1": {"title": "old"}}) as server:
+        session = make_session(cache)
+        session.get(f"{server.url}/repos/o/r/pulls/1")
+        server.routes["/repos/o/r/pulls/1"] = {"title": "new"}
+        
+        assert session.get(f"{server.url}/repos/o/r/pulls/1").json() == {"title": "new"}
+        assert session.get(f"{server.url}/repos/o/r/pulls/1").json() == {"title": "new"}
+    
+    assert cache.stats["hits"] == 1
+
+
+def test_media_types_cached_separately(tmp_path):
+    """Test that the same URL with a different Accept header is a different entry."""
+    cache = HTTPCache(DiskCacheStore(str(tmp_path), max_bytes=1024 * 1024))
+    
+    with FakeGitHubServer({"/repos/o/r/pulls/1": {"title": "x"}}) as server:
+        session = make_session(cache)
+        session.get(f"{server.url}/repos/o/r/pulls/1")
+        session.get(f"{server.url}/repos/o/r/pulls/1", headers={"Accept": "application/vnd.github.diff"})
+        
+        assert "If-None-Match" not in server.requests[1][2]
+
+
+def test_entries_scoped_to_credentials_and_vary(tmp_path):
+    """Test that a cached response is not replayed to other credentials or Vary values."""
+    cache = HTTPCache(DiskCacheStore(str(tmp_path), max_bytes=1024 * 1024))
+    
+    with FakeGitHubServer({"/repos/o/r/pulls/1": {"title": "x"}}) as server:
+        session = make_session(cache)
+        url = f"{server.url}/repos/o/r/pulls/1"
+        session.get(url, headers={"Authorization": "token one"})
+        session.get(url, headers={"Authorization": "token two"})
+        session.get(url, headers={"Authorization": "token one"})
+        session.get(url, headers={"Authorization": "token one", "X-GitHub-OTP": "123"})
+        
+        assert ["If-None-Match" in headers for _, _, headers in server.requests] == [False, False, True, False]
+    
+    assert cache.stats["hits"] == 1
+
+
+def test_installation_scope_survives_token_refresh(tmp_path):
+    """Test that a principal function can key entries by installation instead of token."""
+    cache = HTTPCache(DiskCacheStore(str(tmp_path), max_bytes=1024 * 1024), principal=lambda request: "installation:1")
+    
+    with FakeGitHubServer({"/repos/o/r/pulls/1": {"title": "x"}}) as server:
+        session = make_session(cache)
+        session.get(f"{server.url}/repos/o/r/pulls/1", headers={"Authorization": "token old"})
+        second = session.get(f"{server.url}/repos/o/r/pulls/1", headers={"Authorization": "token new"})
+        
+        assert second.json() == {"title": "x"}
+    
+    assert cache.stats["hits"] == 1
+
+
+def test_disk_store_evicts_least_recently_used(tmp_path):
+    """Test that the disk store stays within its size bound."""
+    store = DiskCacheStore(str(tmp_path), max_bytes=2000)
+    
+    for i in range(10):
+        store.put(f"key{i}", CachedResponse(status=200, headers={}, body=b"x" * 300, etag=f'"{i}"'))
+    
+    total = sum(f.stat().st_size for f in tmp_path.glob("*.cache"))
+    assert total <= 2000
+    assert store.get("key9") is not None
+    assert store.get("key0") is None
+
+
+def test_pygithub_requests_go_through_cache(tmp_path, monkeypatch):
+    """Test that Github clients created after install_http_cache revalidate reads."""
+    from github import Github
+    from github.Requester import Requester
+    import app.github_cache as github_cache
+    
+    cache = HTTPCache(DiskCacheStore(str(tmp_path), max_bytes=1024 * 1024))
+    monkeypatch.setattr(github_cache, "_http_cache", cache)
+    
+    repo = {"full_name": "o/r", "url": "/repos/o/r", "name": "r"}
+    with FakeGitHubServer({"/repos/o/r": repo}) as server:
+        github_cache.install_http_cache()
+        try:
+            client = Github(base_url=server.url)
+            client.get_repo("o/r")
+            client.get_repo("o/r")
+        finally:
+            Requester.resetConnectionClasses()
+        
+        assert server.count("/repos/o/r") == 2
+        assert server.rate_limit_remaining == 4999
+    
+    assert cache.stats["hits"] == 1
+
+
+def test_httpx_backend_revalidates_through_cache(tmp_path):
+    """Test that the async client sends If-None-Match from the shared store and serves 304s from it."""
+    import asyncio
+    import httpx
+    from app.github_async import AsyncGitHubClient
+    
+    pr = {"number": 1, "title": "Add feature"}
+    cache = HTTPCache(DiskCacheStore(str(tmp_path), max_bytes=1024 * 1024))
+    
+    async def fetch_twice(url):
+        async with httpx.AsyncClient(base_url=url) as http:
+            client = AsyncGitHubClient(http, token_provider=lambda: "token", cache=cache)
+            return [await client.get_json("/repos/o/r/pulls/1") for _ in range(2)]
+    
+    with FakeGitHubServer({"/repos/o/r/pulls/1": pr}) as server:
+        assert asyncio.run(fetch_twice(server.url)) == [pr, pr]
+        assert server.requests[1][2].get("If-None-Match")
+        assert server.rate_limit_remaining == 4999
+    
+    assert cache.stats == {"hits": 1, "misses": 1, "stored": 1}
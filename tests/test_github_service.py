@@ -0,0 +1,165 @@
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from github import Auth, Github, UnknownObjectException
+
+from app import github_service
+from app.github_service import GitHubService, dedupe_review_comments
+from tests.fakes import FakeGitHubServer
+
+
+def make_pr():
+    pr = MagicMock()
+    pr.title = "Add feature"
+    pr.body = None
+    pr.user.login = "octocat"
+    pr.head.sha = "abc123"
+    pr.base.sha = "def456"
+    pr.state = "open"
+    pr.created_at = datetime(2025, 1, 1)
+    pr.updated_at = datetime(2025, 1, 2)
+    pr.get_files.return_value = [
+        SimpleNamespace(
+            filename=f"file{i}.py", status="modified", additions=1, deletions=0,
+            changes=1, patch="@@ -1 +1 @@\n+x", sha=f"sha{i}"
+        )
+        for i in range(3)
+    ]
+    return pr
+
+
+def make_service():
+    client = MagicMock()
+    repo = client.get_repo.return_value
+    repo.get_pull.return_value = make_pr()
+    return GitHubService(client), client, repo
+
+
+def test_review_reuses_repo_and_pr():
+    """Test that repeated calls for one PR fetch the repo and PR once."""
+    service, client, repo = make_service()
+    
+    service.get_pr_info("owner/repo", 1)
+    service.get_pr_files("owner/repo", 1)
+    service.post_pr_review("owner/repo", 1, "abc123", "body", comments=[
+        {"path": "file0.py", "line": 1, "body": "nit"}
+    ])
+    service.post_review_comment("owner/repo", 1, "body", "abc123", "file0.py", line=2)
+    
+    client.get_repo.assert_called_once_with("owner/repo", lazy=True)
+    repo.get_pull.assert_called_once_with(1)
+    repo.get_commit.assert_called_once_with("abc123")
+
+
+def test_pr_snapshot_returns_info_and_files():
+    """Test that the snapshot combines metadata and files from one PR fetch."""
+    service, client, repo = make_service()
+    
+    snapshot = service.get_pr_snapshot("owner/repo", 1, max_files=2)
+    
+    assert snapshot["info"]["author"] == "octocat"
+    assert snapshot["info"]["head_sha"] == "abc123"
+    assert [f["filename"] for f in snapshot["files"]] == ["file0.py", "file1.py"]
+    repo.get_pull.assert_called_once_with(1)
+
+
+def graphql_comment(body: str, mine: bool) -> dict:
+    return {"path": "file0.py", "line": 3, "body": body, "viewerDidAuthor": mine}
+
+
+def graphql_response():
+    return {"data": {"repository": {"pullRequest": {
+        "title": "Add feature",
+        "body": None,
+        "state": "MERGED",
+        "createdAt": "2025-01-01T00:00:00Z",
+        "updatedAt": "2025-01-02T00:00:00Z",
+        "headRefOid": "abc123",
+        "baseRefOid": "def456",
+        "author": {"login": "octocat"},
+        "reviewThreads": {"nodes": [
+            {"comments": {"nodes": [graphql_comment("**LOW**: nit", True), graphql_comment("thanks", False)]}}
+        ]}
+    }}}}
+
+
+def test_graphql_snapshot_returns_bot_comments():
+    """Test that one GraphQL query yields PR info and only the bot's comments."""
+    service, client, repo = make_service()
+    repo._requester.requestJsonAndCheck.return_value = ({}, graphql_response())
+    
+    snapshot = service.get_pr_graphql_snapshot("owner/repo", 1)
+    
+    assert snapshot["info"]["head_sha"] == "abc123"
+    assert snapshot["info"]["state"] == "closed"
+    assert snapshot["existing_comments"] == [{"path": "file0.py", "line": 3, "body": "**LOW**: nit"}]
+    variables = repo._requester.requestJsonAndCheck.call_args.kwargs["input"]["variables"]
+    assert variables == {"owner": "owner", "name": "repo", "number": 1}
+    repo.get_pull.assert_not_called()
+
+
+def test_missing_file_content_is_none():
+    """Test that a file absent at the ref reads as None, unlike a read error."""
+    service, _, repo = make_service()
+    repo.get_contents.side_effect = UnknownObjectException(404, {"message": "Not Found"}, {})
+    assert service.get_file_content("o/r", ".gitattributes", "abc123") is None
+    
+    repo.get_contents.side_effect = RuntimeError("connection reset")
+    assert service.get_file_content("o/r", ".gitattributes", "abc123") == ""
+
+
+def test_dedupe_skips_comments_already_posted():
+    """Test that repeated comments on the same line are not posted again."""
+    existing = [{"path": "a.py", "line": 3, "body": "**LOW**: nit"}]
+    comments = [
+        {"path": "a.py", "line": 3, "body": "**LOW**: nit\n"},
+        {"path": "a.py", "line": 5, "body": "**LOW**: nit"},
+        {"path": "b.py", "line": 5, "body": "**LOW**: nit"},
+        {"path": "b.py", "line": 5, "body": "**LOW**: nit"},
+        {"path": "a.py", "line": 7, "body": "**HIGH**: bug"}
+    ]
+    
+    result = dedupe_review_comments(comments, existing)
+    
+    assert [(c["path"], c["line"]) for c in result] == [("a.py", 5), ("b.py", 5), ("a.py", 7)]
+
+
+def test_rest_snapshot_returns_bot_comments():
+    """Test that REST snapshots list the bot's existing comments too."""
+    service, client, repo = make_service()
+    service.bot_login = "review-bot[bot]"
+    repo._requester.requestJsonAndCheck.return_value = ({}, [
+        {"path": "file0.py", "line": 3, "body": "**LOW**: nit", "user": {"login": "review-bot[bot]"}},
+        {"path": "file0.py", "line": 4, "body": "thanks", "user": {"login": "octocat"}}
+    ])
+    
+    snapshot = service.get_pr_snapshot("owner/repo", 1)
+    
+    assert snapshot["existing_comments"] == [{"path": "file0.py", "line": 3, "body": "**LOW**: nit"}]
+    assert repo._requester.requestJsonAndCheck.call_args.args[0] == "GET"
+
+
+def test_diff_files_fetched_from_api_url(monkeypatch):
+    """Test that the unified diff is requested with the service's auth and parsed."""
+    diff = (
+        "diff --git a/app.py b/app.py\n"
+        "--- a/app.py\n"
+        "+++ b/app.py\n"
+        "@@ -1 +1,2 @@\n"
+        " x = 1\n"
+        "+y = 2\n"
+    ).encode()
+    
+    with FakeGitHubServer({"/repos/o/r/pulls/1": diff}) as server:
+        monkeypatch.setattr(github_service.settings, "github_api_url", server.url)
+        service = GitHubService(Github(base_url=server.url), auth=Auth.Token("secret"))
+        
+        files = service.get_pr_diff_files("o/r", 1)
+    
+    assert [f["filename"] for f in files] == ["app.py"]
+    assert "+y = 2" in files[0]["patch"]
+    _, path, headers = server.requests[-1]
+    assert path == "/repos/o/r/pulls/1"
+    assert headers["Accept"] == "application/vnd.github.diff"
+    assert headers["Authorization"] == "token secret"
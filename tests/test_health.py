@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from app.health import HealthMonitor
+
+
+def ok():
+    return {}
+
+
+def workers():
+    return {"workers": 2}
+
+
+def broken():
+    raise ConnectionError("connection refused")
+
+
+def slow():
+    time.sleep(0.5)
+    return {}
+
+
+def snapshot_after_refresh(monitor):
+    asyncio.run(monitor.refresh())
+    return monitor.snapshot()
+
+
+def test_all_probes_up_is_healthy():
+    """Test that passing probes report details and latency."""
+    monitor = HealthMonitor({"database": ok, "celery": workers}, required=["database"])
+    
+    snapshot = snapshot_after_refresh(monitor)
+    
+    assert snapshot["status"] == "healthy"
+    assert snapshot["checks"]["celery"]["workers"] == 2
+    assert snapshot["checks"]["database"]["latency_ms"] >= 0
+    assert monitor.status_code(snapshot) == 200
+
+
+def test_required_probe_down_is_unhealthy():
+    """Test that a failing required dependency turns readiness to 503."""
+    monitor = HealthMonitor({"database": broken, "celery": workers}, required=["database"])
+    
+    snapshot = snapshot_after_refresh(monitor)
+    
+    assert snapshot["status"] == "unhealthy"
+    assert snapshot["checks"]["database"]["error"] == "connection refused"
+    assert monitor.status_code(snapshot) == 503
+
+
+def test_optional_probe_timeout_is_degraded():
+    """Test that a slow optional probe times out without failing readiness."""
+    monitor = HealthMonitor({"database": ok, "celery": slow}, required=["database"], timeout=0.1)
+    
+    snapshot = snapshot_after_refresh(monitor)
+    
+    assert snapshot["status"] == "degraded"
+    assert "timed out" in snapshot["checks"]["celery"]["error"]
+    assert monitor.status_code(snapshot) == 200
+
+
+def test_unprobed_and_stale_results_are_down():
+    """Test that missing or outdated results never report healthy."""
+    monitor = HealthMonitor({"database": ok}, required=["database"], interval=1, timeout=1)
+    assert monitor.snapshot()["status"] == "unhealthy"
+    
+    asyncio.run(monitor.refresh())
+    monitor.results["database"]["checked_at"] -= 10
+    
+    snapshot = monitor.snapshot()
+    assert snapshot["status"] == "unhealthy"
+    assert "stale" in snapshot["checks"]["database"]["error"]
+
+
+def test_background_loop_serves_cached_results():
+    """Test that probes run on the interval, not per snapshot."""
+    calls = []
+    
+    def counted():
+        calls.append(1)
+        return {}
+    
+    async def scenario():
+        monitor = HealthMonitor({"redis": counted}, required=["redis"], interval=60)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        snapshots = [monitor.snapshot() for _ in range(20)]
+        await monitor.stop()
+        return snapshots
+    
+    snapshots = asyncio.run(scenario())
+    
+    assert len(calls) == 1
+    assert all(s["status"] == "healthy" for s in snapshots)
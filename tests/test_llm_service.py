@@ -0,0 +1,96 @@
+import asyncio
+
+import anthropic
+import pytest
+
+from app import llm_service
+from app.metrics import LLM_TOKENS
+from tests.fakes import FakeAnthropicClient, FakeAnthropicServer
+
+
+def stub_anthropic(monkeypatch, server: FakeAnthropicServer) -> FakeAnthropicServer:
+    """Answer the SDK's clients from `server` in-process, whatever SDK version is installed."""
+    monkeypatch.setattr(anthropic, "Anthropic", lambda **kwargs: FakeAnthropicClient(server))
+    monkeypatch.setattr(anthropic, "AsyncAnthropic", lambda **kwargs: FakeAnthropicClient(server, is_async=True))
+    return server
+
+
+def test_generate_review_parsed_and_tokens_counted(monkeypatch):
+    """Test that a review is parsed from the API's answer and its tokens are counted."""
+    server = stub_anthropic(monkeypatch, FakeAnthropicServer(output_tokens=200))
+    service = llm_service.LLMService()
+    before = LLM_TOKENS.labels(service.model, "output")._value.get()
+    
+    review = asyncio.run(service.generate_review("+x = 1", "app/x.py"))
+    
+    assert server.calls == 1
+    assert review["issues"][0]["line"] == 1
+    assert LLM_TOKENS.labels(service.model, "output")._value.get() - before >= 190
+
+
+def test_review_text_padded_to_output_tokens():
+    """Test that the fake's answers are sized by output_tokens."""
+    server = FakeAnthropicServer(output_tokens=500)
+    
+    assert abs(len(server.review_text("diff")) // 4 - 500) <= 5
+
+
+def test_generate_reviews_runs_concurrently(monkeypatch):
+    """Test that windowed reviews overlap instead of queueing behind each other."""
+    import time
+    
+    server = stub_anthropic(monkeypatch, FakeAnthropicServer(latency=0.3))
+    service = llm_service.LLMService()
+    
+    started = time.perf_counter()
+    reviews = asyncio.run(service.generate_reviews(
+        [{"code_diff": f"+x = {i}", "file_path": "app/x.py"} for i in range(6)],
+        concurrency=6
+    ))
+    elapsed = time.perf_counter() - started
+    
+    assert len(reviews) == 6 and server.calls == 6
+    assert all(review["issues"] for review in reviews)
+    assert elapsed < 1.2
+
+
+def test_generate_reviews_returns_exceptions_in_order(monkeypatch):
+    """Test that with return_exceptions a failed call doesn't sink the other reviews."""
+    from app.deadline import Deadline
+    
+    server = stub_anthropic(monkeypatch, FakeAnthropicServer())
+    service = llm_service.LLMService()
+    requests = [{"code_diff": "+x = 1", "file_path": "a.py"}, {"code_diff": "+y = 2", "file_path": "b.py"}]
+    original = FakeAnthropicClient._response
+    
+    def fail_second(client, params, waited, timeout):
+        if "b.py" in params["messages"][0]["content"]:
+            raise RuntimeError("overloaded")
+        return original(client, params, waited, timeout)
+    
+    monkeypatch.setattr(FakeAnthropicClient, "_response", fail_second)
+    
+    reviews = asyncio.run(service.generate_reviews(requests, deadline=Deadline(), return_exceptions=True))
+    
+    assert server.calls == 2
+    assert reviews[0]["issues"] and isinstance(reviews[1], RuntimeError)
+
+
+def test_call_timed_out_from_deadline(monkeypatch):
+    """Test that a slow call is cut off at the review's deadline, without SDK retries."""
+    import time
+    from app.deadline import Deadline
+    
+    server = stub_anthropic(monkeypatch, FakeAnthropicServer(latency=2))
+    service = llm_service.LLMService()
+    bounded, options = service._bounded(service.client, Deadline(time.time() + 0.5))
+    
+    assert bounded.options == {"max_retries": 0}
+    assert 0 < options["timeout"] <= 0.5
+    
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        asyncio.run(service.generate_review("+x = 1", "app/x.py", deadline=Deadline(time.time() + 0.5)))
+    elapsed = time.perf_counter() - started
+    
+    assert elapsed < 1.5 and server.calls == 1
@@ -0,0 +1,61 @@
+import asyncio
+
+from app.embedding_service import EmbeddingService
+from app.memory_service import MemoryService
+from tests.fakes import FakeSession
+
+
+class CountingEmbeddings(EmbeddingService):
+    """Embeds without a model, recording every batch."""
+    
+    def __init__(self):
+        self.batches = []
+    
+    def create_embeddings_batch(self, texts):
+        self.batches.append(texts)
+        return [[0.1, -0.2] for _ in texts]
+
+
+def record(i, feedback_type="dismissed"):
+    return {
+        "user_id": "octocat", "repository_id": "o/r", "feedback_type": feedback_type,
+        "context": {"suggestion": f"s{i}"}
+    }
+
+
+def test_feedback_batch_skips_duplicates_and_reports_progress():
+    """Test that repeated or already stored records aren't embedded again, with progress per chunk."""
+    service = MemoryService.__new__(MemoryService)
+    service.embedding_service = CountingEmbeddings()
+    db = FakeSession()
+    asyncio.run(service.ingest_feedback_batch(db, [record(0)], batch_size=2))
+    service.embedding_service.batches.clear()
+    progress = []
+    
+    records = [record(0), record(1), record(1), record(2), record(3, "accepted")]
+    counts = asyncio.run(service.ingest_feedback_batch(
+        db, records, batch_size=2, on_progress=lambda done, total: progress.append((done, total))
+    ))
+    
+    assert counts == {"inserted": 3, "skipped": 2}
+    assert progress == [(2, 5), (4, 5), (5, 5)]
+    assert sum(len(batch) for batch in service.embedding_service.batches) == 3
+    assert len(db.tables["user_memory"]) == 4
+    assert {row["memory_type"] for row in db.tables["user_memory"]} == {"feedback_dismissed", "feedback_accepted"}
+
+
+def test_feedback_batch_keys_on_created_at_or_id():
+    """Test that repeated feedback at different times is kept, and ids dedupe on their own."""
+    service = MemoryService.__new__(MemoryService)
+    service.embedding_service = CountingEmbeddings()
+    db = FakeSession()
+    
+    records = [
+        {**record(0), "created_at": "2025-01-01T00:00:00"},
+        {**record(0), "created_at": "2025-02-01T00:00:00"},
+        {**record(1), "id": "comment-1"},
+        {**record(2), "id": "comment-1"},
+    ]
+    counts = asyncio.run(service.ingest_feedback_batch(db, records))
+    
+    assert counts == {"inserted": 3, "skipped": 1}
@@ -0,0 +1,120 @@
+import fakeredis
+
+from app import llm_service, tasks
+from app.message_batches import (
+    BatchReviewStore,
+    MessageBatchClient,
+    collect_results,
+    custom_id,
+    parse_custom_id,
+    submit_pending,
+)
+from tests.fakes import FakeAnthropicServer
+from tests.test_review_pipeline import pipeline  # noqa: F401
+
+
+def request(review_id, file_index, window_index=0):
+    return {
+        "custom_id": custom_id(review_id, file_index, window_index),
+        "params": {"model": "m", "max_tokens": 10, "messages": [{"role": "user", "content": "+x"}]}
+    }
+
+
+def test_custom_id_round_trip():
+    """Test that review ids containing separators survive the custom id."""
+    assert parse_custom_id(custom_id("3f2a-b_c", 4, 1)) == ("3f2a-b_c", 4, 1)
+
+
+def test_review_completes_once_every_request_has_a_result():
+    """Test that results are collected across batches until a review is complete."""
+    store = BatchReviewStore(fakeredis.FakeRedis())
+    store.add_review("r1", {"files": []}, [request("r1", 0), request("r1", 1)])
+    
+    with FakeAnthropicServer() as server:
+        client = MessageBatchClient("key", server.url)
+        submit_pending(store, client, limit=1)
+        assert collect_results(store, client) == []
+        assert store.completed_review("r1") is None
+        
+        submit_pending(store, client, limit=1)
+        assert collect_results(store, client) == ["r1"]
+    
+    record, results = store.completed_review("r1")
+    assert record["expected"] == 2
+    assert sorted(results) == ["r1_0_0", "r1_1_0"]
+    assert all("message" in r for r in results.values())
+    assert store.pending_count() == 0 and store.active_batches() == []
+
+
+def test_completed_review_collected_until_finished():
+    """Test that a review collected by a run that stopped before finalizing it is returned again."""
+    store = BatchReviewStore(fakeredis.FakeRedis())
+    store.add_review("r1", {"files": []}, [request("r1", 0)])
+    
+    with FakeAnthropicServer() as server:
+        client = MessageBatchClient("key", server.url)
+        submit_pending(store, client, limit=10)
+        assert collect_results(store, client) == ["r1"]
+        assert store.active_batches() == []
+        
+        assert collect_results(store, client) == ["r1"]
+        store.finish_review("r1")
+        assert collect_results(store, client) == []
+
+
+def test_unfinished_batches_stay_tracked():
+    """Test that a batch still processing is polled again on the next run."""
+    store = BatchReviewStore(fakeredis.FakeRedis())
+    store.add_review("r1", {"files": []}, [request("r1", 0)])
+    
+    with FakeAnthropicServer(batch_latency=60) as server:
+        client = MessageBatchClient("key", server.url)
+        batch_id = submit_pending(store, client, limit=10)
+        
+        assert collect_results(store, client) == []
+    
+    assert store.active_batches() == [batch_id]
+
+
+def test_failed_submission_requeues_requests():
+    """Test that requests are not lost when the batch can't be created."""
+    store = BatchReviewStore(fakeredis.FakeRedis())
+    store.add_review("r1", {"files": []}, [request("r1", 0), request("r1", 1)])
+    client = MessageBatchClient("key", "http://127.0.0.1:9")
+    
+    try:
+        submit_pending(store, client, limit=10)
+    except Exception:
+        pass
+    
+    assert [r["custom_id"] for r in store.take_pending(10)] == ["r1_0_0", "r1_1_0"]
+
+
+def test_batch_mode_review_posted_by_beat_task(pipeline, monkeypatch):  # noqa: F811
+    """Test that a batch-mode review is posted once its batch ends, errors included."""
+    github_service, _ = pipeline
+    store = BatchReviewStore(fakeredis.FakeRedis())
+    monkeypatch.setattr(tasks, "get_batch_review_store", lambda: store)
+    monkeypatch.setattr(tasks, "get_llm_service", llm_service.LLMService)
+    pr_data = {
+        "pr_number": 1, "repository": "o/r", "repository_id": "o/r", "installation_id": 1,
+        "review_id": "review-1", "llm_mode": "batch"
+    }
+    
+    with FakeAnthropicServer() as server:
+        server.fail_ids.add(custom_id("review-1", 2, 0))
+        monkeypatch.setattr(tasks, "get_message_batch_client", lambda: MessageBatchClient("key", server.url))
+        
+        dispatched = tasks.process_pr_review.apply(args=[pr_data]).get()
+        github_service.post_pr_review.assert_not_called()
+        assert store.pending_count() == 3
+        
+        stats = tasks.process_message_batches.apply().get()
+    
+    assert dispatched["llm_mode"] == "batch"
+    assert stats["reviews_finalized"] == 1 and stats["pending_requests"] == 0
+    github_service.post_pr_review.assert_called_once()
+    posted = github_service.post_pr_review.call_args.kwargs
+    assert [c["path"] for c in posted["comments"]] == ["a.py", "b.py"]
+    assert "Not reviewed (errors):** `broken.py`" in posted["body"]
+    assert store.completed_review("review-1") is None
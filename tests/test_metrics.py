@@ -0,0 +1,91 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from celery.app.task import Context
+from prometheus_client import REGISTRY
+
+import app.metrics as metrics
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_stage_timings_observed():
+    """Test that stage timers feed the per-stage histogram."""
+    before = sample("review_stage_seconds_count", stage="llm")
+    
+    with metrics.observe_stage("llm"):
+        pass
+    
+    assert sample("review_stage_seconds_count", stage="llm") == before + 1
+
+
+def test_unknown_stage_rejected():
+    """Test that only known stages become label values."""
+    with pytest.raises(ValueError):
+        metrics.observe_stage("llm_call")
+
+
+def test_llm_usage_counted():
+    """Test that Anthropic usage fields are added to the token counters."""
+    before = sample("llm_tokens_total", model="test-model", direction="output")
+    
+    metrics.record_llm_usage("test-model", SimpleNamespace(input_tokens=1200, output_tokens=300))
+    
+    assert sample("llm_tokens_total", model="test-model", direction="output") == before + 300
+    assert sample("llm_tokens_total", model="test-model", direction="input") >= 1200
+
+
+def test_repository_labels_bounded(monkeypatch):
+    """Test that repositories beyond the cap share the "other" series."""
+    monkeypatch.setattr(metrics, "_repositories", set())
+    monkeypatch.setattr(metrics.settings, "metrics_max_repositories", 2)
+    
+    labels = [metrics.repository_label(r) for r in ("o/a", "o/b", "o/c", "o/a")]
+    
+    assert labels == ["o/a", "o/b", "other", "o/a"]
+
+
+def test_queue_wait_excludes_countdown():
+    """Test that a task's countdown does not count as queue wait."""
+    assert metrics.queue_wait_seconds(100.0, None, now=103.0) == 3.0
+    assert metrics.queue_wait_seconds(100.0, "1970-01-01T00:02:40+00:00", now=165.0) == 5.0
+    assert metrics.queue_wait_seconds(None, None, now=165.0) is None
+
+
+def test_queue_wait_observed_from_publish_header():
+    """Test that the header stamped at publish is read back when the task starts."""
+    headers = {}
+    metrics.stamp_enqueue_time(headers)
+    headers["enqueued_at"] -= 2
+    task = SimpleNamespace(
+        name="app.tasks.process_pr_review",
+        request=Context(eta=None, delivery_info={"routing_key": "reviews"}, **headers)
+    )
+    labels = {"task": "app.tasks.process_pr_review", "queue": "reviews"}
+    before = sample("celery_task_queue_wait_seconds_count", **labels)
+    
+    metrics.observe_queue_wait(task)
+    
+    assert sample("celery_task_queue_wait_seconds_count", **labels) == before + 1
+    assert sample("celery_task_queue_wait_seconds_sum", **labels) >= 2
+
+
+def test_embedding_model_load_exported(monkeypatch):
+    """Test that loading the embedding model shows up on the exporter without running it."""
+    import sys
+    from prometheus_client import generate_latest
+    from app.embedding_service import EMBEDDING_MODEL, EmbeddingService
+    
+    def encode(text):
+        raise AssertionError("model ran")
+    
+    fake = SimpleNamespace(SentenceTransformer=lambda name: SimpleNamespace(encode=encode))
+    monkeypatch.setitem(sys.modules, "sentence_transformers", fake)
+    
+    EmbeddingService()
+    
+    exported = generate_latest(metrics.metrics_registry()).decode()
+    assert f'embedding_model_loaded{{model="{EMBEDDING_MODEL}"}} 1.0' in exported
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+from app import profiling
+from app.celery_app import celery_app
+from app.metrics import observe_stage
+from app.profiling import StackSampler
+
+
+def spin(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@celery_app.task(bind=True)
+def profiled_example(self, seconds):
+    with observe_stage("llm"):
+        spin(seconds)
+    return {"status": "success"}
+
+
+def test_sampler_collects_collapsed_stacks():
+    """Test that samples of the target thread are counted per stack."""
+    sampler = StackSampler(threading.get_ident(), interval=0.001)
+    
+    sampler.start()
+    spin(0.1)
+    sampler.stop()
+    
+    assert sampler.samples > 0
+    line = sampler.collapsed().splitlines()[0]
+    assert "tests.test_profiling:spin" in line
+    assert line.rsplit(" ", 1)[1].isdigit()
+
+
+def test_task_not_profiled_by_default(monkeypatch, tmp_path):
+    """Test that tasks run unprofiled unless asked or sampled."""
+    monkeypatch.setattr(profiling.settings, "task_profile_dir", str(tmp_path))
+    
+    result = profiled_example.apply(args=[0.01]).get()
+    
+    assert "profile" not in result
+    assert os.listdir(tmp_path) == []
+
+
+def test_requested_profile_written_with_stage_breakdown(monkeypatch, tmp_path):
+    """Test that a profiled task stores stacks by task_id and reports stage timings."""
+    monkeypatch.setattr(profiling.settings, "task_profile_dir", str(tmp_path))
+    monkeypatch.setattr(profiling.settings, "task_profile_interval", 0.001)
+    
+    async_result = profiled_example.apply(args=[0.1], headers={"profile": True})
+    profile = async_result.get()["profile"]
+    
+    assert profile["stages"]["llm"] >= 0.1
+    assert profile["samples"] > 0
+    assert profile["stacks"] == str(tmp_path / f"{async_result.id}.collapsed")
+    with open(profile["stacks"]) as f:
+        assert "tests.test_profiling:spin" in f.read()
+
+
+def test_sample_rate_profiles_every_task(monkeypatch, tmp_path):
+    """Test that a sample rate of 1 profiles tasks without a header."""
+    monkeypatch.setattr(profiling.settings, "task_profile_dir", str(tmp_path))
+    monkeypatch.setattr(profiling.settings, "task_profile_rate", 1.0)
+    
+    result = profiled_example.apply(args=[0.01]).get()
+    
+    assert "llm" in result["profile"]["stages"]
@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import fakeredis
+import fakeredis.aioredis
+
+from app.progress import ReviewProgress, publish_progress, stream_progress
+import app.progress as progress
+
+
+def parse_events(chunks):
+    """Decode the data lines of SSE chunks, skipping comments."""
+    return [
+        json.loads(line[len("data: "):])
+        for chunk in chunks
+        for line in chunk.splitlines()
+        if line.startswith("data: ")
+    ]
+
+
+def test_publish_keeps_ordered_history():
+    """Test that events are numbered and replayable per review."""
+    tracker = ReviewProgress(fakeredis.FakeRedis())
+    
+    tracker.publish("r1", "fetched", files=["a.py"])
+    tracker.publish("r1", "file_reviewed", file="a.py", issues=2)
+    tracker.publish("r2", "fetched", files=[])
+    
+    history = tracker.history("r1")
+    assert [e["seq"] for e in history] == [1, 2]
+    assert history[1]["stage"] == "file_reviewed"
+    assert history[1]["issues"] == 2
+
+
+def test_publish_progress_without_review_id_is_noop(monkeypatch):
+    """Test that reviews queued without a review_id publish nothing."""
+    tracker = ReviewProgress(fakeredis.FakeRedis())
+    monkeypatch.setattr(progress, "get_review_progress", lambda: tracker)
+    
+    publish_progress({"pr_number": 1}, "fetched")
+    publish_progress({"pr_number": 1, "review_id": "r1"}, "fetched")
+    
+    assert len(tracker.history("r1")) == 1
+
+
+def test_stream_replays_backlog_then_live_events():
+    """Test that a late subscriber sees missed events and the stream ends on a terminal stage."""
+    server = fakeredis.FakeServer()
+    tracker = ReviewProgress(fakeredis.FakeRedis(server=server))
+    tracker.publish("r1", "fetched", files=["a.py", "b.py"])
+    tracker.publish("r1", "file_reviewed", file="a.py", issues=0)
+    
+    async def consume():
+        client = fakeredis.aioredis.FakeRedis(server=server)
+        chunks = []
+        async for chunk in stream_progress(client, "r1", timeout=5, heartbeat=0.05):
+            chunks.append(chunk)
+            if len(parse_events(chunks)) == 2:
+                tracker.publish("r1", "file_reviewed", file="b.py", issues=1)
+                tracker.publish("r1", "posted", comments=1)
+        return chunks
+    
+    events = parse_events(asyncio.run(consume()))
+    
+    assert [e["stage"] for e in events] == ["fetched", "file_reviewed", "file_reviewed", "posted"]
+    assert [e["seq"] for e in events] == [1, 2, 3, 4]
+
+
+def test_stream_of_finished_review_ends_immediately():
+    """Test that a stream for an already posted review only replays its events."""
+    server = fakeredis.FakeServer()
+    tracker = ReviewProgress(fakeredis.FakeRedis(server=server))
+    tracker.publish("r1", "posted", comments=0)
+    
+    async def consume():
+        client = fakeredis.aioredis.FakeRedis(server=server)
+        return [chunk async for chunk in stream_progress(client, "r1", timeout=5)]
+    
+    assert [e["stage"] for e in parse_events(asyncio.run(consume()))] == ["posted"]
@@ -0,0 +1,67 @@
+import time
+
+import fakeredis
+
+from app.rate_limit import RateLimitGovernor
+
+
+def make_governor(floor: int = 100) -> RateLimitGovernor:
+    return RateLimitGovernor(fakeredis.FakeRedis(), floor=floor)
+
+
+def headers(remaining: int, reset_in: int = 600) -> dict:
+    return {
+        "X-RateLimit-Limit": "5000",
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset": str(int(time.time()) + reset_in)
+    }
+
+
+def test_reserve_succeeds_with_budget():
+    """Test that a review reserves budget while enough requests remain."""
+    governor = make_governor()
+    governor.record(1, 200, headers(remaining=1000))
+    
+    assert governor.reserve(1, 30) == 0
+    assert governor.status(1)["reserved"] == 30
+
+
+def test_reserve_defers_until_reset():
+    """Test that an exhausted budget returns the time until reset."""
+    governor = make_governor()
+    governor.record(1, 200, headers(remaining=120, reset_in=600))
+    
+    assert governor.reserve(1, 10) == 0
+    wait = governor.reserve(1, 30)
+    assert 590 <= wait <= 600
+
+
+def test_release_returns_budget():
+    """Test that released reservations can be reserved again."""
+    governor = make_governor()
+    governor.record(1, 200, headers(remaining=140))
+    
+    assert governor.reserve(1, 30) == 0
+    assert governor.reserve(1, 30) > 0
+    governor.release(1, 30)
+    assert governor.reserve(1, 30) == 0
+
+
+def test_secondary_limit_backoff():
+    """Test that Retry-After on a 403 blocks reservations for that long."""
+    governor = make_governor()
+    governor.record(1, 403, {**headers(remaining=4000), "Retry-After": "120"})
+    
+    assert 110 <= governor.reserve(1, 1) <= 120
+    assert 110 <= governor.wait_time(1) <= 120
+
+
+def test_installations_tracked_separately():
+    """Test that one installation's budget does not affect another."""
+    governor = make_governor()
+    governor.record(1, 200, headers(remaining=0))
+    governor.record(2, 200, headers(remaining=5000))
+    
+    assert governor.reserve(1, 1) > 0
+    assert governor.reserve(2, 1) == 0
+    assert {s["installation_id"] for s in governor.all_statuses()} == {1, 2}
@@ -0,0 +1,123 @@
+import json
+from types import SimpleNamespace
+
+import fakeredis
+
+from app.rate_limit import RateLimitGovernor
+from app.review_batch import review_countdowns, summarize_batch
+
+
+def result(state, value=None):
+    return SimpleNamespace(state=state, result=value, successful=lambda: state == "SUCCESS")
+
+
+def test_countdowns_spaced_per_installation():
+    """Test that each installation's reviews are spread at the configured rate."""
+    governor = RateLimitGovernor(fakeredis.FakeRedis())
+    countdowns = review_countdowns([1, 1, 2, 1, 2], per_minute=30, governor=governor)
+    
+    assert countdowns == [0, 2, 0, 4, 2]
+
+
+def test_countdowns_shared_across_batches_and_live_reviews():
+    """Test that a second batch queues behind the first and any live review."""
+    governor = RateLimitGovernor(fakeredis.FakeRedis())
+    review_countdowns([1, 1], per_minute=30, governor=governor)
+    governor.schedule_start(1, 2)
+    
+    assert review_countdowns([1, 2], per_minute=30, governor=governor) == [6, 0]
+
+
+def test_batch_progress_follows_finalize_tasks():
+    """Test that dispatched reviews count as completed only once posted."""
+    finalize = {
+        "f1": result("SUCCESS", {"status": "success"}),
+        "f2": result("STARTED"),
+        "f3": result("FAILURE"),
+    }
+    children = [
+        result("PENDING"),
+        result("SUCCESS", {"status": "dispatched", "finalize_task_id": "f1"}),
+        result("SUCCESS", {"status": "dispatched", "finalize_task_id": "f2"}),
+        result("SUCCESS", {"status": "dispatched", "finalize_task_id": "f3"}),
+        result("SUCCESS", {"status": "superseded"}),
+        result("SUCCESS", {"status": "deferred", "retry_in": 60}),
+    ]
+    
+    progress = summarize_batch(children, lookup=finalize.get)
+    
+    assert progress["total"] == 6
+    assert (progress["queued"], progress["running"], progress["completed"]) == (2, 1, 1)
+    assert (progress["superseded"], progress["failed"]) == (1, 1)
+    assert progress["progress"] == 0.5
+
+
+def test_batch_progress_follows_review_reruns():
+    """Test that a review re-run by its finalize task is tracked under the new id."""
+    tasks = {
+        "f1": result("SUCCESS", {"status": "deferred", "task_id": "p2"}),
+        "p2": result("SUCCESS", {"status": "dispatched", "finalize_task_id": "f2"}),
+        "f2": result("SUCCESS", {"status": "failed"}),
+        "f3": result("SUCCESS", {"status": "deferred", "task_id": "p4"}),
+        "p4": result("PENDING"),
+    }
+    children = [
+        result("SUCCESS", {"status": "dispatched", "finalize_task_id": "f1"}),
+        result("SUCCESS", {"status": "dispatched", "finalize_task_id": "f3"}),
+    ]
+    
+    progress = summarize_batch(children, lookup=tasks.get)
+    
+    assert (progress["failed"], progress["queued"], progress["completed"]) == (1, 1, 0)
+
+
+def test_batch_reviews_sent_with_bulk_limits(monkeypatch):
+    """Test that batch reviews carry the bulk queue's time limits, not process_pr_review's defaults."""
+    from unittest.mock import MagicMock
+    from app import rate_limit, review_batch
+    from app.celery_app import QUEUES
+    
+    monkeypatch.setattr(rate_limit, "get_rate_limit_governor", lambda: RateLimitGovernor(fakeredis.FakeRedis()))
+    sent = []
+    monkeypatch.setattr(review_batch, "group", lambda signatures: sent.extend(signatures) or MagicMock())
+    
+    review_batch.enqueue_review_batch([{"pr_number": 1, "installation_id": 1}, {"pr_number": 2, "installation_id": 1}])
+    
+    assert [s.options["queue"] for s in sent] == ["bulk", "bulk"]
+    assert all(s.options["soft_time_limit"] == QUEUES["bulk"]["soft_time_limit"] for s in sent)
+
+
+def test_batch_skips_duplicates_and_pending_reviews(monkeypatch):
+    """Test that a batch neither repeats a queued head nor supersedes a pending live review."""
+    import asyncio
+    from app import main, review_batch, review_coalescer
+    from app.admission import AdmissionController
+    from app.review_coalescer import ReviewCoalescer
+    
+    redis_client = fakeredis.FakeRedis()
+    admission = AdmissionController(redis_client)
+    coalescer = ReviewCoalescer(redis_client)
+    monkeypatch.setattr(main, "get_admission_controller", lambda: admission)
+    monkeypatch.setattr(review_coalescer, "get_review_coalescer", lambda: coalescer)
+    queued = []
+    monkeypatch.setattr(
+        review_batch, "enqueue_review_batch",
+        lambda pr_data_list, message_batches: queued.extend(pr_data_list) or SimpleNamespace(id="batch-1")
+    )
+    
+    # PR 1 has a live review pending, PR 2's head was already queued
+    live = coalescer.register("o/r", 1)
+    admission.remember({"repository": "o/r", "pr_number": 2, "head_sha": "abc", "review_id": "task-2"})
+    request = main.ReviewBatchRequest(reviews=[
+        main.ReviewRequest(owner="o", repo="r", pr_number=n, installation_id=1, head_sha="abc")
+        for n in (1, 2, 3)
+    ])
+    
+    response = asyncio.run(main.trigger_review_batch(request, authorized=True))
+    body = json.loads(response.body)
+    
+    assert [pr_data["pr_number"] for pr_data in queued] == [3]
+    assert body["reviews"] == 1 and body["batch_id"] == "batch-1"
+    assert [(s["pr_number"], s["reason"]) for s in body["skipped"]] == [(1, "review pending"), (2, "duplicate")]
+    assert coalescer.is_current("o/r", 1, live)
+    assert admission.duplicate_of({"repository": "o/r", "pr_number": 3, "head_sha": "abc"}) == queued[0]["review_id"]
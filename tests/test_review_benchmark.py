@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from benchmarks.review_pipeline import (
+    compare_to_baseline,
+    github_routes,
+    percentile,
+    synthetic_prs,
+    synthetic_repository,
+)
+
+
+def make_report(throughput=2.0, p95=1.0, rss=300.0, llm_p95=0.8):
+    stages = {"llm": {"p50": 0.5, "p95": llm_p95, "p99": 1.0}}
+    return {
+        "params": {"prs": 10},
+        "indexing": {"throughput_files_per_s": 50.0, "latency": {"p50": 1, "p95": 2, "p99": 2}, "stages": {}},
+        "reviews": {"throughput_per_s": throughput, "latency": {"p50": 0.5, "p95": p95, "p99": 1.2}, "stages": stages},
+        "peak_rss_mb": rss
+    }
+
+
+def test_percentile_interpolates():
+    """Test percentiles over a small sample."""
+    values = [4, 1, 3, 2, 5]
+    
+    assert percentile(values, 50) == 3
+    assert percentile(values, 95) == pytest.approx(4.8)
+    assert percentile([], 99) == 0.0
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    """Test that slower, hungrier runs are reported and noise is not."""
+    baseline = make_report()
+    
+    assert compare_to_baseline(make_report(throughput=1.9, p95=1.1), baseline, 0.15) == []
+    
+    regressions = compare_to_baseline(make_report(throughput=1.5, rss=400, llm_p95=1.2), baseline, 0.15)
+    assert [r.split(":")[0] for r in regressions] == [
+        "reviews.throughput_per_s", "peak_rss_mb", "reviews.stages.llm.p95"
+    ]
+
+
+def test_compare_requires_matching_parameters():
+    """Test that runs with different parameters are not compared."""
+    other = make_report()
+    other["params"] = {"prs": 50}
+    
+    with pytest.raises(ValueError):
+        compare_to_baseline(other, make_report(), 0.15)
+
+
+def test_synthetic_pr_files_exist_in_repository():
+    """Test that changed files are served by the repository routes too."""
+    rng = random.Random(0)
+    repositories = {"repo0": synthetic_repository(rng, 8, 20)}
+    prs = synthetic_prs(rng, ["repo0"], 3, 4, 20)
+    routes, post_routes = github_routes("http://github.test", repositories, prs)
+    
+    for _, number, files in prs:
+        assert routes[f"/repos/bench/repo0/pulls/{number}/files"] == files
+        assert f"/repos/bench/repo0/pulls/{number}/reviews" in post_routes
+        for f in files:
+            assert f"/repos/bench/repo0/contents/{f['filename']}" in routes
+            assert f["changes"] == f["additions"] + f["deletions"]
+    assert {d["path"] for d in routes["/repos/bench/repo0/contents/"]} == {"pkg0", "pkg1", "pkg2", "pkg3"}
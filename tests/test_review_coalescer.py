@@ -0,0 +1,60 @@
+import fakeredis
+import pytest
+
+from app.review_coalescer import ReviewCoalescer, ReviewSuperseded
+
+
+def test_newer_request_supersedes_older():
+    """Test that only the latest request for a PR stays current."""
+    coalescer = ReviewCoalescer(fakeredis.FakeRedis())
+    
+    first = coalescer.register("owner/repo", 1)
+    second = coalescer.register("owner/repo", 1)
+    
+    assert not coalescer.is_current("owner/repo", 1, first)
+    assert coalescer.is_current("owner/repo", 1, second)
+
+
+def test_prs_coalesced_independently():
+    """Test that requests for other PRs do not supersede each other."""
+    coalescer = ReviewCoalescer(fakeredis.FakeRedis())
+    
+    first = coalescer.register("owner/repo", 1)
+    coalescer.register("owner/repo", 2)
+    coalescer.register("owner/other", 1)
+    
+    assert coalescer.is_current("owner/repo", 1, first)
+
+
+def test_ensure_current_raises_for_stale_review():
+    """Test that an in-flight review learns it was superseded."""
+    coalescer = ReviewCoalescer(fakeredis.FakeRedis())
+    pr_data = {"repository": "owner/repo", "pr_number": 1}
+    
+    pr_data["review_generation"] = coalescer.register("owner/repo", 1)
+    coalescer.ensure_current(pr_data)
+    coalescer.register("owner/repo", 1)
+    
+    with pytest.raises(ReviewSuperseded):
+        coalescer.ensure_current(pr_data)
+    
+    # Reviews queued without a generation are never superseded
+    coalescer.ensure_current({"repository": "owner/repo", "pr_number": 1})
+
+
+def test_bulk_registration_leaves_pending_review_alone():
+    """Test that register_if_idle doesn't replace a pending review until it finishes."""
+    coalescer = ReviewCoalescer(fakeredis.FakeRedis())
+    live = coalescer.register("owner/repo", 1)
+    
+    assert coalescer.register_if_idle("owner/repo", 1) is None
+    assert coalescer.is_current("owner/repo", 1, live)
+    
+    # Only the pending review's own finish clears the marker
+    coalescer.finish({"repository": "owner/repo", "pr_number": 1, "review_generation": live - 1})
+    assert coalescer.register_if_idle("owner/repo", 1) is None
+    coalescer.finish({"repository": "owner/repo", "pr_number": 1, "review_generation": live})
+    
+    bulk = coalescer.register_if_idle("owner/repo", 1)
+    assert bulk == live + 1
+    assert coalescer.register_if_idle("owner/repo", 1) is None
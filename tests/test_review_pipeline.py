@@ -0,0 +1,195 @@
+import time
+from unittest.mock import MagicMock
+
+import fakeredis
+import pytest
+
+from app import tasks
+from app.admission import AdmissionController
+from app.celery_app import celery_app, max_countdown
+from app.rate_limit import RateLimitGovernor
+from app.review_coalescer import ReviewCoalescer
+
+
+class FakeLLMService:
+    """Reviews each file with one issue, failing for files named broken*."""
+    
+    async def generate_review(self, code_diff, file_path, context=None, user_memory=None, deadline=None):
+        if file_path.startswith("broken"):
+            raise RuntimeError("LLM unavailable")
+        return {
+            "overall_assessment": f"Looks fine: {file_path}",
+            "issues": [{"line": 1, "severity": "minor", "description": "nit"}],
+            "positive_notes": []
+        }
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Run the review chord eagerly against fake GitHub, LLM and Redis."""
+    redis_client = fakeredis.FakeRedis()
+    github_service = MagicMock()
+    github_service.get_pr_snapshot.return_value = {
+        "info": {"head_sha": "abc123", "author": "octocat"},
+        "files": [
+            {"filename": name, "patch": "@@ -1 +1 @@\n+x"}
+            for name in ("a.py", "b.py", "broken.py")
+        ],
+        "existing_comments": [{"path": "a.py", "line": 1, "body": "**MINOR**: nit\n\n"}]
+    }
+    github_service.get_pr_info.return_value = {"head_sha": "abc123", "author": "octocat"}
+    github_service.get_file_content.return_value = ""
+    
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    monkeypatch.setattr(tasks.settings, "enable_memory_persistence", False)
+    monkeypatch.setattr(tasks, "get_github_service", lambda installation_id, deadline=None: github_service)
+    monkeypatch.setattr(tasks, "get_llm_service", FakeLLMService)
+    monkeypatch.setattr(tasks, "get_rate_limit_governor", lambda: RateLimitGovernor(redis_client))
+    monkeypatch.setattr(tasks, "get_admission_controller", lambda: AdmissionController(redis_client))
+    coalescer = ReviewCoalescer(redis_client)
+    monkeypatch.setattr(tasks, "get_review_coalescer", lambda: coalescer)
+    return github_service, coalescer
+
+
+def test_files_reviewed_separately_and_posted_once(pipeline):
+    """Test that per-file results are combined into one deduplicated review."""
+    github_service, _ = pipeline
+    pr_data = {"pr_number": 1, "repository": "o/r", "repository_id": "o/r", "installation_id": 1}
+    
+    tasks.process_pr_review.apply(args=[pr_data])
+    
+    github_service.post_pr_review.assert_called_once()
+    posted = github_service.post_pr_review.call_args.kwargs
+    assert [c["path"] for c in posted["comments"]] == ["b.py"]
+    assert "Looks fine: a.py" in posted["body"]
+    assert "`broken.py`" in posted["body"]
+
+
+def test_superseded_review_not_posted(pipeline):
+    """Test that a newer request stops the pipeline before posting and frees its head."""
+    github_service, coalescer = pipeline
+    admission = AdmissionController(coalescer.redis)
+    pr_data = {
+        "pr_number": 1, "repository": "o/r", "repository_id": "o/r", "installation_id": 1,
+        "review_id": "r1", "head_sha": "abc123", "review_generation": coalescer.register("o/r", 1)
+    }
+    admission.admit(pr_data, queue="reviews")
+    coalescer.register("o/r", 1)
+    
+    result = tasks.process_pr_review.apply(args=[pr_data]).get()
+    
+    assert result["status"] == "superseded"
+    github_service.post_pr_review.assert_not_called()
+    assert admission.duplicate_of({**pr_data, "review_id": "r2"}) is None
+
+
+def test_triaged_files_skip_the_llm(pipeline, monkeypatch):
+    """Test that a lockfile is not reviewed and is listed in the summary."""
+    github_service, _ = pipeline
+    snapshot = github_service.get_pr_snapshot.return_value
+    snapshot["files"] = snapshot["files"][:1] + [
+        {"filename": "package-lock.json", "patch": "@@ -1 +1 @@\n-old\n+new"}
+    ]
+    reviewed = []
+    
+    class RecordingLLMService(FakeLLMService):
+        async def generate_review(self, code_diff, file_path, **kwargs):
+            reviewed.append(file_path)
+            return await super().generate_review(code_diff, file_path, **kwargs)
+    
+    monkeypatch.setattr(tasks, "get_llm_service", RecordingLLMService)
+    pr_data = {"pr_number": 1, "repository": "o/r", "repository_id": "o/r", "installation_id": 1}
+    
+    tasks.process_pr_review.apply(args=[pr_data])
+    
+    assert reviewed == ["a.py"]
+    body = github_service.post_pr_review.call_args.kwargs["body"]
+    assert "`package-lock.json`: matches `package-lock.json`" in body
+
+
+def test_skipped_files_leave_room_for_reviewable_ones(pipeline, monkeypatch):
+    """Test that lockfiles are left out before MAX_FILES_TO_REVIEW files are chosen."""
+    from types import SimpleNamespace
+    from app.github_service import GitHubService
+    
+    github_service, _ = pipeline
+    files = [
+        SimpleNamespace(
+            filename=name, status="modified", additions=1, deletions=0, changes=1,
+            patch="@@ -1 +1 @@\n-old\n+new", sha=name
+        )
+        for name in ("package-lock.json", "yarn.lock", "a.py", "b.py")
+    ]
+    
+    def get_pr_snapshot(repo_name, pr_number, max_files, skip):
+        snapshot = github_service.get_pr_snapshot.return_value
+        return {**snapshot, "files": GitHubService._format_files(files, max_files, skip)}
+    
+    github_service.get_pr_snapshot.side_effect = get_pr_snapshot
+    monkeypatch.setattr(tasks.settings, "max_files_to_review", 2)
+    pr_data = {"pr_number": 1, "repository": "o/r", "repository_id": "o/r", "installation_id": 1}
+    
+    tasks.process_pr_review.apply(args=[pr_data])
+    
+    posted = github_service.post_pr_review.call_args.kwargs
+    assert [c["path"] for c in posted["comments"]] == ["b.py"]
+    assert "Looks fine: a.py" in posted["body"]
+    assert "`package-lock.json`" in posted["body"] and "`yarn.lock`" in posted["body"]
+    github_service.get_file_content.assert_any_call("o/r", ".gitattributes", "abc123")
+
+
+def test_history_failure_does_not_repost(pipeline, monkeypatch):
+    """Test that the review is posted once even when storing its history fails."""
+    github_service, _ = pipeline
+    history = MagicMock()
+    history.apply_async.side_effect = RuntimeError("broker down")
+    monkeypatch.setattr(tasks, "store_review_history", history)
+    monkeypatch.setattr(tasks.settings, "enable_memory_persistence", True)
+    pr_data = {
+        "pr_number": 1, "repository": "o/r", "repository_id": "o/r", "installation_id": 1,
+        "head_sha": "abc123", "author": "octocat"
+    }
+    file_results = [{"file": "a.py", "review": {"overall_assessment": "ok"}, "comments": []}]
+    
+    result = tasks.finalize_pr_review.apply(args=[file_results, pr_data, []]).get()
+    
+    assert result["status"] == "success"
+    github_service.post_pr_review.assert_called_once()
+    assert history.apply_async.call_args.kwargs["args"][2] == 0
+
+
+def test_scheduled_review_waits_for_its_start(pipeline, monkeypatch):
+    """Test that a bulk review due after the longest countdown defers itself."""
+    github_service, _ = pipeline
+    requeue = MagicMock()
+    monkeypatch.setattr(tasks.process_pr_review, "apply_async", requeue)
+    pr_data = {
+        "pr_number": 1, "repository": "o/r", "repository_id": "o/r", "installation_id": 1,
+        "queue": "bulk", "start_after": time.time() + 5 * 3600
+    }
+    
+    result = tasks.process_pr_review.apply(args=[pr_data]).get()
+    
+    assert result["status"] == "deferred"
+    assert requeue.call_args.kwargs["countdown"] == max_countdown()
+    assert requeue.call_args.kwargs["task_id"] == result["task_id"]
+    github_service.get_pr_snapshot.assert_not_called()
+
+
+def test_failed_command_review_frees_its_slot(pipeline):
+    """Test that a /review command whose review keeps failing releases its slot and dedupe key."""
+    github_service, coalescer = pipeline
+    github_service.get_pr_snapshot.side_effect = RuntimeError("GitHub down")
+    admission = AdmissionController(coalescer.redis)
+    review_data = {
+        "pr_number": 1, "repository": "o/r", "repository_id": "o/r", "installation_id": 1,
+        "review_id": "r1", "head_sha": "abc123", "queue": "interactive"
+    }
+    admission.admit(review_data, queue="interactive")
+    
+    result = tasks.process_review_command.apply(args=[review_data]).get()
+    
+    assert result["status"] == "dispatched"
+    assert github_service.get_pr_snapshot.call_count == tasks.process_pr_review.max_retries + 1
+    assert admission.in_flight(1) == 0
+    assert admission.duplicate_of({**review_data, "review_id": "r2"}) is None
@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from app.diff_parser import DiffHunk, parse_patch
+from app.review_windows import (
+    build_windows,
+    hunk_line_numbers,
+    merge_window_reviews,
+    review_in_windows,
+    split_hunk,
+)
+
+
+def make_patch(hunks=3, lines=40, start=10):
+    """Hunks of mixed context/added/removed lines, 100 lines apart."""
+    parts = []
+    for h in range(hunks):
+        body = []
+        for i in range(lines):
+            body.append(("+", " ", "-")[i % 3] + f"    statement_{h}_{i} = compute({i})")
+        old_count = sum(1 for line in body if line[0] != "+")
+        new_count = sum(1 for line in body if line[0] != "-")
+        first = start + h * 100
+        parts.append(f"@@ -{first},{old_count} +{first},{new_count} @@\n" + "\n".join(body))
+    return "\n".join(parts)
+
+
+def new_lines_by_text(hunks):
+    """Map each added/context line's text to its new-file line number."""
+    return {
+        line[1:]: number
+        for hunk in hunks
+        for line, number in zip(hunk.lines, hunk_line_numbers(hunk))
+        if number is not None
+    }
+
+
+def test_split_hunk_keeps_file_line_numbers():
+    """Test that split hunks keep each line at its original position."""
+    hunk = parse_patch(make_patch(hunks=1, lines=90))[0]
+    pieces = split_hunk(hunk, max_chars=600, context=2)
+    
+    assert len(pieces) > 1
+    assert all(len("\n".join([p.header] + p.lines)) <= 600 + 2 * 40 for p in pieces)
+    assert new_lines_by_text(pieces) == new_lines_by_text([hunk])
+    # Pieces re-parse to the same header they were given
+    reparsed = parse_patch("\n".join("\n".join([p.header] + p.lines) for p in pieces))
+    assert [(h.new_start, h.new_count) for h in reparsed] == [(p.new_start, p.new_count) for p in pieces]
+
+
+def test_build_windows_respects_budget_and_covers_patch():
+    """Test that windows fit the token budget and together cover every hunk."""
+    patch = make_patch(hunks=6, lines=30)
+    windows = build_windows(patch, max_tokens=400, context=3)
+    
+    assert len(windows) > 1
+    assert all(len(w.patch) <= 400 * 4 for w in windows)
+    assert [w.index for w in windows] == list(range(len(windows)))
+    covered = {n for w in windows for n in w.line_numbers() if n is not None}
+    assert covered == {n for n in new_lines_by_text(parse_patch(patch)).values()}
+
+
+def test_small_patch_is_one_window():
+    windows = build_windows(make_patch(hunks=2, lines=5), max_tokens=1500)
+    
+    assert len(windows) == 1
+    assert windows[0].total == 1
+
+
+def test_map_line_validates_and_maps_relative_lines():
+    """Test that issue lines are kept, mapped from window rows, or dropped."""
+    hunk = DiffHunk(500, 3, 500, 3, "@@ -500,3 +500,3 @@", [" a", "-b", "+c", " d"])
+    window = build_windows("\n".join([hunk.header] + hunk.lines), max_tokens=100)[0]
+    
+    assert window.map_line(501) == 501  # the added line
+    assert window.map_line(3) == 501  # third row of the window
+    assert window.map_line(2) is None  # a removed line
+    assert window.map_line(900) is None
+    assert window.map_line(None) is None
+
+
+def test_merge_window_reviews_dedupes_overlap():
+    """Test that an issue reported by two overlapping windows is kept once."""
+    windows = build_windows(make_patch(hunks=1, lines=90), max_tokens=150, context=3)
+    line = windows[0].line_numbers()[-1]
+    issue = {"line": line, "severity": "minor", "description": "Unused value", "suggestion": "Drop it"}
+    reviews = [
+        {"overall_assessment": f"Part {w.index}", "issues": [issue], "positive_notes": ["Clear names"]}
+        for w in windows
+    ]
+    
+    merged = merge_window_reviews(windows, reviews)
+    
+    assert merged["windows"] == len(windows)
+    assert merged["positive_notes"] == ["Clear names"]
+    assert [i["line"] for i in merged["issues"]].count(line) == 1
+    assert merged["overall_assessment"].count("Part") == len(windows)
+
+
+class RecordingLLMService:
+    def __init__(self, failing=()):
+        self.requests = []
+        self.failing = failing
+    
+    async def generate_reviews(self, requests, concurrency=4, deadline=None, return_exceptions=False):
+        self.requests = requests
+        return [
+            TimeoutError("timed out") if i in self.failing
+            else {"overall_assessment": "ok", "issues": [{"line": 1, "severity": "minor", "description": "x"}]}
+            for i in range(len(requests))
+        ]
+
+
+def test_review_in_windows_sends_every_window(monkeypatch):
+    """Test that each window is sent with a note on its place in the file."""
+    from app import review_windows
+    monkeypatch.setattr(review_windows.settings, "review_window_tokens", 400)
+    llm = RecordingLLMService()
+    
+    review = asyncio.run(review_in_windows(llm, "big.py", make_patch(hunks=4, lines=30), context="rag"))
+    
+    assert len(llm.requests) == review["windows"] > 1
+    assert all("of a large diff to big.py" in r["context"] and r["context"].endswith("rag") for r in llm.requests)
+    # Line 1 is read as the first row of windows that start past their row
+    # count; in the first window (lines 10-39) it is ambiguous and dropped
+    assert [issue["line"] for issue in review["issues"]] == [None, 110, 210, 310]
+
+
+def test_review_in_windows_keeps_windows_reviewed_in_time(monkeypatch):
+    """Test that a timed-out window is noted without losing the others."""
+    from app import review_windows
+    monkeypatch.setattr(review_windows.settings, "review_window_tokens", 400)
+    
+    review = asyncio.run(review_in_windows(RecordingLLMService(failing={1}), "big.py", make_patch(hunks=4, lines=30)))
+    
+    assert review["unreviewed_windows"] == 1
+    assert len(review["issues"]) == review["windows"] - 1
+    assert "not reviewed (TimeoutError)" in review["overall_assessment"]
+    
+    with pytest.raises(TimeoutError):
+        asyncio.run(review_in_windows(RecordingLLMService(failing={0}), "small.py", make_patch(hunks=1, lines=5)))
@@ -0,0 +1,43 @@
+from app.celery_app import celery_app
+from app import task_signatures
+from benchmarks.import_time import HEAVY_MODULES, measure, parse_importtime
+
+SIGNATURES = [
+    task_signatures.process_pr_review,
+    task_signatures.process_review_command,
+    task_signatures.ingest_feedback_batch,
+]
+
+
+def test_signatures_name_registered_tasks():
+    """Test that every signature names a task the workers register."""
+    import app.tasks  # noqa: F401
+    
+    for signature in SIGNATURES:
+        assert signature.task in celery_app.tasks
+
+
+def test_signatures_routed_like_tasks():
+    """Test that sending by name uses the task's queue and priority."""
+    route = celery_app.amqp.router.route({}, task_signatures.process_review_command.task, (), {})
+    
+    assert route["queue"].name == "interactive"
+    assert route["priority"] == 0
+
+
+def test_api_does_not_import_worker_dependencies():
+    """Test that importing the API leaves the ML and LLM stacks unloaded."""
+    stats, imports = measure("app.main")
+    
+    assert stats["heavy"] == []
+    assert not set(HEAVY_MODULES) & {name for name, _ in imports}
+
+
+def test_parse_importtime():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   _io\n"
+        "import time:      3000 |      45000 | fastapi\n"
+    )
+    
+    assert parse_importtime(stderr) == [("_io", 120), ("fastapi", 45000)]
@@ -0,0 +1,125 @@
+from unittest.mock import MagicMock
+
+from app.triage import (
+    LOW_PRIORITY,
+    REVIEW,
+    SKIP,
+    TriageRules,
+    glob_to_regex,
+    load_triage_rules,
+    triage_file,
+    triage_files,
+)
+
+
+def changed(filename, patch="@@ -1 +1 @@\n-a = 1\n+a = 2", status="modified"):
+    return {"filename": filename, "patch": patch, "status": status}
+
+
+def test_glob_patterns():
+    """Test gitignore-style matching of base names, anchored paths and **."""
+    assert glob_to_regex("*.min.js").match("static/js/app.min.js")
+    assert glob_to_regex("vendor/**").match("vendor/lib/x.go")
+    assert not glob_to_regex("vendor/**").match("src/vendor/x.go")
+    assert glob_to_regex("**/generated/*.py").match("generated/a.py")
+    assert glob_to_regex("docs/").match("docs/guide/index.md")
+    assert not glob_to_regex("src/*.py").match("src/pkg/a.py")
+
+
+def test_dependency_bump_skips_lockfiles():
+    """Test that a typical dependency bump only sends the manifest to the LLM."""
+    files = [
+        changed("package.json"),
+        changed("package-lock.json"),
+        changed("yarn.lock"),
+        changed("services/api/poetry.lock"),
+    ]
+    
+    to_review, decisions = triage_files(files, TriageRules())
+    
+    assert [f["filename"] for f in to_review] == ["package.json"]
+    assert [d.action for d in decisions] == [REVIEW, SKIP, SKIP, SKIP]
+
+
+def test_content_heuristics():
+    """Test generated markers, minified assets, whitespace and rename-only changes."""
+    rules = TriageRules()
+    generated = "@@ -0,0 +1,2 @@\n+// Code generated by protoc-gen-go. DO NOT EDIT.\n+package api"
+    documented = "@@ -0,0 +1,2 @@\n+class User(Model):\n+    id = Column()  # primary key is auto-generated by the DB"
+    minified = "@@ -0,0 +1 @@\n+" + "var a=1;" * 200
+    whitespace = "@@ -1,2 +1,2 @@\n-def f():\n-  return 1\n+def f():\n+    return 1"
+    reordered = "@@ -1,3 +1,3 @@\n def f(x):\n-    x += 1\n     return x\n+    x += 1"
+    
+    assert triage_file(changed("api/service.go", generated, status="added"), rules).reason == "generated file"
+    assert triage_file(changed("app/models.py", documented, status="added"), rules).action == REVIEW
+    assert triage_file(changed("static/bundle.js", minified), rules).reason == "minified"
+    assert triage_file(changed("app/f.py", whitespace), rules).reason == "whitespace-only changes"
+    assert triage_file(changed("app/f.py", reordered), rules).action == REVIEW
+    assert triage_file(changed("app/new.py", None, status="renamed"), rules).reason == "renamed without changes"
+    assert triage_file(changed("app/f.py"), rules).action == REVIEW
+
+
+def test_gitattributes_linguist_hints():
+    """Test that linguist attributes skip or down-rank files, last match winning."""
+    rules = TriageRules.from_files(gitattributes=(
+        "# linguist overrides\n"
+        "api/*.ts linguist-generated\n"
+        "api/client.ts -linguist-generated\n"
+        "third/** linguist-vendored=true\n"
+        "guides/** linguist-documentation\n"
+    ))
+    
+    assert triage_file(changed("api/types.ts"), rules).action == SKIP
+    assert triage_file(changed("api/client.ts"), rules).action == REVIEW
+    assert triage_file(changed("third/lib.c"), rules).reason == "linguist-vendored in .gitattributes"
+    assert triage_file(changed("guides/setup.py"), rules).action == LOW_PRIORITY
+
+
+def test_repository_rule_file():
+    """Test that per-repo rules skip, down-rank and force reviews."""
+    rules = TriageRules.from_files(rule_file=(
+        "review:\n"
+        "  - package-lock.json\n"
+        "skip:\n"
+        "  - 'migrations/**'\n"
+        "low_priority:\n"
+        "  - 'scripts/*.sh'\n"
+    ))
+    
+    assert triage_file(changed("package-lock.json"), rules).action == REVIEW
+    assert triage_file(changed("migrations/0042_auto.py"), rules).reason == "matches skip rule `migrations/**`"
+    assert triage_file(changed("scripts/deploy.sh"), rules).action == LOW_PRIORITY
+
+
+def test_invalid_rule_file_is_ignored():
+    rules = TriageRules.from_files(rule_file="skip: [unclosed")
+    
+    assert rules.skip == []
+
+
+def test_rules_cached_per_commit_unless_unreadable():
+    """Test that absent rule files are looked up once per commit, and read errors retried."""
+    github_service = MagicMock()
+    github_service.get_file_content.return_value = None
+    load_triage_rules(github_service, "o/absent", "sha1")
+    load_triage_rules(github_service, "o/absent", "sha1")
+    assert github_service.get_file_content.call_count == 2
+    
+    load_triage_rules(github_service, "o/absent", "sha2")
+    assert github_service.get_file_content.call_count == 4
+    
+    github_service.get_file_content.return_value = ""
+    load_triage_rules(github_service, "o/unreadable", "sha1")
+    load_triage_rules(github_service, "o/unreadable", "sha1")
+    assert github_service.get_file_content.call_count == 8
+
+
+def test_low_priority_files_reviewed_last_and_capped():
+    """Test that low-priority files go after the rest, up to the limit."""
+    files = [changed("README.md"), changed("docs/a.md"), changed("docs/b.md"), changed("app/main.py")]
+    
+    to_review, decisions = triage_files(files, TriageRules(), max_low_priority=1)
+    
+    assert [f["filename"] for f in to_review] == ["app/main.py", "README.md"]
+    assert [d.action for d in decisions] == [LOW_PRIORITY, SKIP, SKIP, REVIEW]
+    assert decisions[1].reason.endswith("over the low-priority limit")